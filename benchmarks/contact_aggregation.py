@@ -0,0 +1,112 @@
+""" Benchmark the contact item aggregation of the report on synthetic contact data
+
+run from the repository root:
+    pipenv run python -m benchmarks.contact_aggregation --rows 10000 100000 1000000
+"""
+import argparse
+import random
+import time
+
+import numpy as np
+import pandas as pd
+
+from mondu_website_scrapper.report import CreateReportDataSet
+from mondu_website_scrapper.utils import normalize_phone_format
+
+PHONES = ["+49 (30) 123-456", "+43 1 234 56", "4930 999", "0049/89-1234", "+43 662 80"]
+
+
+def synthetic_contact_data(rows: int, seed: int = 1) -> pd.DataFrame:
+    """
+    contact rows as read by the report, about 1.5 rows per company with up to two
+    comma joined phones and emails, missing when nothing was found
+
+    Returns: a dataframe
+    """
+    rng = random.Random(seed)
+    companies = max(rows * 2 // 3, 1)
+    records = []
+    for _ in range(rows):
+        company = rng.randrange(companies)
+        phones = rng.sample(PHONES, rng.randint(0, 2))
+        emails = rng.sample(
+            [f"info@c{company}.de", f"sales@c{company}.de"], rng.randint(0, 2)
+        )
+        records.append(
+            {
+                "company_url": f"https://company{company}.example/",
+                "phone": ",".join(phones) if phones else np.nan,
+                "contact_information_url": f"https://company{company}.example/kontakt",
+                "email": ",".join(emails) if emails else np.nan,
+            }
+        )
+    return pd.DataFrame(records)
+
+
+def legacy_contact_aggregation(data: pd.DataFrame) -> pd.DataFrame:
+    """
+    the row wise contact aggregation the report used before, kept as reference
+
+    Returns: engineered dataframe
+    """
+    data.loc[:, "phone"] = data["phone"].apply(
+        lambda x: normalize_phone_format(x, country_code=["43", "49"])
+    )
+    for col in [i for i in data.columns if i != "company_url"]:
+        data.replace(np.nan, "nan", inplace=True)
+        data[col] = data.groupby("company_url")[col].transform(lambda x: ",".join(x))
+    data_drop = data.drop_duplicates()
+    for col in data_drop.columns:
+        data_drop.loc[:, col] = data_drop[col].apply(
+            lambda x: ";".join([x for x in x.split(",") if x != "nan"])
+        )
+    return data_drop.set_index("company_url")
+
+
+def timed(function, data: pd.DataFrame) -> tuple[float, pd.DataFrame]:
+    """
+    Returns: the seconds the function took on a copy of the data, and its result
+    """
+    data = data.copy()
+    start = time.perf_counter()
+    result = function(data)
+    return time.perf_counter() - start, result
+
+
+def main(rows: list[int], legacy_max_rows: int) -> None:
+    """
+    time the contact aggregation for each number of rows, and compare it with the
+    legacy aggregation up to legacy_max_rows rows
+    """
+    report = CreateReportDataSet()
+    print(f"{'rows':>10} {'vectorised s':>13} {'legacy s':>10} {'identical':>10}")
+    for n in rows:
+        data = synthetic_contact_data(n)
+        seconds, result = timed(
+            report._eng_contact_information_item, data  # pylint: disable=W0212
+        )
+        legacy_seconds, identical = "-", "-"
+        if n <= legacy_max_rows:
+            legacy_seconds, legacy_result = timed(legacy_contact_aggregation, data)
+            identical = result.astype(str).equals(legacy_result.astype(str))
+            legacy_seconds = f"{legacy_seconds:.2f}"
+        print(f"{n:>10} {seconds:>13.2f} {legacy_seconds:>10} {str(identical):>10}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--rows",
+        help="numbers of contact rows to benchmark",
+        nargs="+",
+        type=int,
+        default=[10_000, 100_000, 1_000_000],
+    )
+    parser.add_argument(
+        "--legacy-max-rows",
+        help="only run the slow legacy aggregation up to this number of rows",
+        type=int,
+        default=100_000,
+    )
+    args = parser.parse_args()
+    main(args.rows, args.legacy_max_rows)
@@ -0,0 +1,470 @@
+""" Benchmark the LeadSpider extractors on a recorded corpus of pages, and the report
+builder on synthetic item files, without any network
+
+record a corpus from the http cache of earlier crawls, then replay it from the
+repository root:
+    pipenv run python -m benchmarks.extraction record \
+        --cache ../httpcache/findingnemo.sqlite --corpus ../benchmark_corpus
+    pipenv run python -m benchmarks.extraction run \
+        --corpus ../benchmark_corpus --output ../benchmark_results.json
+
+the results are written as json, pass the results of an earlier run as --baseline
+to compare them, the run fails when an extractor got slower than the tolerance
+"""
+import argparse
+import json
+import logging
+import platform
+import random
+import re
+import resource
+import sqlite3
+import sys
+import tempfile
+import time
+import zlib
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Optional
+
+import numpy as np
+import scrapy
+from scrapy.http import Headers
+from scrapy.responsetypes import responsetypes
+from twisted.internet import defer
+from twisted.python.failure import Failure
+from w3lib.http import headers_raw_to_dict
+
+from mondu_website_scrapper.items import ContactItem, GeneralInformationItem, PriceItem
+from mondu_website_scrapper.pipelines import MonduWebsiteScrapperPipeline
+from mondu_website_scrapper.report import CreateReportDataSet
+from mondu_website_scrapper.settings import CONTACT_LINK_PATTERN, PRODUCT_LINK_PATTERN
+from mondu_website_scrapper.spiders.catch_fish_scraper import LeadSpider
+from mondu_website_scrapper.wappalyzer_analysis import (
+    analyze_webpage,
+    response_headers_to_dict,
+)
+
+MANIFEST_FILE = "manifest.json"
+# extractors timed on each page type, the first one is the spider callback
+EXTRACTORS = {
+    "landing": [
+        "parse",
+        "link_classifier",
+        "extract_payments",
+        "extract_page_keywords",
+        "wappalyzer",
+    ],
+    "product": ["extract_price_info"],
+    "contact": ["extract_contact_information"],
+}
+TECHNOLOGIES = [
+    ("Shopify", ["Ecommerce"]),
+    ("Nginx", ["Web servers", "Reverse proxies"]),
+    ("jQuery", ["JavaScript libraries"]),
+    ("WooCommerce", ["Ecommerce", "WordPress plugins"]),
+]
+
+
+def page_type_of(url: str) -> str:
+    """
+    guess the page type of a recorded url from the link patterns of the settings
+
+    Returns: contact, product or landing
+    """
+    if re.search(CONTACT_LINK_PATTERN, url):
+        return "contact"
+    if re.search(PRODUCT_LINK_PATTERN, url):
+        return "product"
+    return "landing"
+
+
+def record_corpus(cache_file: Path, corpus_folder: Path, max_pages: int) -> None:
+    """
+    copy the html responses of a sqlite http cache into a corpus folder, one body
+    file per page and a manifest with url, status, headers and page type
+    """
+    corpus_folder.mkdir(parents=True, exist_ok=True)
+    db = sqlite3.connect(cache_file)
+    manifest = []
+    for response_url, status, raw_headers, body in db.execute(
+        "SELECT response_url, status, headers, body FROM responses ORDER BY url"
+    ):
+        if len(manifest) >= max_pages:
+            break
+        headers = Headers(headers_raw_to_dict(raw_headers))
+        if b"html" not in (headers.get("Content-Type") or b"text/html"):
+            continue
+        file_name = f"{len(manifest):06d}.html"
+        (corpus_folder / file_name).write_bytes(zlib.decompress(body))
+        manifest.append(
+            {
+                "file": file_name,
+                "url": response_url,
+                "status": status,
+                "headers": dict(headers.to_unicode_dict()),
+                "page_type": page_type_of(response_url),
+            }
+        )
+    db.close()
+    (corpus_folder / MANIFEST_FILE).write_text(json.dumps(manifest, indent=2))
+    print(f"recorded {len(manifest)} pages into {corpus_folder}")
+
+
+def load_corpus(corpus_folder: Path) -> list[dict]:
+    """
+    Returns: the manifest entries of the corpus with the body of every page
+    """
+    pages = json.loads((corpus_folder / MANIFEST_FILE).read_text())
+    for page in pages:
+        page["body"] = (corpus_folder / page["file"]).read_bytes()
+    return pages
+
+
+def make_response(page: dict) -> scrapy.http.Response:
+    """
+    a fresh response of a recorded page, so no extractor reuses the decoded text
+    of another one. follow up pages carry the meta of follow up requests
+
+    Returns: a response
+    """
+    meta = {}
+    if page["page_type"] != "landing":
+        meta = {"page_type": page["page_type"], "follow_up_url": page["url"]}
+    headers = Headers(page["headers"])
+    response_cls = responsetypes.from_args(
+        headers=headers, url=page["url"], body=page["body"]
+    )
+    return response_cls(
+        url=page["url"],
+        status=page["status"],
+        headers=headers,
+        body=page["body"],
+        request=scrapy.Request(page["url"], meta=meta),
+    )
+
+
+async def time_extractor(spider: LeadSpider, name: str, page: dict) -> float:
+    """
+    Returns: the seconds one extractor took on a page, always extracted as the
+    results of pages seen before are dropped
+    """
+    spider.content_cache.clear()
+    response = make_response(page)
+    started = time.perf_counter()
+    if name == "parse":
+        await spider.parse(response)
+    elif name == "link_classifier":
+        spider.link_classifier.classify(response)
+    elif name == "wappalyzer":
+        analyze_webpage(
+            response.url, response.text, response_headers_to_dict(response.headers)
+        )
+    elif name in ("extract_price_info", "extract_contact_information"):
+        list(getattr(spider, name)(response, company_url=page["url"]))
+    else:
+        getattr(spider, name)(response)
+    return time.perf_counter() - started
+
+
+def latency_summary(seconds: list[float]) -> dict:
+    """
+    Returns: count, mean and percentiles of latencies in milliseconds
+    """
+    milliseconds = np.array(seconds) * 1000
+    return {
+        "count": len(seconds),
+        "mean_ms": round(float(milliseconds.mean()), 3),
+        **{
+            f"p{percentile}_ms": round(
+                float(np.percentile(milliseconds, percentile)), 3
+            )
+            for percentile in (50, 90, 99)
+        },
+        "max_ms": round(float(milliseconds.max()), 3),
+    }
+
+
+async def benchmark_extraction(pages: list[dict], rounds: int) -> dict:
+    """
+    replay all pages through their extractors for a number of rounds, after one
+    warm up page per page type that also loads the wappalyzer fingerprints
+
+    Returns: pages per second of the spider callbacks and latencies per extractor
+    """
+    spider = LeadSpider(use_gsheet=False, external_urls=[])
+    try:
+        warmed_up = set()
+        for page in pages:
+            if page["page_type"] not in warmed_up:
+                warmed_up.add(page["page_type"])
+                for name in EXTRACTORS[page["page_type"]]:
+                    await time_extractor(spider, name, page)
+
+        latencies = {
+            name: [] for page_type in EXTRACTORS.values() for name in page_type
+        }
+        callback_seconds = 0.0
+        for _ in range(rounds):
+            for page in pages:
+                for index, name in enumerate(EXTRACTORS[page["page_type"]]):
+                    seconds = await time_extractor(spider, name, page)
+                    latencies[name].append(seconds)
+                    if index == 0:
+                        callback_seconds += seconds
+    finally:
+        spider.wappalyzer_analyzer.close()
+    return {
+        "pages_per_second": round(len(pages) * rounds / callback_seconds, 2)
+        if callback_seconds
+        else None,
+        "extractors": {
+            name: latency_summary(seconds)
+            for name, seconds in latencies.items()
+            if seconds
+        },
+    }
+
+
+def synthetic_items(companies: int, folder: Path, seed: int = 1) -> None:
+    """
+    write item files and company aggregates of synthetic companies through the
+    item pipeline, with up to four price and three contact items per company
+    """
+    rng = random.Random(seed)
+    pipeline = MonduWebsiteScrapperPipeline(folder, checkpoint_secs=sys.maxsize)
+    pipeline.open_spider(None)
+    for company in range(companies):
+        url = f"https://company{company}.example/"
+        pipeline.process_item(
+            GeneralInformationItem(
+                company_url=url,
+                status=200,
+                languages=rng.choice(["de", "en", None]),
+                tagged_by_b2b_words=rng.sample(["b2b", "wholesale"], rng.randint(0, 2)),
+                payments=rng.sample(["visa", "paypal", "klarna"], rng.randint(0, 2)),
+                webshop_urls=[f"{url}shop"] * rng.randint(0, 1),
+                webshop_system=rng.sample(["shopware", "magento"], rng.randint(0, 2)),
+                wappalyzer={
+                    name: {"categories": categories}
+                    for name, categories in rng.sample(TECHNOLOGIES, rng.randint(0, 3))
+                },
+                social_media=[f"https://facebook.com/c{company}"] * rng.randint(0, 1),
+            ),
+            None,
+        )
+        for _ in range(rng.randint(0, 4)):
+            pipeline.process_item(
+                PriceItem(
+                    company_url=url,
+                    products_quantity=rng.randint(1, 30),
+                    products_avg_price=round(rng.uniform(1, 500), 2),
+                    currency=rng.choice(["€", "$"]),
+                ),
+                None,
+            )
+        for page in range(rng.randint(0, 3)):
+            pipeline.process_item(
+                ContactItem(
+                    company_url=url,
+                    contact_information_url=f"{url}kontakt{page}",
+                    phone=rng.sample(["+49 (30) 123-456", "+43 1 234 56"], 1),
+                    email=rng.sample(
+                        [f"info@c{company}.de", f"sales@c{company}.de"], 1
+                    ),
+                ),
+                None,
+            )
+    pipeline.close_spider(None)
+
+
+def benchmark_report(companies: list[int]) -> list[dict]:
+    """
+    build the report from synthetic item files and from their company aggregates
+    for each number of companies, without writing the report
+
+    Returns: seconds and report shape per number of companies and source
+    """
+    report = CreateReportDataSet()
+    results = []
+    for count in companies:
+        with tempfile.TemporaryDirectory() as folder:
+            folder = Path(folder)
+            synthetic_items(count, folder)
+            for source, source_folder in (
+                ("items", folder),
+                ("aggregates", folder / "company_aggregates"),
+            ):
+                started = time.perf_counter()
+                # pylint: disable=W0212
+                report_df = report._join_item_data(
+                    report._load_item_data(source_folder)
+                )
+                results.append(
+                    {
+                        "companies": count,
+                        "source": source,
+                        "seconds": round(time.perf_counter() - started, 3),
+                        "rows": report_df.shape[0],
+                        "columns": report_df.shape[1],
+                    }
+                )
+    return results
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> bool:
+    """
+    print the change of the median latency of every extractor, the pages per
+    second and the report seconds against a baseline run
+
+    Returns: True if nothing got slower than the tolerance
+    """
+    ok = True
+    print(f"{'benchmark':<45} {'baseline':>10} {'current':>10} {'change':>8}")
+
+    def row(
+        name: str,
+        before: Optional[float],
+        after: Optional[float],
+        lower_is_better: bool,
+    ):
+        nonlocal ok
+        if not before or after is None:
+            return
+        change = after / before - 1
+        slower = change > tolerance if lower_is_better else change < -tolerance
+        ok &= not slower
+        flag = " slower" if slower else ""
+        print(f"{name:<45} {before:>10.3f} {after:>10.3f} {change:>+8.1%}{flag}")
+
+    row(
+        "pages_per_second",
+        baseline["extraction"]["pages_per_second"],
+        results["extraction"]["pages_per_second"],
+        lower_is_better=False,
+    )
+    for name, latency in results["extraction"]["extractors"].items():
+        before = baseline["extraction"]["extractors"].get(name, {}).get("p50_ms")
+        row(f"{name} p50 ms", before, latency["p50_ms"], lower_is_better=True)
+    baseline_report = {
+        (run["companies"], run["source"]): run["seconds"] for run in baseline["report"]
+    }
+    for run in results["report"]:
+        before = baseline_report.get((run["companies"], run["source"]))
+        row(
+            f"report {run['source']} {run['companies']} companies s",
+            before,
+            run["seconds"],
+            lower_is_better=True,
+        )
+    return ok
+
+
+def run_in_reactor(coroutine) -> Any:
+    """
+    run a coroutine awaiting twisted deferreds, such as LeadSpider.parse, in the
+    reactor until it is done
+
+    Returns: the result of the coroutine
+    """
+    from twisted.internet import reactor  # pylint: disable=import-outside-toplevel
+
+    outcome = []
+
+    def _done(result) -> None:
+        outcome.append(result)
+        reactor.stop()
+
+    reactor.callWhenRunning(lambda: defer.ensureDeferred(coroutine).addBoth(_done))
+    reactor.run(installSignalHandlers=False)
+    if isinstance(outcome[0], Failure):
+        outcome[0].raiseException()
+    return outcome[0]
+
+
+def run(args: argparse.Namespace) -> int:
+    """
+    run the extraction and report benchmarks and write their results as json
+
+    Returns: the exit code, 1 if the run got slower than the baseline
+    """
+    pages = load_corpus(args.corpus)
+    results = {
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "corpus": {
+            "folder": str(args.corpus),
+            "pages": {
+                page_type: sum(page["page_type"] == page_type for page in pages)
+                for page_type in EXTRACTORS
+            },
+        },
+        "rounds": args.rounds,
+        "extraction": run_in_reactor(benchmark_extraction(pages, args.rounds)),
+    }
+    results["extraction_peak_rss_mb"] = peak_rss_mb()
+    results["report"] = benchmark_report(args.report_companies)
+    results["peak_rss_mb"] = peak_rss_mb()
+    args.output.write_text(json.dumps(results, indent=2))
+    print(json.dumps(results, indent=2))
+    if args.baseline is not None:
+        baseline = json.loads(args.baseline.read_text())
+        return 0 if compare(results, baseline, args.tolerance) else 1
+    return 0
+
+
+def peak_rss_mb() -> float:
+    """
+    Returns: the peak resident memory of the process so far in megabytes
+    """
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+if __name__ == "__main__":
+    logging.getLogger("scrapy").setLevel(logging.WARNING)
+    parser = argparse.ArgumentParser()
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    record_parser = commands.add_parser(
+        "record", help="record a corpus from a sqlite http cache"
+    )
+    record_parser.add_argument("--cache", help="sqlite http cache file", type=Path)
+    record_parser.add_argument("--corpus", help="corpus folder to write", type=Path)
+    record_parser.add_argument(
+        "--max-pages", help="number of pages to record", type=int, default=1000
+    )
+
+    run_parser = commands.add_parser("run", help="replay a corpus and time it")
+    run_parser.add_argument("--corpus", help="recorded corpus folder", type=Path)
+    run_parser.add_argument(
+        "--output",
+        help="json file to write the results to",
+        type=Path,
+        default=Path("benchmark_results.json"),
+    )
+    run_parser.add_argument(
+        "--rounds", help="times every page is replayed", type=int, default=3
+    )
+    run_parser.add_argument(
+        "--report-companies",
+        help="numbers of synthetic companies to build the report for",
+        nargs="*",
+        type=int,
+        default=[1_000, 20_000],
+    )
+    run_parser.add_argument(
+        "--baseline", help="results of an earlier run to compare with", type=Path
+    )
+    run_parser.add_argument(
+        "--tolerance",
+        help="relative slow down against the baseline that fails the run",
+        type=float,
+        default=0.2,
+    )
+
+    args = parser.parse_args()
+    if args.command == "record":
+        record_corpus(args.cache, args.corpus, args.max_pages)
+    else:
+        sys.exit(run(args))
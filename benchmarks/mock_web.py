@@ -0,0 +1,396 @@
+""" A local farm of synthetic shops to measure the throughput of full LeadSpider crawls
+
+serve the farm, e.g. to point a crawl at it by hand:
+    pipenv run python -m benchmarks.mock_web serve --shops 200 --port 8800
+crawl the farm once per combination of concurrency settings, and write the
+throughput of every crawl as json:
+    pipenv run python -m benchmarks.mock_web crawl --shops 200 \
+        --concurrent-requests 16 32 64 --concurrent-requests-per-domain 4 8
+
+every shop is served on its own loopback address 127.1.x.y, so scrapy sees one
+domain per shop and per domain limits apply as they do on the web. loopback
+addresses other than 127.0.0.1 are available on linux.
+"""
+import argparse
+import json
+import random
+import socket
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass
+from functools import lru_cache
+from itertools import product
+from multiprocessing import get_context
+from pathlib import Path
+from typing import Optional
+
+from twisted.web import resource, server
+
+PAYMENTS = ["visa", "mastercard", "paypal", "klarna", "sofort"]
+B2B_WORDS = ["b2b", "geschäftskunden", "wholesale", "reseller", "großhandel"]
+SOCIAL_MEDIA = ["facebook", "linkedin", "instagram", "xing"]
+GENERATORS = ["WordPress 6.0", "Shopware 6", "Magento 2"]
+
+
+@dataclass
+class ShopFarmConfig:
+    """
+    shape of the synthetic shops.
+    every shop has a landing page linking to fan_out of its product_pages product
+    pages, a kontakt and an impressum page and its social media profiles.
+    responses take latency seconds, varied by latency_jitter in both directions,
+    error_rate of the responses are 503 errors. pages are padded to page_bytes,
+    structured_price_rate of the shops show prices as JSON-LD offers, the others
+    as text only. slow_shop_rate of the shops are tarpits answering after
+    slow_shop_latency seconds instead.
+    """
+
+    shops: int = 100
+    product_pages: int = 20
+    fan_out: int = 10
+    latency: float = 0.05
+    latency_jitter: float = 0.5
+    error_rate: float = 0.02
+    page_bytes: int = 30_000
+    structured_price_rate: float = 0.5
+    slow_shop_rate: float = 0.0
+    slow_shop_latency: float = 5.0
+    port: int = 8800
+    seed: int = 1
+
+
+def shop_host(index: int) -> str:
+    """
+    Returns: the loopback address shop number index is served on
+    """
+    return f"127.1.{index // 250}.{index % 250 + 1}"
+
+
+def shop_urls(config: ShopFarmConfig) -> list[str]:
+    """
+    Returns: the landing page url of every shop
+    """
+    return [
+        f"http://{shop_host(index)}:{config.port}/" for index in range(config.shops)
+    ]
+
+
+class ShopFarm(resource.Resource):
+    """
+    serve the pages of all shops, the shop is told by the address a request came
+    in on. every response is delayed in the reactor, so slow shops cost no threads
+    """
+
+    isLeaf = True
+
+    def __init__(self, config: ShopFarmConfig):
+        super().__init__()
+        self.config = config
+        self.shops = {shop_host(index): index for index in range(config.shops)}
+        slow_rng = random.Random(f"{config.seed}:slow")
+        self.slow_shops = {
+            host for host in self.shops if slow_rng.random() < config.slow_shop_rate
+        }
+        # errors are transient, a retried page may succeed
+        self.error_rng = random.Random(config.seed)
+
+    def render_GET(self, request):  # pylint: disable=invalid-name
+        """
+        answer a request after the latency of its page
+
+        Returns: NOT_DONE_YET, the response is written later
+        """
+        host = request.getHost().host
+        path = request.path.decode()
+        # the same page gets the same latency in every run
+        rng = random.Random(f"{self.config.seed}:{host}:{path}")
+        latency = (
+            self.config.slow_shop_latency
+            if host in self.slow_shops
+            else self.config.latency
+        )
+        delay = latency * rng.uniform(
+            1 - self.config.latency_jitter, 1 + self.config.latency_jitter
+        )
+        if self.error_rng.random() < self.config.error_rate:
+            status, body = 503, b"<html><body>busy</body></html>"
+        else:
+            status, body = self.page(self.shops.get(host), path)
+
+        from twisted.internet import reactor  # pylint: disable=import-outside-toplevel
+
+        def _respond() -> None:
+            request.setResponseCode(status)
+            request.setHeader(b"content-type", b"text/html; charset=utf-8")
+            request.write(body)
+            request.finish()
+
+        call = reactor.callLater(delay, _respond)
+        request.notifyFinish().addErrback(lambda _: call.active() and call.cancel())
+        return server.NOT_DONE_YET
+
+    @lru_cache(maxsize=4096)
+    def page(self, shop: int, path: str) -> tuple[int, bytes]:
+        """
+        Returns: status and html body of a page of a shop
+        """
+        if shop is None:
+            return 404, b""
+        rng = random.Random(f"{self.config.seed}:{shop}:{path}")
+        if path == "/":
+            body = self._landing_page(shop, rng)
+        elif path in ("/kontakt", "/impressum"):
+            body = self._contact_page(shop, rng)
+        elif path.startswith("/products/") and path[10:].isdigit():
+            if int(path[10:]) >= self.config.product_pages:
+                return 404, b""
+            body = self._product_page(shop, rng)
+        else:
+            return 404, b""
+        return 200, self._html(shop, body, rng).encode()
+
+    def _html(self, shop: int, body: str, rng: random.Random) -> str:
+        head = (
+            f"<head><title>Shop {shop}</title>"
+            f"<meta name='generator' content='{rng.choice(GENERATORS)}'>"
+            "<script src='/static/jquery.min.js'></script>"
+            "<style>.price{font-weight:bold}</style></head>"
+        )
+        html = f"<html lang='{rng.choice(['de', 'en'])}'>{head}<body>{body}"
+        padding = max(self.config.page_bytes - len(html) - len("</body></html>"), 0)
+        filler = ("lorem ipsum " * (padding // 12 + 1))[:padding]
+        return f"{html}<p>{filler}</p></body></html>"
+
+    def _landing_page(self, shop: int, rng: random.Random) -> str:
+        products = rng.sample(
+            range(self.config.product_pages),
+            min(self.config.fan_out, self.config.product_pages),
+        )
+        return "".join(
+            [
+                *(
+                    f"<a href='/products/{page}'>Produkt {page}</a>"
+                    for page in products
+                ),
+                "<a href='/kontakt'>Kontakt</a><a href='/impressum'>Impressum</a>",
+                "<a href='/cart'>Warenkorb</a>",
+                *(
+                    f"<a href='https://www.{name}.com/shop{shop}'>{name}</a>"
+                    for name in rng.sample(SOCIAL_MEDIA, 2)
+                ),
+                *(
+                    f"<img alt='{name}' src='/img/{name}.png'>"
+                    for name in rng.sample(PAYMENTS, 2)
+                ),
+                f"<p>{' '.join(rng.sample(B2B_WORDS, 2))}</p>",
+            ]
+        )
+
+    def _product_page(self, shop: int, rng: random.Random) -> str:
+        prices = [round(rng.uniform(5, 500), 2) for _ in range(rng.randint(1, 20))]
+        text = "".join(
+            f"<div class='price'>{price:.2f} €</div>".replace(".", ",")
+            for price in prices
+        )
+        # the shops with structured prices are the same on every page
+        if random.Random(f"{self.config.seed}:{shop}").random() < (
+            self.config.structured_price_rate
+        ):
+            offers = [
+                {"@type": "Offer", "price": f"{price:.2f}", "priceCurrency": "EUR"}
+                for price in prices
+            ]
+            data = {
+                "@context": "https://schema.org",
+                "@type": "Product",
+                "offers": offers,
+            }
+            text += f"<script type='application/ld+json'>{json.dumps(data)}</script>"
+        links = "".join(
+            f"<a href='/products/{page}'>Produkt {page}</a>"
+            for page in rng.sample(
+                range(self.config.product_pages),
+                min(self.config.fan_out, self.config.product_pages),
+            )
+        )
+        return text + links
+
+    def _contact_page(self, shop: int, rng: random.Random) -> str:
+        return (
+            f"<p>Tel: +49 {rng.randint(30, 89)} {rng.randint(100000, 999999)}</p>"
+            f"<p>E-Mail: info@shop{shop}.example</p>"
+        )
+
+
+def serve(config: ShopFarmConfig) -> None:
+    """
+    serve the farm until the process is stopped
+    """
+    # the reactor is only installed here, crawls install the one scrapy asks for
+    from twisted.internet import reactor  # pylint: disable=import-outside-toplevel
+
+    site = server.Site(ShopFarm(config))
+    site.noisy = False
+    for index in range(config.shops):
+        reactor.listenTCP(config.port, site, interface=shop_host(index))
+    reactor.run()
+
+
+def wait_for_farm(config: ShopFarmConfig, timeout: float = 30) -> None:
+    """
+    wait until the last shop of the farm accepts connections
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            with socket.create_connection(
+                (shop_host(config.shops - 1), config.port), timeout=1
+            ):
+                return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.1)
+
+
+def crawl_farm(
+    config: ShopFarmConfig,
+    concurrent_requests: int,
+    concurrent_requests_per_domain: int,
+    adaptive_concurrency: bool = True,
+    spider_cls: Optional[type] = None,
+) -> dict:
+    """
+    crawl all shops of the farm with LeadSpider, or a subclass given as spider_cls,
+    through the full item pipeline, run in a fresh process per crawl as the reactor
+    cannot be restarted
+
+    Returns: the concurrency settings, seconds, pages per second and counts of the
+    crawl
+    """
+    # pylint: disable=import-outside-toplevel
+    from scrapy.crawler import CrawlerProcess
+
+    from mondu_website_scrapper.spiders.catch_fish_scraper import LeadSpider, settings
+
+    with tempfile.TemporaryDirectory() as folder:
+        settings.set("HTTPCACHE_ENABLED", False)
+        # pages that failed all retries are counted in the results instead
+        settings.set("LOG_LEVEL", "CRITICAL")
+        settings.set("FILE_FOLDER", Path(folder))
+        settings.set("COMPANY_AGGREGATES_FOLDER", Path(folder) / "company_aggregates")
+        settings.set("CHECKPOINT_FOLDER", Path(folder) / "checkpoint")
+        settings.set("METRICS_JSON_FILE", Path(folder) / "crawl_metrics.json")
+        settings.set("CONCURRENT_REQUESTS", concurrent_requests)
+        settings.set("CONCURRENT_REQUESTS_PER_DOMAIN", concurrent_requests_per_domain)
+        settings.set("ADAPTIVE_CONCURRENCY_ENABLED", adaptive_concurrency)
+        process = CrawlerProcess(settings)
+        crawler = process.create_crawler(spider_cls or LeadSpider)
+        process.crawl(crawler, use_gsheet=False, external_urls=shop_urls(config))
+        started = time.perf_counter()
+        process.start()
+        seconds = time.perf_counter() - started
+    stats = crawler.stats.get_stats()
+    responses = stats.get("downloader/response_count", 0)
+    return {
+        "concurrent_requests": concurrent_requests,
+        "concurrent_requests_per_domain": concurrent_requests_per_domain,
+        "adaptive_concurrency": adaptive_concurrency,
+        "seconds": round(seconds, 2),
+        "responses": responses,
+        "pages_per_second": round(responses / seconds, 2),
+        "items": stats.get("item_scraped_count", 0),
+        "error_responses": stats.get("downloader/response_status_count/503", 0),
+        "retries": stats.get("retry/count", 0),
+    }
+
+
+def crawl(
+    config: ShopFarmConfig,
+    concurrent_requests: list[int],
+    concurrent_requests_per_domain: list[int],
+    adaptive_concurrency: tuple[bool, ...] = (True,),
+) -> list[dict]:
+    """
+    serve the farm in a separate process and crawl it once per combination of
+    concurrency settings
+
+    Returns: the result of every crawl
+    """
+    context = get_context("spawn")
+    farm = context.Process(target=serve, args=(config,), daemon=True)
+    farm.start()
+    results = []
+    try:
+        wait_for_farm(config)
+        for requests, per_domain, adaptive in product(
+            concurrent_requests, concurrent_requests_per_domain, adaptive_concurrency
+        ):
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+                result = pool.submit(
+                    crawl_farm, config, requests, per_domain, adaptive
+                ).result()
+            print(json.dumps(result))
+            results.append(result)
+    finally:
+        farm.terminate()
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("command", choices=["serve", "crawl"])
+    for name, default in asdict(ShopFarmConfig()).items():
+        parser.add_argument(
+            f"--{name.replace('_', '-')}",
+            help=f"shop farm {name.replace('_', ' ')}, default {default}",
+            type=type(default),
+            default=default,
+        )
+    parser.add_argument(
+        "--concurrent-requests",
+        help="values of CONCURRENT_REQUESTS to crawl with",
+        nargs="+",
+        type=int,
+        default=[16],
+    )
+    parser.add_argument(
+        "--concurrent-requests-per-domain",
+        help="values of CONCURRENT_REQUESTS_PER_DOMAIN to crawl with",
+        nargs="+",
+        type=int,
+        default=[8],
+    )
+    parser.add_argument(
+        "--adaptive-concurrency",
+        help="crawl with the adaptive concurrency per domain on, off or both",
+        nargs="+",
+        choices=["on", "off"],
+        default=["on"],
+    )
+    parser.add_argument(
+        "--output",
+        help="json file to write the crawl results to",
+        type=Path,
+        default=Path("mock_web_results.json"),
+    )
+    args = parser.parse_args()
+    farm_config = ShopFarmConfig(
+        **{name: getattr(args, name) for name in asdict(ShopFarmConfig())}
+    )
+    if args.command == "serve":
+        print(
+            f"serving {farm_config.shops} shops, the first at {shop_urls(farm_config)[0]}"
+        )
+        serve(farm_config)
+    else:
+        crawl_results = crawl(
+            farm_config,
+            args.concurrent_requests,
+            args.concurrent_requests_per_domain,
+            tuple(value == "on" for value in args.adaptive_concurrency),
+        )
+        args.output.write_text(
+            json.dumps({"farm": asdict(farm_config), "crawls": crawl_results}, indent=2)
+        )
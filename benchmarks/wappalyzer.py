@@ -0,0 +1,102 @@
+""" Benchmark the wappalyzer analysis of landing pages on full crawls of the local
+shop farm: the old analysis downloading every landing page again with a blocking
+requests call in the reactor thread, against the analysis of the downloaded
+response in the wappalyzer pool
+
+run from the repository root:
+    pipenv run python -m benchmarks.wappalyzer --shops 40 --latency 0.2
+"""
+import argparse
+import json
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict
+from multiprocessing import get_context
+from pathlib import Path
+from typing import Any
+
+import scrapy
+
+from benchmarks.mock_web import ShopFarmConfig, crawl_farm, serve, wait_for_farm
+from mondu_website_scrapper.spiders.catch_fish_scraper import LeadSpider
+from mondu_website_scrapper.wappalyzer_analysis import fingerprint_store
+
+
+class RefetchLeadSpider(LeadSpider):
+    """
+    LeadSpider analysing landing pages like before the wappalyzer pool: every page
+    is downloaded again and matched in the reactor thread, which blocks the crawl
+    """
+
+    async def extract_wappalyzer_data(
+        self, response: scrapy.http.response
+    ) -> dict[str, dict[str, Any]]:
+        from Wappalyzer import WebPage  # pylint: disable=import-outside-toplevel
+
+        webpage = WebPage.new_from_url(response.url)
+        return fingerprint_store.load().analyze_with_categories(webpage)
+
+
+SPIDERS = {"refetch": RefetchLeadSpider, "pool": LeadSpider}
+
+
+def benchmark(config: ShopFarmConfig, modes: list[str]) -> list[dict]:
+    """
+    serve the farm in a separate process and crawl it once per mode
+
+    Returns: the result of every crawl
+    """
+    context = get_context("spawn")
+    farm = context.Process(target=serve, args=(config,), daemon=True)
+    farm.start()
+    results = []
+    try:
+        wait_for_farm(config)
+        for mode in modes:
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+                result = pool.submit(
+                    crawl_farm, config, 16, 8, True, SPIDERS[mode]
+                ).result()
+            result = {"mode": mode, **result}
+            print(json.dumps(result))
+            results.append(result)
+    finally:
+        farm.terminate()
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--shops", help="shops of the farm", type=int, default=40)
+    parser.add_argument(
+        "--latency", help="seconds every response takes", type=float, default=0.2
+    )
+    parser.add_argument(
+        "--product-pages", help="product pages of every shop", type=int, default=2
+    )
+    parser.add_argument("--port", help="port of the farm", type=int, default=8800)
+    parser.add_argument(
+        "--modes",
+        help="wappalyzer analysis to crawl with",
+        nargs="+",
+        choices=list(SPIDERS),
+        default=list(SPIDERS),
+    )
+    parser.add_argument(
+        "--output",
+        help="json file to write the crawl results to",
+        type=Path,
+        default=Path("wappalyzer_results.json"),
+    )
+    args = parser.parse_args()
+    farm_config = ShopFarmConfig(
+        shops=args.shops,
+        product_pages=args.product_pages,
+        fan_out=args.product_pages,
+        latency=args.latency,
+        error_rate=0.0,
+        port=args.port,
+    )
+    crawl_results = benchmark(farm_config, args.modes)
+    args.output.write_text(
+        json.dumps({"farm": asdict(farm_config), "crawls": crawl_results}, indent=2)
+    )
@@ -0,0 +1,172 @@
+""" Per domain concurrency adapted to the latency and errors of each domain"""
+from dataclasses import dataclass
+from typing import Optional
+from urllib.parse import urlparse
+
+# request priorities of follow up pages, landing pages of companies not started yet
+# keep the default priority 0
+FAST_DOMAIN_PRIORITY = 2
+NEW_DOMAIN_PRIORITY = 1
+SLOW_DOMAIN_PRIORITY = 0
+FAILING_DOMAIN_PRIORITY = -1
+
+
+@dataclass
+class DomainLatency:
+    """
+    moving averages of the download latency and the error rate of one domain, its
+    fastest response, and the number of its requests downloaded at the same time
+    """
+
+    concurrency: int
+    responses: int = 0
+    latency: float = 0.0
+    min_latency: float = 0.0
+    error_rate: float = 0.0
+    # fast responses since the concurrency was last changed
+    fast_responses: int = 0
+
+
+class AdaptiveConcurrency:
+    """
+    adapt the concurrency of every domain to how it answers, additive increase and
+    multiplicative decrease like tcp congestion control.
+
+    1. a domain starts with start_concurrency parallel requests, after as many
+    responses without congestion as its concurrency it gets one more, up to
+    max_concurrency.
+    2. an error, or an average latency above congestion_factor times the fastest
+    response of the domain plus congestion_latency seconds, halves the concurrency
+    of the domain, down to min_concurrency. a domain slower than tarpit_latency on
+    average, or with an error rate above max_error_rate, drops to min_concurrency
+    at once.
+    3. follow up pages of fast domains are requested first. those of domains
+    slower than slow_latency, and of failing domains, come after the landing pages
+    of companies not started yet, so they only take slots no other page waits for.
+    a domain that is slow but not congested keeps its concurrency.
+    """
+
+    def __init__(
+        self,
+        start_concurrency: int = 2,
+        min_concurrency: int = 1,
+        max_concurrency: int = 8,
+        slow_latency: float = 2.0,
+        congestion_factor: float = 2.0,
+        congestion_latency: float = 1.0,
+        tarpit_latency: float = 10.0,
+        max_error_rate: float = 0.5,
+        smoothing: float = 0.3,
+    ):
+        self.start_concurrency = start_concurrency
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.slow_latency = slow_latency
+        self.congestion_factor = congestion_factor
+        self.congestion_latency = congestion_latency
+        self.tarpit_latency = tarpit_latency
+        self.max_error_rate = max_error_rate
+        self.smoothing = smoothing
+        self.domains: dict[str, DomainLatency] = {}
+        self.increased = 0
+        self.decreased = 0
+
+    @classmethod
+    def from_settings(cls, settings) -> "AdaptiveConcurrency":
+        """
+        create it from the ADAPTIVE_CONCURRENCY settings, at most
+        CONCURRENT_REQUESTS_PER_DOMAIN requests per domain
+
+        Returns: AdaptiveConcurrency
+        """
+        return cls(
+            start_concurrency=settings.getint("ADAPTIVE_CONCURRENCY_START", 2),
+            min_concurrency=settings.getint("ADAPTIVE_CONCURRENCY_MIN", 1),
+            max_concurrency=settings.getint("CONCURRENT_REQUESTS_PER_DOMAIN", 8),
+            slow_latency=settings.getfloat("ADAPTIVE_SLOW_LATENCY", 2.0),
+            congestion_factor=settings.getfloat("ADAPTIVE_CONGESTION_FACTOR", 2.0),
+            congestion_latency=settings.getfloat("ADAPTIVE_CONGESTION_LATENCY", 1.0),
+            tarpit_latency=settings.getfloat("ADAPTIVE_TARPIT_LATENCY", 10.0),
+            max_error_rate=settings.getfloat("ADAPTIVE_MAX_ERROR_RATE", 0.5),
+        )
+
+    def domain(self, domain: str) -> DomainLatency:
+        """
+        Returns: the DomainLatency of a domain, created on first use
+        """
+        if domain not in self.domains:
+            self.domains[domain] = DomainLatency(concurrency=self.start_concurrency)
+        return self.domains[domain]
+
+    def _failing(self, stats: DomainLatency) -> bool:
+        return (
+            stats.latency > self.tarpit_latency
+            or stats.error_rate > self.max_error_rate
+        )
+
+    def observe(self, domain: str, latency: Optional[float], error: bool) -> int:
+        """
+        add a response or a failed download of a domain, failed downloads without
+        a latency count as tarpit_latency
+
+        Returns: the new concurrency of the domain
+        """
+        stats = self.domain(domain)
+        if latency is None:
+            latency = self.tarpit_latency
+        if stats.responses:
+            stats.latency += self.smoothing * (latency - stats.latency)
+            stats.error_rate += self.smoothing * (error - stats.error_rate)
+        else:
+            stats.latency, stats.error_rate = latency, float(error)
+            stats.min_latency = latency
+        if not error:
+            stats.min_latency = min(stats.min_latency, latency)
+        stats.responses += 1
+
+        previous = stats.concurrency
+        if self._failing(stats):
+            stats.concurrency = self.min_concurrency
+        elif error or stats.latency > (
+            self.congestion_factor * stats.min_latency + self.congestion_latency
+        ):
+            stats.concurrency = max(self.min_concurrency, stats.concurrency // 2)
+        else:
+            stats.fast_responses += 1
+            if stats.fast_responses >= stats.concurrency:
+                stats.concurrency = min(self.max_concurrency, stats.concurrency + 1)
+        if stats.concurrency != previous:
+            stats.fast_responses = 0
+            self.increased += stats.concurrency > previous
+            self.decreased += stats.concurrency < previous
+        return stats.concurrency
+
+    def priority(self, url: str) -> int:
+        """
+        Returns: the request priority of a follow up page by how fast its domain
+        answered so far
+        """
+        stats = self.domains.get(urlparse(url).hostname)
+        if stats is None or not stats.responses:
+            return NEW_DOMAIN_PRIORITY
+        if self._failing(stats):
+            return FAILING_DOMAIN_PRIORITY
+        if stats.latency > self.slow_latency:
+            return SLOW_DOMAIN_PRIORITY
+        return FAST_DOMAIN_PRIORITY
+
+    def summary(self) -> dict[str, int]:
+        """
+        Returns: the number of concurrency changes, and of slow and failing domains
+        """
+        return {
+            "domains": len(self.domains),
+            "increased": self.increased,
+            "decreased": self.decreased,
+            "slow_domains": sum(
+                stats.latency > self.slow_latency for stats in self.domains.values()
+            ),
+            "failing_domains": sum(
+                self._failing(stats) for stats in self.domains.values()
+            ),
+        }
@@ -0,0 +1,211 @@
+""" Per company aggregates of scraped items, kept up to date while crawling"""
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Optional
+
+import pyarrow as pa
+
+from mondu_website_scrapper.item_storage import (
+    ITEM_SCHEMAS,
+    ParquetItemWriter,
+    read_item_table,
+)
+from mondu_website_scrapper.utils import normalize_phone_format
+
+# the aggregates are saved with one row per company in the schema of the item
+# files, so the report reads them like items. prices keep the number of prices
+# their mean is built from, contacts keep all their contact pages
+AGGREGATE_SCHEMAS = {
+    "generalinformationitem": ITEM_SCHEMAS["generalinformationitem"],
+    "priceitem": ITEM_SCHEMAS["priceitem"]
+    .append(pa.field("price_items", pa.int64()))
+    .append(pa.field("price_count", pa.int64())),
+    "contactitem": ITEM_SCHEMAS["contactitem"].set(
+        ITEM_SCHEMAS["contactitem"].get_field_index("contact_information_url"),
+        pa.field("contact_information_url", pa.list_(pa.string())),
+    ),
+}
+
+
+@dataclass
+class CompanyAggregate:
+    """
+    running aggregates of one company, ordered sets are kept as dicts with
+    None values so they keep the order values were scraped in
+    """
+
+    general: Optional[dict] = None
+    social_media: dict = field(default_factory=dict)
+    wappalyzer: dict = field(default_factory=dict)
+    price_items: int = 0
+    price_sum: float = 0.0
+    price_count: int = 0
+    products_quantity: int = 0
+    currency: Optional[str] = None
+    contact_items: int = 0
+    phones: dict = field(default_factory=dict)
+    contact_urls: dict = field(default_factory=dict)
+    emails: dict = field(default_factory=dict)
+
+
+class CompanyAggregates:
+    """
+    aggregate the items of every company as they are scraped, so the report is
+    built from one row per company instead of all scraped rows.
+    1. general information: the latest item, with social media links and the
+    technologies of every wappalyzer category merged over all items
+    2. prices: sum and count of the average prices for the mean price, the total
+    number of products and the first currency
+    3. contacts: ordered sets of phones, contact pages and emails
+    """
+
+    def __init__(self, companies: Optional[dict[str, CompanyAggregate]] = None):
+        self.companies = companies if companies is not None else {}
+
+    def _company(self, company_url: str) -> CompanyAggregate:
+        return self.companies.setdefault(company_url, CompanyAggregate())
+
+    def add(self, item_name: str, item: dict) -> None:
+        """
+        add an item, the wappalyzer data of general information items has to be
+        reduced to categories already
+        """
+        company = self._company(item["company_url"])
+        if item_name == "generalinformationitem":
+            company.general = {
+                key: value
+                for key, value in item.items()
+                if key not in ("social_media", "wappalyzer")
+            }
+            company.social_media.update(dict.fromkeys(item.get("social_media") or []))
+            for category, technologies in (item.get("wappalyzer") or {}).items():
+                company.wappalyzer.setdefault(category, {}).update(
+                    dict.fromkeys(technologies.split(", "))
+                )
+        elif item_name == "priceitem":
+            company.price_items += 1
+            if item.get("products_avg_price") is not None:
+                company.price_sum += item["products_avg_price"]
+                company.price_count += 1
+            company.products_quantity += item.get("products_quantity") or 0
+            if company.currency is None:
+                company.currency = item.get("currency")
+        elif item_name == "contactitem":
+            company.contact_items += 1
+            # phones are normalized per item, as the report did on scraped rows
+            if item.get("phone"):
+                phones = normalize_phone_format(
+                    ",".join(item["phone"]), country_code=["43", "49"]
+                )
+                company.phones.update(dict.fromkeys(phones.split(",")))
+            if item.get("contact_information_url"):
+                company.contact_urls[item["contact_information_url"]] = None
+            company.emails.update(dict.fromkeys(item.get("email") or []))
+
+    def drop(self, company_urls: set[str]) -> None:
+        """
+        forget the aggregates of the given companies
+        """
+        for company_url in company_urls:
+            self.companies.pop(company_url, None)
+
+    def _rows(self) -> dict[str, list[dict]]:
+        """
+        Returns: one row per company and item type in the aggregate schemas
+        """
+        rows = {name: [] for name in AGGREGATE_SCHEMAS}
+        for company_url, company in self.companies.items():
+            if company.general is not None:
+                rows["generalinformationitem"].append(
+                    {
+                        **company.general,
+                        "social_media": list(company.social_media),
+                        "wappalyzer": {
+                            category: ", ".join(technologies)
+                            for category, technologies in company.wappalyzer.items()
+                        },
+                    }
+                )
+            if company.price_items:
+                rows["priceitem"].append(
+                    {
+                        "company_url": company_url,
+                        "products_quantity": company.products_quantity,
+                        "products_avg_price": company.price_sum / company.price_count
+                        if company.price_count
+                        else None,
+                        "currency": company.currency,
+                        "price_items": company.price_items,
+                        "price_count": company.price_count,
+                    }
+                )
+            if company.contact_items:
+                rows["contactitem"].append(
+                    {
+                        "company_url": company_url,
+                        "phone": list(company.phones),
+                        "contact_information_url": list(company.contact_urls),
+                        "email": list(company.emails),
+                    }
+                )
+        return rows
+
+    def save(self, folder: Path) -> None:
+        """
+        write the aggregates as one parquet file per item type in folder, each file
+        is moved in place once written, item types without rows leave no file
+        """
+        folder.mkdir(parents=True, exist_ok=True)
+        for name, rows in self._rows().items():
+            writer = ParquetItemWriter(
+                folder / f"{name}.parquet",
+                AGGREGATE_SCHEMAS[name],
+                batch_size=max(len(rows), 1),
+            )
+            if rows:
+                writer.write_table(
+                    pa.Table.from_pylist(rows, schema=AGGREGATE_SCHEMAS[name])
+                )
+            writer.close()
+
+    @classmethod
+    def load(cls, folder: Path) -> "CompanyAggregates":
+        """
+        read aggregates written by save
+
+        Returns: CompanyAggregates, empty if nothing was saved
+        """
+        aggregates = cls()
+        tables = {
+            name: read_item_table(folder / f"{name}.parquet")
+            for name in AGGREGATE_SCHEMAS
+        }
+        if tables["generalinformationitem"] is not None:
+            for row in tables["generalinformationitem"].to_pylist():
+                company = aggregates._company(row["company_url"])
+                company.social_media = dict.fromkeys(row.pop("social_media") or [])
+                company.wappalyzer = {
+                    category: dict.fromkeys(technologies.split(", "))
+                    for category, technologies in row.pop("wappalyzer") or []
+                }
+                company.general = row
+        if tables["priceitem"] is not None:
+            for row in tables["priceitem"].to_pylist():
+                company = aggregates._company(row["company_url"])
+                company.price_items = row["price_items"]
+                company.price_count = row["price_count"]
+                company.price_sum = (row["products_avg_price"] or 0) * row[
+                    "price_count"
+                ]
+                company.products_quantity = row["products_quantity"]
+                company.currency = row["currency"]
+        if tables["contactitem"] is not None:
+            for row in tables["contactitem"].to_pylist():
+                company = aggregates._company(row["company_url"])
+                company.contact_items = 1
+                company.phones = dict.fromkeys(row["phone"] or [])
+                company.contact_urls = dict.fromkeys(
+                    row["contact_information_url"] or []
+                )
+                company.emails = dict.fromkeys(row["email"] or [])
+        return aggregates
@@ -0,0 +1,187 @@
+""" Fingerprints of page contents, to reuse the extraction results of duplicated pages"""
+import copy
+import hashlib
+import re
+from collections import Counter, OrderedDict
+from dataclasses import dataclass
+from typing import Any, Optional
+
+import numpy as np
+import scrapy
+
+from mondu_website_scrapper.response_text import get_response_text
+
+SIMHASH_BITS = 64
+# words of a page, hashed in shingles of SHINGLE_WORDS words
+WORD_PATTERN = re.compile(r"\w+")
+SHINGLE_WORDS = 3
+# returned by get for pages not analysed before
+MISSING = object()
+
+
+def simhash(text: str) -> int:
+    """
+    simhash of a text over its distinct shingles of words: pages sharing most of
+    their shingles differ in few bits
+
+    Returns: the 64 bit simhash
+    """
+    words = WORD_PATTERN.findall(text)
+    shingles = {
+        " ".join(words[start : start + SHINGLE_WORDS])
+        for start in range(max(len(words) - SHINGLE_WORDS + 1, 1))
+    }
+    hashes = b"".join(
+        hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest()
+        for shingle in shingles
+    )
+    bits = np.unpackbits(np.frombuffer(hashes, dtype=np.uint8).reshape(-1, 8), axis=1)
+    ones = bits.sum(axis=0, dtype=np.int64)
+    return int.from_bytes(
+        np.packbits(ones * 2 > len(shingles)).tobytes(), byteorder="big"
+    )
+
+
+@dataclass
+class Fingerprint:
+    """
+    fingerprint of the body of one page, simhash is None for page types without
+    near duplicates
+    """
+
+    page_type: str
+    digest: bytes
+    simhash: Optional[int] = None
+
+
+class ContentFingerprintCache:
+    """
+    extraction results of pages by the fingerprint of their content, so pages of
+    shops on the same platform or mirrored domains are analysed once.
+
+    1. a page whose body is byte identical to a page analysed before reuses its
+    results, for every page type.
+    2. pages of near_page_types also reuse the results of a page whose simhash
+    differs in at most max_distance bits. the simhashes are split into
+    max_distance + 1 bands, two simhashes that close share at least one band, so
+    only the pages sharing a band are compared.
+    3. the results of at most max_entries pages are kept, the least recently used
+    are dropped first. 0 keeps none and fingerprints nothing.
+
+    results are only those of the content, fields of the url of a page are up to
+    the caller
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 100_000,
+        max_distance: int = 3,
+        near_page_types: tuple = ("landing",),
+    ):
+        self.max_entries = max_entries
+        self.max_distance = max_distance
+        self.near_page_types = set(near_page_types) if max_distance else set()
+        self.band_bits = SIMHASH_BITS // (max_distance + 1)
+        # (page_type, digest) -> fingerprint and results, least recent first
+        self.entries: OrderedDict[
+            tuple[str, bytes], tuple[Fingerprint, Any]
+        ] = OrderedDict()
+        # (page_type, band, band value) -> digests of the pages in the band
+        self.bands: dict[tuple[str, int, int], set[bytes]] = {}
+        self.stats: Counter = Counter()
+
+    def fingerprint(
+        self, page_type: str, response: scrapy.http.TextResponse
+    ) -> Optional[Fingerprint]:
+        """
+        Returns: the fingerprint of a page, None if the cache keeps nothing
+        """
+        if not self.max_entries:
+            return None
+        return Fingerprint(
+            page_type, hashlib.blake2b(response.body, digest_size=16).digest()
+        )
+
+    def get(self, fingerprint: Optional[Fingerprint], response) -> Any:
+        """
+        look up the results of a page with the same or, for near_page_types, a
+        nearly the same content. the simhash of the page is only computed when
+        no page has the same body
+
+        Returns: a copy of the results, MISSING if there are none
+        """
+        if fingerprint is None:
+            return MISSING
+        key = (fingerprint.page_type, fingerprint.digest)
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.stats["exact_hits"] += 1
+            return copy.deepcopy(self.entries[key][1])
+        if fingerprint.page_type in self.near_page_types:
+            fingerprint.simhash = simhash(get_response_text(response).lower)
+            digest = self._nearest(fingerprint)
+            if digest is not None:
+                results = self.entries[(fingerprint.page_type, digest)][1]
+                self.put(fingerprint, results)
+                self.stats["near_hits"] += 1
+                return copy.deepcopy(results)
+        self.stats["misses"] += 1
+        return MISSING
+
+    def put(self, fingerprint: Optional[Fingerprint], results: Any) -> None:
+        """
+        keep the results of a page, dropping the least recently used page when full
+        """
+        if fingerprint is None:
+            return
+        key = (fingerprint.page_type, fingerprint.digest)
+        self._remove(key)
+        self.entries[key] = (fingerprint, results)
+        for band in self._bands(fingerprint):
+            self.bands.setdefault(band, set()).add(fingerprint.digest)
+        while len(self.entries) > self.max_entries:
+            self._remove(next(iter(self.entries)))
+
+    def clear(self) -> None:
+        """
+        drop all results
+        """
+        self.entries.clear()
+        self.bands.clear()
+
+    def _nearest(self, fingerprint: Fingerprint) -> Optional[bytes]:
+        """
+        Returns: the digest of the page with the closest simhash within max_distance
+        bits, None if there is none
+        """
+        nearest, nearest_distance = None, self.max_distance + 1
+        for band in self._bands(fingerprint):
+            for digest in self.bands.get(band, ()):
+                other = self.entries[(fingerprint.page_type, digest)][0]
+                distance = bin(fingerprint.simhash ^ other.simhash).count("1")
+                if distance < nearest_distance:
+                    nearest, nearest_distance = digest, distance
+        return nearest
+
+    def _bands(self, fingerprint: Fingerprint) -> list[tuple[str, int, int]]:
+        if fingerprint.simhash is None:
+            return []
+        mask = (1 << self.band_bits) - 1
+        return [
+            (
+                fingerprint.page_type,
+                band,
+                fingerprint.simhash >> (band * self.band_bits) & mask,
+            )
+            for band in range(self.max_distance + 1)
+        ]
+
+    def _remove(self, key: tuple[str, bytes]) -> None:
+        if key not in self.entries:
+            return
+        fingerprint, _ = self.entries.pop(key)
+        for band in self._bands(fingerprint):
+            digests = self.bands[band]
+            digests.discard(fingerprint.digest)
+            if not digests:
+                del self.bands[band]
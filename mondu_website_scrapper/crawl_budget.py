@@ -0,0 +1,192 @@
+""" Per company budget and deduplication of follow up pages"""
+import hashlib
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Optional
+
+from w3lib.url import canonicalize_url
+
+
+def url_fingerprint(url: str) -> str:
+    """
+    fingerprint of a GET request url, urls only differing in query argument order
+    or fragments share a fingerprint
+
+    Returns: hex digest of the canonicalized url
+    """
+    return hashlib.sha1(canonicalize_url(url).encode("utf-8")).hexdigest()  # nosec B324
+
+
+@dataclass
+class CompanyPages:
+    """
+    follow up pages of one company and page type
+    """
+
+    pending: deque = field(default_factory=deque)
+    queued: set = field(default_factory=set)
+    # (page_type, fingerprint) of the pages scheduled, to release their results
+    page_keys: set = field(default_factory=set)
+    scheduled: int = 0
+    in_flight: int = 0
+
+
+@dataclass
+class PriceStatistics:
+    """
+    running mean of the average prices found on the product pages of a company
+    """
+
+    count: int = 0
+    mean: float = 0.0
+    converged: bool = False
+
+
+class CrawlBudget:
+    """
+    bound the follow up pages crawled for each company.
+
+    1. each company gets at most max_pages[page_type] follow up pages of a type,
+    of which at most concurrent_pages are downloaded at the same time.
+    2. pages are deduplicated by url fingerprint across all companies, a page
+    already requested for another company is downloaded once and its
+    extraction result is shared.
+    3. product pages of a company stop once the running mean of their prices
+    moved less than price_tolerance after at least price_min_pages pages.
+    4. the pages and prices of a company are released once it is done, results
+    are kept while a company not done yet scheduled the page. a later company
+    downloads such a page again, identical bodies still reuse their results
+    through the content fingerprint cache.
+    """
+
+    def __init__(
+        self,
+        max_pages: dict[str, int],
+        concurrent_pages: int = 8,
+        price_min_pages: int = 10,
+        price_tolerance: float = 0.01,
+    ):
+        self.max_pages = max_pages
+        self.concurrent_pages = concurrent_pages
+        self.price_min_pages = price_min_pages
+        self.price_tolerance = price_tolerance
+        self.companies: dict[tuple[str, str], CompanyPages] = {}
+        self.prices: dict[str, PriceStatistics] = {}
+        # (page_type, fingerprint) -> companies waiting for the page
+        self.page_owners: dict[tuple[str, str], list[str]] = {}
+        # (page_type, fingerprint) -> extraction result of a finished page
+        self.page_results: dict[tuple[str, str], Optional[dict]] = {}
+        # (page_type, fingerprint) -> number of companies not released using the page
+        self.page_users: dict[tuple[str, str], int] = {}
+
+    def _pages(self, company_url: str, page_type: str) -> CompanyPages:
+        return self.companies.setdefault((company_url, page_type), CompanyPages())
+
+    def add_links(self, company_url: str, page_type: str, urls: list[str]) -> None:
+        """
+        queue follow up links found for a company
+        """
+        pages = self._pages(company_url, page_type)
+        for url in urls:
+            fingerprint = url_fingerprint(url)
+            if fingerprint not in pages.queued:
+                pages.queued.add(fingerprint)
+                pages.pending.append(url)
+
+    def _exhausted(self, company_url: str, page_type: str) -> bool:
+        pages = self._pages(company_url, page_type)
+        if pages.scheduled >= self.max_pages.get(page_type, 0):
+            return True
+        return (
+            page_type == "product"
+            and self.prices.get(company_url, PriceStatistics()).converged
+        )
+
+    def next_pages(
+        self, company_url: str, page_type: str
+    ) -> tuple[list[str], list[Optional[dict]]]:
+        """
+        take queued links of a company within its budget
+
+        Returns: urls to be requested now, and the already extracted results of
+        pages another company requested before
+        """
+        pages = self._pages(company_url, page_type)
+        urls, results = [], []
+        while (
+            pages.pending
+            and pages.in_flight < self.concurrent_pages
+            and not self._exhausted(company_url, page_type)
+        ):
+            url = pages.pending.popleft()
+            page_key = (page_type, url_fingerprint(url))
+            pages.scheduled += 1
+            if page_key not in pages.page_keys:
+                pages.page_keys.add(page_key)
+                self.page_users[page_key] = self.page_users.get(page_key, 0) + 1
+            if page_key in self.page_results:
+                results.append(self.page_results[page_key])
+                continue
+            pages.in_flight += 1
+            if page_key in self.page_owners:
+                self.page_owners[page_key].append(company_url)
+            else:
+                self.page_owners[page_key] = [company_url]
+                urls.append(url)
+        if self._exhausted(company_url, page_type):
+            pages.pending.clear()
+        return urls, results
+
+    def page_done(self, url: str, page_type: str, result: Optional[dict]) -> list[str]:
+        """
+        store the extraction result of a downloaded or failed page, None if nothing
+        was extracted, and free the download slots of all companies waiting for it
+
+        Returns: company urls of all companies waiting for the page
+        """
+        page_key = (page_type, url_fingerprint(url))
+        self.page_results[page_key] = result
+        owners = self.page_owners.pop(page_key, [])
+        for company_url in owners:
+            self._pages(company_url, page_type).in_flight -= 1
+        return owners
+
+    def company_done(self, company_url: str) -> bool:
+        """
+        Returns: True if no follow up page of a company is queued or downloading
+        """
+        for page_type in self.max_pages:
+            pages = self.companies.get((company_url, page_type))
+            if pages is not None and (pages.pending or pages.in_flight):
+                return False
+        return True
+
+    def release(self, company_url: str) -> None:
+        """
+        drop the pages and prices of a done company, and the results of the pages
+        no other company uses
+        """
+        self.prices.pop(company_url, None)
+        for page_type in self.max_pages:
+            pages = self.companies.pop((company_url, page_type), None)
+            if pages is None:
+                continue
+            for page_key in pages.page_keys:
+                self.page_users[page_key] -= 1
+                if not self.page_users[page_key]:
+                    del self.page_users[page_key]
+                    self.page_results.pop(page_key, None)
+
+    def add_price(self, company_url: str, avg_price: Optional[float]) -> None:
+        """
+        update the running mean price of a company with the average price of a page
+        """
+        if avg_price is None:
+            return
+        stats = self.prices.setdefault(company_url, PriceStatistics())
+        previous_mean = stats.mean
+        stats.count += 1
+        stats.mean += (avg_price - stats.mean) / stats.count
+        if stats.count >= self.price_min_pages and previous_mean:
+            change = abs(stats.mean - previous_mean) / abs(previous_mean)
+            stats.converged = change < self.price_tolerance
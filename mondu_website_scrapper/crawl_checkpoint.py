@@ -0,0 +1,247 @@
+""" Checkpoints of the finished companies of a crawl, to resume it after a crash"""
+import json
+import os
+import shutil
+from collections import Counter
+from pathlib import Path
+from typing import Iterator, Optional, Union
+
+import pyarrow as pa
+
+from mondu_website_scrapper.item_storage import read_item_table
+
+CHECKPOINT_FILE = "checkpoint.json"
+START_URLS_FILE = "start_urls.txt"
+
+
+class CrawlCheckpoint:
+    """
+    the state of a crawl at its last checkpoint, kept in folder.
+
+    1. start_urls.txt holds the start urls of the crawl, one per line, appended
+    as they are requested and flushed with every checkpoint.
+    2. checkpoint.json holds the finished companies, the companies with items that
+    were not finished, the item parts written up to the checkpoint and the folder
+    of the company aggregates saved with it. it is replaced atomically, parts and
+    aggregates it does not list are removed once it is written.
+    3. the item parts are written by CheckpointItemWriter in parts/<item name>, the
+    aggregates of every checkpoint are saved to a new aggregates-<number> folder.
+
+    a company is finished once its landing page and all its follow up pages are
+    done, and every item the spider yielded for it went through the pipeline.
+    a crawl resumes with the start urls of companies not finished, the rows of the
+    companies that were not finished are dropped from the parts and aggregates,
+    and they are crawled again from their landing page. start urls that were
+    not requested yet are read from the input again, skipping the ones in
+    start_urls.txt.
+    """
+
+    def __init__(self, folder: Union[Path, str]):
+        self.folder = Path(folder)
+        # start url -> company url of finished companies, None for failed ones
+        self.finished: dict[str, Optional[str]] = {}
+        # companies done in the spider, waiting for their items to be stored
+        self.done: dict[str, Optional[str]] = {}
+        self.yielded: Counter = Counter()
+        self.stored: Counter = Counter()
+        # companies with items that were not finished at the loaded checkpoint
+        self.unfinished: set[str] = set()
+        self.parts: dict[str, list[str]] = {}
+        self.aggregates: Optional[str] = None
+        self.number = 0
+        self.start_urls_file = None
+
+    def parts_folder(self, item_name: str) -> Path:
+        """
+        Returns: the folder of the item parts of an item type
+        """
+        return self.folder / "parts" / item_name
+
+    def exists(self) -> bool:
+        """
+        Returns: True if an interrupted crawl left a checkpoint to resume from
+        """
+        return (self.folder / START_URLS_FILE).exists()
+
+    def start(self, fresh: bool = False) -> None:
+        """
+        start a new crawl, the checkpoint of an interrupted crawl is only removed if
+        fresh
+
+        Raises: FileExistsError if there is a checkpoint and not fresh
+        """
+        if self.exists() and not fresh:
+            raise FileExistsError(
+                f"{self.folder} holds the checkpoint of an interrupted crawl,"
+                " resume it or start a fresh crawl to remove it"
+            )
+        self.clear()
+        self.folder.mkdir(parents=True, exist_ok=True)
+        self._open_start_urls()
+
+    def _open_start_urls(self) -> None:
+        """
+        open the recorded start urls to append to, a line cut off by a crash is
+        removed first
+        """
+        with open(self.folder / START_URLS_FILE, "ab+") as file:
+            size = file.seek(0, os.SEEK_END)
+            file.seek(max(0, size - 65536))
+            tail = file.read()
+            file.truncate(size - len(tail) + tail.rfind(b"\n") + 1)
+        # pylint: disable=consider-using-with
+        self.start_urls_file = open(
+            self.folder / START_URLS_FILE, "a", encoding="utf-8"
+        )
+
+    def add_start_url(self, url: str) -> None:
+        """
+        record a start url requested by the crawl
+        """
+        self.start_urls_file.write(f"{url}\n")
+
+    def start_urls(self) -> Iterator[str]:
+        """
+        Yields: the start urls recorded up to the last checkpoint, a line cut off
+        by a crash is skipped
+        """
+        if not (self.folder / START_URLS_FILE).exists():
+            return
+        with open(self.folder / START_URLS_FILE, "r", encoding="utf-8") as file:
+            for line in file:
+                if line.endswith("\n"):
+                    yield line[:-1]
+
+    def clear(self) -> None:
+        """
+        remove the checkpoint
+        """
+        if self.start_urls_file is not None:
+            self.start_urls_file.close()
+            self.start_urls_file = None
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def _write(self, file_name: str, data) -> None:
+        tmp_file = self.folder / f".{file_name}.tmp"
+        tmp_file.write_text(json.dumps(data), encoding="utf-8")
+        tmp_file.replace(self.folder / file_name)
+
+    def load(self) -> Optional[list[str]]:
+        """
+        load the last checkpoint of an interrupted crawl, start urls requested from
+        now on are recorded with the ones before
+
+        Returns: the recorded start urls of the companies not finished, None if there
+        is no checkpoint
+        """
+        if not self.exists():
+            return None
+        if (self.folder / CHECKPOINT_FILE).exists():
+            state = json.loads(
+                (self.folder / CHECKPOINT_FILE).read_text(encoding="utf-8")
+            )
+            self.finished = state["finished"]
+            self.unfinished = set(state["unfinished"])
+            self.parts = state["parts"]
+            self.aggregates = state["aggregates"]
+            self.number = state["number"]
+        pending_urls = [url for url in self.start_urls() if url not in self.finished]
+        self._open_start_urls()
+        return pending_urls
+
+    def item_yielded(self, company_url: str) -> None:
+        """
+        count an item the spider yielded for a company
+        """
+        self.yielded[company_url] += 1
+
+    def item_stored(self, company_url: str) -> None:
+        """
+        count an item of a company the pipeline stored
+        """
+        self.stored[company_url] += 1
+
+    def company_done(self, start_url: str, company_url: Optional[str]) -> None:
+        """
+        mark a company as done in the spider, None as company url for a failed
+        landing page
+        """
+        self.done[start_url] = company_url
+
+    def commit_finished(self) -> dict[str, Optional[str]]:
+        """
+        move the done companies whose items were all stored to the finished ones
+
+        Returns: the finished companies
+        """
+        for start_url, company_url in list(self.done.items()):
+            if company_url is None or (
+                self.stored[company_url] >= self.yielded[company_url]
+            ):
+                self.finished[start_url] = self.done.pop(start_url)
+        return self.finished
+
+    def aggregates_folder(self) -> Optional[Path]:
+        """
+        Returns: the folder of the company aggregates of the loaded checkpoint, None
+        without any
+        """
+        return self.folder / self.aggregates if self.aggregates else None
+
+    def next_aggregates_folder(self) -> Path:
+        """
+        Returns: the folder to save the company aggregates of the next checkpoint to
+        """
+        return self.folder / f"aggregates-{self.number + 1:05d}"
+
+    def save(self, parts: dict[str, list[Path]], aggregates_folder: Path) -> None:
+        """
+        write the checkpoint with the item parts of every item type and the folder
+        the company aggregates were saved to, and remove the parts and aggregates of
+        earlier checkpoints.
+        call commit_finished before the parts are closed and the aggregates saved,
+        so every finished company has all its items in them.
+        """
+        finished_urls = set(self.finished.values())
+        if self.start_urls_file is not None:
+            self.start_urls_file.flush()
+        self.number += 1
+        self.parts = {
+            name: [part.name for part in paths] for name, paths in parts.items()
+        }
+        self.aggregates = aggregates_folder.name
+        self._write(
+            CHECKPOINT_FILE,
+            {
+                "finished": self.finished,
+                "unfinished": sorted(
+                    url for url in self.yielded if url not in finished_urls
+                ),
+                "parts": self.parts,
+                "aggregates": self.aggregates,
+                "number": self.number,
+            },
+        )
+        for name, part_names in self.parts.items():
+            for part in self.parts_folder(name).glob("part-*.parquet"):
+                if part.name not in part_names:
+                    part.unlink(missing_ok=True)
+        for folder in self.folder.glob("aggregates-*"):
+            if folder.name != self.aggregates:
+                shutil.rmtree(folder, ignore_errors=True)
+
+    def read_items(self, item_name: str) -> Optional[pa.Table]:
+        """
+        read the items of an item type in the parts of the last checkpoint, without
+        the rows of companies that were not finished
+
+        Returns: a pyarrow table, None if there are no parts
+        """
+        tables = [
+            read_item_table(
+                self.parts_folder(item_name) / part, drop_companies=self.unfinished
+            )
+            for part in self.parts.get(item_name, [])
+        ]
+        tables = [table for table in tables if table is not None]
+        return pa.concat_tables(tables) if tables else None
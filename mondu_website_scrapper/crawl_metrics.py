@@ -0,0 +1,348 @@
+""" Timings of the crawl stages, per domain and of the download queue"""
+import json
+import time
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Iterator, Optional
+from urllib.parse import urlparse
+
+import scrapy
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+from scrapy.resolver import CachingThreadedResolver, dnscache
+from twisted.internet import task
+from twisted.python.failure import Failure
+from twisted.web import resource, server
+
+# upper bounds in seconds of the histogram buckets of the stage timers
+HISTOGRAM_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0)
+
+
+@dataclass
+class Timer:
+    """
+    count, total and maximum seconds of one crawl stage, and the number of
+    timings up to each bucket of HISTOGRAM_BUCKETS
+    """
+
+    count: int = 0
+    seconds: float = 0.0
+    max_seconds: float = 0.0
+    buckets: list[int] = field(default_factory=lambda: [0] * len(HISTOGRAM_BUCKETS))
+
+    def add(self, seconds: float) -> None:
+        """
+        add one timing
+        """
+        self.count += 1
+        self.seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+        for index, bound in enumerate(HISTOGRAM_BUCKETS):
+            if seconds <= bound:
+                self.buckets[index] += 1
+                break
+
+
+@dataclass
+class DomainTimes:
+    """
+    responses of one domain, the seconds spent downloading and parsing them and
+    the number of error responses
+    """
+
+    responses: int = 0
+    download_seconds: float = 0.0
+    parse_seconds: float = 0.0
+    errors: int = 0
+
+
+class CrawlMetrics:
+    """
+    timers of crawl stages, e.g. extractors, wappalyzer and the item export, the
+    download and parse time of every domain, and gauges sampled during the crawl
+    """
+
+    def __init__(self):
+        self.timers: dict[str, Timer] = {}
+        self.domains: dict[str, DomainTimes] = {}
+        self.gauges: dict[str, float] = {}
+
+    def add(self, stage: str, seconds: float, domain: Optional[str] = None) -> None:
+        """
+        add a timing of a stage, timings with a domain count as its parse time
+        """
+        self.timers.setdefault(stage, Timer()).add(seconds)
+        if domain is not None:
+            self.domains.setdefault(domain, DomainTimes()).parse_seconds += seconds
+
+    @contextmanager
+    def time(self, stage: str, url: Optional[str] = None) -> Iterator[None]:
+        """
+        time the block as a stage, as parse time of the domain of url if given
+        """
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(
+                stage,
+                time.perf_counter() - started,
+                urlparse(url).hostname if url is not None else None,
+            )
+
+    def add_download(self, url: str, seconds: Optional[float], status: int) -> None:
+        """
+        add a downloaded response of the domain of url
+        """
+        domain = self.domains.setdefault(urlparse(url).hostname, DomainTimes())
+        domain.responses += 1
+        domain.download_seconds += seconds or 0.0
+        domain.errors += status >= 400
+
+    def summary(self, top_domains: int = 20) -> dict:
+        """
+        Returns: the timers and gauges, and the domains with the most download and
+        parse time, as a dict
+        """
+        slowest = sorted(
+            self.domains.items(),
+            key=lambda item: item[1].download_seconds + item[1].parse_seconds,
+            reverse=True,
+        )[:top_domains]
+        return {
+            "timers": {name: asdict(timer) for name, timer in self.timers.items()},
+            "gauges": dict(self.gauges),
+            "domains": len(self.domains),
+            "slowest_domains": {name: asdict(times) for name, times in slowest},
+        }
+
+    def prometheus(self, top_domains: int = 20) -> str:
+        """
+        Returns: the summary in the prometheus text exposition format
+        """
+        summary = self.summary(top_domains)
+        lines = ["# TYPE mondu_stage_seconds histogram"]
+        for name, timer in summary["timers"].items():
+            cumulative = 0
+            for bound, count in zip(HISTOGRAM_BUCKETS, timer["buckets"]):
+                cumulative += count
+                lines.append(
+                    f'mondu_stage_seconds_bucket{{stage="{name}",le="{bound}"}} '
+                    f"{cumulative}"
+                )
+            lines += [
+                f'mondu_stage_seconds_bucket{{stage="{name}",le="+Inf"}} '
+                f'{timer["count"]}',
+                f'mondu_stage_seconds_sum{{stage="{name}"}} {timer["seconds"]}',
+                f'mondu_stage_seconds_count{{stage="{name}"}} {timer["count"]}',
+            ]
+        for name, value in summary["gauges"].items():
+            lines += [f"# TYPE mondu_{name} gauge", f"mondu_{name} {value}"]
+        lines += ["# TYPE mondu_domains gauge", f'mondu_domains {summary["domains"]}']
+        for key in ("responses", "download_seconds", "parse_seconds", "errors"):
+            lines.append(f"# TYPE mondu_domain_{key}_total counter")
+            lines += [
+                f'mondu_domain_{key}_total{{domain="{name}"}} {times[key]}'
+                for name, times in summary["slowest_domains"].items()
+            ]
+        return "\n".join(lines) + "\n"
+
+
+class MetricsResource(resource.Resource):
+    """
+    serve the crawl metrics in the prometheus text format on any path
+    """
+
+    isLeaf = True
+
+    def __init__(self, extension: "CrawlMetricsExtension"):
+        super().__init__()
+        self.extension = extension
+
+    def render_GET(self, request) -> bytes:  # pylint: disable=invalid-name
+        """
+        Returns: the current metrics
+        """
+        request.setHeader(b"content-type", b"text/plain; version=0.0.4")
+        return self.extension.prometheus().encode()
+
+
+class CrawlMetricsExtension:
+    """
+    collect the crawl metrics of the spider, spider.metrics if it keeps any.
+    1. the download time of every response per domain, from the download_latency
+    scrapy measures
+    2. the scheduler queue depth and the requests in flight, sampled every
+    METRICS_INTERVAL seconds
+    3. dns lookups timed by TimedResolver, and the counters of the pattern
+    registry of the spider
+    the metrics are written to METRICS_JSON_FILE when sampled, served in the
+    prometheus text format on METRICS_PORT and logged as a summary at the end
+    """
+
+    def __init__(
+        self,
+        crawler,
+        interval: float,
+        json_file: Optional[Path],
+        port: int,
+        top_domains: int,
+    ):
+        self.crawler = crawler
+        self.interval = interval
+        self.json_file = Path(json_file) if json_file else None
+        self.port = port
+        self.top_domains = top_domains
+        self.metrics = CrawlMetrics()
+        self.spider: Optional[scrapy.Spider] = None
+        self.sampler: Optional[task.LoopingCall] = None
+        self.listening_port = None
+
+    @classmethod
+    def from_crawler(cls, crawler) -> "CrawlMetricsExtension":
+        """
+        create the extension from the METRICS settings
+
+        Returns: CrawlMetricsExtension
+        """
+        if not crawler.settings.getbool("METRICS_ENABLED"):
+            raise NotConfigured
+        extension = cls(
+            crawler,
+            interval=crawler.settings.getfloat("METRICS_INTERVAL", 30),
+            json_file=crawler.settings.get("METRICS_JSON_FILE"),
+            port=crawler.settings.getint("METRICS_PORT"),
+            top_domains=crawler.settings.getint("METRICS_TOP_DOMAINS", 20),
+        )
+        crawler.signals.connect(extension.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(extension.spider_closed, signal=signals.spider_closed)
+        crawler.signals.connect(
+            extension.response_received, signal=signals.response_received
+        )
+        return extension
+
+    def spider_opened(self, spider: scrapy.Spider) -> None:
+        """
+        start sampling and serving the metrics
+        """
+        from twisted.internet import reactor  # pylint: disable=import-outside-toplevel
+
+        self.spider = spider
+        self.metrics = getattr(spider, "metrics", None) or self.metrics
+        if isinstance(getattr(reactor, "resolver", None), TimedResolver):
+            reactor.resolver.metrics = self.metrics
+        self.sampler = task.LoopingCall(self.sample)
+        self.sampler.start(self.interval, now=False)
+        if self.port:
+            self.listening_port = reactor.listenTCP(
+                self.port, server.Site(MetricsResource(self)), interface="127.0.0.1"
+            )
+            spider.logger.info("serving crawl metrics on port %s", self.port)
+
+    def response_received(
+        self, response: scrapy.http.Response, request: scrapy.Request, spider
+    ) -> None:  # pylint: disable=unused-argument
+        """
+        add the download time of a response, cached responses have none
+        """
+        if "download_latency" in request.meta:
+            self.metrics.add_download(
+                response.url, request.meta["download_latency"], response.status
+            )
+
+    def sample(self) -> None:
+        """
+        sample the queue depth and the requests in flight, and write the metrics
+        """
+        stats = self.crawler.stats
+        self.metrics.gauges["scheduler_queue_depth"] = stats.get_value(
+            "scheduler/enqueued", 0
+        ) - stats.get_value("scheduler/dequeued", 0)
+        self.metrics.gauges["in_flight_requests"] = len(
+            self.crawler.engine.downloader.active
+        )
+        self.metrics.gauges["items_scraped"] = stats.get_value("item_scraped_count", 0)
+        if self.json_file is not None:
+            self.json_file.parent.mkdir(parents=True, exist_ok=True)
+            temp_file = self.json_file.with_suffix(".tmp")
+            temp_file.write_text(json.dumps(self.summary(), indent=2))
+            temp_file.replace(self.json_file)
+
+    def summary(self) -> dict:
+        """
+        Returns: the metrics summary with the pattern counters
+        """
+        summary = self.metrics.summary(self.top_domains)
+        patterns = getattr(self.spider, "patterns", None)
+        if patterns is not None:
+            summary["patterns"] = patterns.stats()
+        return summary
+
+    def prometheus(self) -> str:
+        """
+        Returns: the metrics in the prometheus text format, with the pattern counters
+        """
+        lines = [self.metrics.prometheus(self.top_domains)]
+        patterns = getattr(self.spider, "patterns", None)
+        if patterns is not None:
+            for key in ("calls", "hits", "seconds"):
+                lines.append(f"# TYPE mondu_pattern_{key}_total counter\n")
+                lines += [
+                    f'mondu_pattern_{key}_total{{pattern="{name}"}} {values[key]}\n'
+                    for name, values in patterns.stats().items()
+                ]
+        return "".join(lines)
+
+    def spider_closed(self, spider: scrapy.Spider) -> None:
+        """
+        write the final metrics, log the slowest stages and domains, and stop
+        sampling and serving
+        """
+        if self.sampler is not None and self.sampler.running:
+            self.sampler.stop()
+        if self.listening_port is not None:
+            self.listening_port.stopListening()
+        self.sample()
+        summary = self.summary()
+        for name, timer in sorted(
+            summary["timers"].items(), key=lambda item: -item[1]["seconds"]
+        ):
+            spider.logger.info(
+                "stage %s: %s calls, %.2f seconds, slowest %.3f seconds",
+                name,
+                timer["count"],
+                timer["seconds"],
+                timer["max_seconds"],
+            )
+        for name, times in list(summary["slowest_domains"].items())[:5]:
+            spider.logger.info("slow domain %s: %s", name, times)
+
+
+class TimedResolver(CachingThreadedResolver):
+    """
+    the default caching dns resolver of scrapy, timing the lookups missing the
+    cache as the dns stage of the crawl metrics. the resolver is shared by all
+    crawls of a process, CrawlMetricsExtension hands it the metrics of its crawl
+    """
+
+    metrics: Optional[CrawlMetrics] = None
+
+    def getHostByName(self, name: str, timeout=()):  # pylint: disable=invalid-name
+        """
+        Returns: a deferred fired with the address of name
+        """
+        if name in dnscache or self.metrics is None:
+            return super().getHostByName(name, timeout)
+        started = time.perf_counter()
+        deferred = super().getHostByName(name, timeout)
+        deferred.addBoth(self._lookup_done, started)
+        return deferred
+
+    def _lookup_done(self, result, started: float):
+        self.metrics.add("dns", time.perf_counter() - started)
+        if isinstance(result, Failure):
+            self.metrics.gauges["dns_failures"] = (
+                self.metrics.gauges.get("dns_failures", 0) + 1
+            )
+        return result
@@ -0,0 +1,603 @@
+""" Crawl a lead list in shards of domains, on several worker processes and nodes
+
+on one node, crawl with 8 worker processes and build the report:
+    pipenv run python mondu_website_scrapper/spiders/catch_fish_scraper.py \
+        --no-use-cache --distributed-workers 8
+on several nodes sharing FILE_FOLDER, e.g. over nfs, fill the queue once, start
+workers on every node, then merge the shards and build the report on one node:
+    pipenv run python -m mondu_website_scrapper.distributed enqueue --use-gsheet
+    pipenv run python -m mondu_website_scrapper.distributed work --workers 8
+    pipenv run python -m mondu_website_scrapper.distributed merge
+    pipenv run python mondu_website_scrapper/spiders/catch_fish_scraper.py --use-cache
+the queue is a folder, or a redis compatible server given as --queue redis://host
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import shutil
+import socket
+import sqlite3
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, wait
+from multiprocessing import get_context
+from pathlib import Path
+from typing import Iterable, Iterator, Optional, Union
+from urllib.parse import urlparse
+
+from scrapy.utils.project import get_project_settings
+
+from mondu_website_scrapper.company_aggregates import AGGREGATE_SCHEMAS
+from mondu_website_scrapper.item_storage import ITEM_SCHEMAS, concat_item_files
+from mondu_website_scrapper.start_url_feed import StartUrlFeed, lead_url_sources
+
+settings = get_project_settings()
+
+
+def shard_of(url: str, shards: int) -> int:
+    """
+    the shard of a url by a stable hash of its host name, all pages of a domain are
+    crawled by the same worker so per domain limits hold across workers
+
+    Returns: the shard number
+    """
+    host = (urlparse(url).hostname or "").removeprefix("www.")
+    digest = hashlib.sha1(host.encode("utf-8")).digest()  # nosec B324
+    return int.from_bytes(digest[:8], "big") % shards
+
+
+def shard_urls(urls: Iterable[str], shards: int) -> Iterator[tuple[int, list[str]]]:
+    """
+    split urls into shards while streaming them into a temporary sqlite file, so
+    only the urls of one shard are held in memory at a time
+
+    Yields: the shard number and the urls of every shard having any, in shard order,
+    duplicated urls are kept once
+    """
+    with tempfile.TemporaryDirectory() as folder:
+        connection = sqlite3.connect(Path(folder) / "shards.sqlite")
+        try:
+            connection.execute("PRAGMA journal_mode=OFF")
+            connection.execute("PRAGMA synchronous=OFF")
+            connection.execute(
+                "CREATE TABLE urls (url TEXT PRIMARY KEY, shard INTEGER NOT NULL)"
+            )
+            connection.executemany(
+                "INSERT OR IGNORE INTO urls VALUES (?, ?)",
+                ((url, shard_of(url, shards)) for url in urls),
+            )
+            connection.execute("CREATE INDEX shard_index ON urls (shard)")
+            shard_numbers = [
+                shard
+                for (shard,) in connection.execute(
+                    "SELECT DISTINCT shard FROM urls ORDER BY shard"
+                ).fetchall()
+            ]
+            for shard in shard_numbers:
+                yield shard, [
+                    url
+                    for (url,) in connection.execute(
+                        "SELECT url FROM urls WHERE shard = ? ORDER BY rowid", (shard,)
+                    )
+                ]
+        finally:
+            connection.close()
+
+
+def shard_folder(output_folder: Path, shard: int) -> Path:
+    """
+    Returns: the folder the item files of a shard are written to
+    """
+    return output_folder / f"shard-{shard:05d}"
+
+
+class FileShardQueue:
+    """
+    shards waiting to be crawled as json files in a folder all nodes can reach.
+    a worker claims a shard by moving its file from pending to claimed, the move
+    is atomic so only one worker gets it, and moves it to done once crawled.
+    the modification time of a claimed file is its lease, renewed by the worker
+    while crawling. a claimed shard not renewed for lease_secs, e.g. of a killed
+    worker or node, is moved back to pending by the next claim
+    """
+
+    def __init__(self, folder: Union[Path, str], lease_secs: int = 600):
+        self.folder = Path(folder)
+        self.lease_secs = lease_secs
+        self.states = {
+            state: self.folder / state for state in ("pending", "claimed", "done")
+        }
+        for state_folder in self.states.values():
+            state_folder.mkdir(parents=True, exist_ok=True)
+
+    def _file(self, state: str, shard: int) -> Path:
+        return self.states[state] / f"shard-{shard:05d}.json"
+
+    def clear(self) -> None:
+        """
+        forget all shards
+        """
+        for state_folder in self.states.values():
+            for file in state_folder.glob("*.json"):
+                file.unlink(missing_ok=True)
+
+    def put(self, shard: int, urls: list[str]) -> None:
+        """
+        queue the urls of a shard
+        """
+        tmp_file = self.folder / f".shard-{shard:05d}.json.tmp"
+        tmp_file.write_text(json.dumps(urls), encoding="utf-8")
+        tmp_file.replace(self._file("pending", shard))
+
+    def requeue_expired(self) -> int:
+        """
+        move claimed shards whose lease expired back to pending
+
+        Returns: the number of shards moved back
+        """
+        requeued = 0
+        for file in self.states["claimed"].glob("*.json"):
+            try:
+                expired = time.time() - file.stat().st_mtime > self.lease_secs
+                if expired:
+                    os.rename(file, self.states["pending"] / file.name)
+            except FileNotFoundError:
+                # done, released or requeued by another worker meanwhile
+                continue
+            if expired:
+                logging.warning("lease of %s expired, queued again", file.stem)
+                requeued += 1
+        return requeued
+
+    def claim(self, worker: str) -> Optional[tuple[int, list[str]]]:
+        """
+        take the next pending shard, after putting back the shards whose lease
+        expired, worker is only logged
+
+        Returns: the shard number and its urls, None if no shard is pending
+        """
+        self.requeue_expired()
+        for file in sorted(self.states["pending"].glob("*.json")):
+            claimed_file = self.states["claimed"] / file.name
+            try:
+                os.rename(file, claimed_file)
+            except FileNotFoundError:
+                # another worker claimed it first
+                continue
+            # a move keeps the modification time, the lease starts now
+            os.utime(claimed_file)
+            shard = int(file.stem.removeprefix("shard-"))
+            logging.info("%s claimed shard %s", worker, shard)
+            return shard, json.loads(claimed_file.read_text(encoding="utf-8"))
+        return None
+
+    def renew(self, shard: int) -> None:
+        """
+        extend the lease of a claimed shard
+        """
+        try:
+            os.utime(self._file("claimed", shard))
+        except FileNotFoundError:
+            logging.warning("lease of shard %s was lost", shard)
+
+    def done(self, shard: int) -> None:
+        """
+        mark a claimed shard as crawled
+        """
+        try:
+            self._file("claimed", shard).replace(self._file("done", shard))
+        except FileNotFoundError:
+            logging.warning("lease of shard %s was lost before it was done", shard)
+
+    def release(self, shard: int) -> None:
+        """
+        put a claimed shard back, e.g. after its crawl failed
+        """
+        try:
+            self._file("claimed", shard).replace(self._file("pending", shard))
+        except FileNotFoundError:
+            logging.warning("lease of shard %s was lost before its release", shard)
+
+    def remaining(self) -> int:
+        """
+        Returns: the number of pending and claimed shards
+        """
+        return sum(
+            1
+            for state in ("pending", "claimed")
+            for _ in self.states[state].glob("*.json")
+        )
+
+
+class RedisShardQueue:
+    """
+    shards waiting to be crawled in lists of a redis compatible server. client is
+    anything with the lpush, rpoplpush, lrem, llen, delete, hset, hdel and
+    hgetall commands of redis.Redis, e.g. a local stand-in when there is no
+    server.
+    the leases hash keeps the expiry time of every claimed shard, renewed by the
+    worker while crawling. a claimed shard whose lease expired, e.g. of a killed
+    worker or node, is moved back to pending by the next claim
+    """
+
+    def __init__(
+        self,
+        client,
+        name: str = "mondu_website_scrapper:shards",
+        lease_secs: int = 600,
+    ):
+        self.client = client
+        self.pending = f"{name}:pending"
+        self.claimed = f"{name}:claimed"
+        self.leases = f"{name}:leases"
+        self.lease_secs = lease_secs
+        self.payloads: dict[int, bytes] = {}
+
+    @classmethod
+    def from_url(cls, url: str, lease_secs: int = 600) -> "RedisShardQueue":
+        """
+        connect to the server at a redis:// url, needs the redis package
+
+        Returns: RedisShardQueue
+        """
+        try:
+            import redis  # pylint: disable=import-outside-toplevel
+        except ImportError as error:
+            raise ImportError(
+                "a redis shard queue needs the redis package, pip install redis"
+            ) from error
+        return cls(redis.Redis.from_url(url), lease_secs=lease_secs)
+
+    def clear(self) -> None:
+        """
+        forget all shards
+        """
+        self.client.delete(self.pending, self.claimed, self.leases)
+
+    def put(self, shard: int, urls: list[str]) -> None:
+        """
+        queue the urls of a shard
+        """
+        self.client.lpush(self.pending, json.dumps({"shard": shard, "urls": urls}))
+
+    def requeue_expired(self) -> int:
+        """
+        move claimed shards whose lease expired back to pending, lrem removes a
+        shard for only one of several workers doing so at the same time
+
+        Returns: the number of shards moved back
+        """
+        requeued = 0
+        for payload, expires in self.client.hgetall(self.leases).items():
+            if float(expires) > time.time():
+                continue
+            self.client.hdel(self.leases, payload)
+            if self.client.lrem(self.claimed, 1, payload):
+                self.client.lpush(self.pending, payload)
+                logging.warning(
+                    "lease of shard %s expired, queued again",
+                    json.loads(payload)["shard"],
+                )
+                requeued += 1
+        return requeued
+
+    def claim(self, worker: str) -> Optional[tuple[int, list[str]]]:
+        """
+        take the next pending shard, after putting back the shards whose lease
+        expired, worker is only logged
+
+        Returns: the shard number and its urls, None if no shard is pending
+        """
+        self.requeue_expired()
+        payload = self.client.rpoplpush(self.pending, self.claimed)
+        if payload is None:
+            return None
+        self.client.hset(self.leases, payload, time.time() + self.lease_secs)
+        entry = json.loads(payload)
+        self.payloads[entry["shard"]] = payload
+        logging.info("%s claimed shard %s", worker, entry["shard"])
+        return entry["shard"], entry["urls"]
+
+    def renew(self, shard: int) -> None:
+        """
+        extend the lease of a claimed shard
+        """
+        self.client.hset(
+            self.leases, self.payloads[shard], time.time() + self.lease_secs
+        )
+
+    def done(self, shard: int) -> None:
+        """
+        mark a claimed shard as crawled
+        """
+        payload = self.payloads.pop(shard)
+        self.client.hdel(self.leases, payload)
+        self.client.lrem(self.claimed, 1, payload)
+
+    def release(self, shard: int) -> None:
+        """
+        put a claimed shard back, e.g. after its crawl failed
+        """
+        payload = self.payloads.pop(shard)
+        self.client.hdel(self.leases, payload)
+        if self.client.lrem(self.claimed, 1, payload):
+            self.client.lpush(self.pending, payload)
+
+    def remaining(self) -> int:
+        """
+        Returns: the number of pending and claimed shards
+        """
+        return self.client.llen(self.pending) + self.client.llen(self.claimed)
+
+
+def open_queue(location: str) -> Union[FileShardQueue, RedisShardQueue]:
+    """
+    Returns: a RedisShardQueue for redis:// and rediss:// urls, otherwise a
+    FileShardQueue in the folder, with leases of DISTRIBUTED_LEASE_SECS
+    """
+    lease_secs = settings.getint("DISTRIBUTED_LEASE_SECS")
+    if location.startswith(("redis://", "rediss://")):
+        return RedisShardQueue.from_url(location, lease_secs=lease_secs)
+    return FileShardQueue(location, lease_secs=lease_secs)
+
+
+def lead_urls(
+    use_gsheet: bool,
+    external_urls: Optional[list[str]] = None,
+    input_file: Optional[str] = None,
+) -> StartUrlFeed:
+    """
+    the start urls of a crawl, the same LeadSpider would crawl
+
+    Returns: a feed of the external urls if given, otherwise of the urls of the
+    input file, the gsheet or START_URLS
+    """
+    return StartUrlFeed(
+        lead_url_sources(settings, use_gsheet, external_urls, input_file)
+    )
+
+
+def enqueue(
+    queue: Union[FileShardQueue, RedisShardQueue],
+    urls: Iterable[str],
+    shards: int,
+    output_folder: Path,
+) -> int:
+    """
+    start a distributed crawl, the queue and the shard outputs of an earlier crawl
+    are removed. the urls are streamed into their shards, see shard_urls
+
+    Returns: the number of shards queued
+    """
+    queue.clear()
+    shutil.rmtree(output_folder, ignore_errors=True)
+    queued, queued_urls = 0, 0
+    for shard, shard_url_list in shard_urls(urls, shards):
+        queue.put(shard, shard_url_list)
+        queued += 1
+        queued_urls += len(shard_url_list)
+    logging.info("queued %s urls in %s shards", queued_urls, queued)
+    return queued
+
+
+def crawl_shard(
+    shard: int,
+    urls: list[str],
+    output_folder: Path,
+    overrides: Optional[dict] = None,
+) -> dict:
+    """
+    crawl the urls of one shard with LeadSpider into the folder of the shard, with
+    the settings in overrides changed. the shard gets its own http cache and no
+    metrics port, so workers share no files. a shard queued again after its lease
+    expired starts from scratch. runs in a fresh process per shard as the reactor
+    cannot be restarted
+
+    Returns: the shard, its number of urls and the crawl stats
+    """
+    # pylint: disable=import-outside-toplevel
+    from scrapy.crawler import CrawlerProcess
+
+    from mondu_website_scrapper.spiders.catch_fish_scraper import LeadSpider
+    from mondu_website_scrapper.spiders.catch_fish_scraper import (
+        settings as spider_settings,
+    )
+
+    for name, value in (overrides or {}).items():
+        spider_settings.set(name, value)
+    folder = shard_folder(output_folder, shard)
+    spider_settings.set("FILE_FOLDER", folder)
+    spider_settings.set("COMPANY_AGGREGATES_FOLDER", folder / "company_aggregates")
+    spider_settings.set("METRICS_JSON_FILE", folder / "crawl_metrics.json")
+    spider_settings.set("CHECKPOINT_FOLDER", folder / "checkpoint")
+    spider_settings.set("METRICS_PORT", 0)
+    spider_settings.set(
+        "HTTPCACHE_DIR", str(Path(spider_settings["HTTPCACHE_DIR"]) / f"shard-{shard}")
+    )
+    process = CrawlerProcess(spider_settings)
+    crawler = process.create_crawler(LeadSpider)
+    process.crawl(crawler, use_gsheet=False, external_urls=urls, fresh_start=True)
+    process.start()
+    stats = crawler.stats.get_stats()
+    return {
+        "shard": shard,
+        "urls": len(urls),
+        "responses": stats.get("downloader/response_count", 0),
+        "items": stats.get("item_scraped_count", 0),
+    }
+
+
+def work(
+    queue_location: str,
+    output_folder: Path,
+    worker: Optional[str] = None,
+    overrides: Optional[dict] = None,
+) -> int:
+    """
+    crawl shards of the queue until none is pending, each in a fresh process. the
+    lease of a shard is renewed while it is crawled, and a shard whose crawl
+    failed is put back for another worker
+
+    Returns: the number of shards crawled
+    """
+    worker = worker or f"{socket.gethostname()}-{os.getpid()}"
+    queue = open_queue(queue_location)
+    context = get_context("spawn")
+    crawled = 0
+    while (claimed := queue.claim(worker)) is not None:
+        shard, urls = claimed
+        try:
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+                future = pool.submit(crawl_shard, shard, urls, output_folder, overrides)
+                while not wait([future], timeout=queue.lease_secs / 3).done:
+                    queue.renew(shard)
+                result = future.result()
+        except BaseException:
+            queue.release(shard)
+            raise
+        queue.done(shard)
+        logging.info("%s crawled %s", worker, result)
+        crawled += 1
+    return crawled
+
+
+def run_workers(
+    queue_location: str,
+    output_folder: Path,
+    workers: int,
+    overrides: Optional[dict] = None,
+) -> int:
+    """
+    run workers processes on this node until the queue is empty
+
+    Returns: the number of shards crawled
+    """
+    context = get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        return sum(
+            pool.map(
+                work,
+                [queue_location] * workers,
+                [output_folder] * workers,
+                [f"{socket.gethostname()}-worker-{index}" for index in range(workers)],
+                [overrides] * workers,
+            )
+        )
+
+
+def merge_shards(
+    output_folder: Path,
+    file_folder: Path,
+    aggregates_folder: Path,
+    batch_size: int = 65536,
+) -> dict[str, int]:
+    """
+    merge the item files and the company aggregates of all shards into file_folder
+    and aggregates_folder, where CreateReportDataSet reads them. shards hold
+    different domains, so the aggregates of a company are all in one shard and
+    concatenating them is enough
+
+    Returns: the number of merged rows of every item file
+    """
+    file_folder.mkdir(parents=True, exist_ok=True)
+    aggregates_folder.mkdir(parents=True, exist_ok=True)
+    shard_folders = sorted(output_folder.glob("shard-*"))
+    merged = {}
+    for name, schema in ITEM_SCHEMAS.items():
+        merged[name] = concat_item_files(
+            [folder / f"{name}.parquet" for folder in shard_folders],
+            file_folder / f"{name}.parquet",
+            schema,
+            batch_size,
+        )
+    for name, schema in AGGREGATE_SCHEMAS.items():
+        concat_item_files(
+            [
+                folder / "company_aggregates" / f"{name}.parquet"
+                for folder in shard_folders
+            ],
+            aggregates_folder / f"{name}.parquet",
+            schema,
+            batch_size,
+        )
+    logging.info("merged %s shards: %s", len(shard_folders), merged)
+    return merged
+
+
+def crawl_distributed(
+    urls: Iterable[str], workers: int, overrides: Optional[dict] = None
+) -> None:
+    """
+    crawl the urls on workers processes of this node, with the settings in
+    overrides changed, and merge the shards into the item files and company
+    aggregates of a single crawl
+    """
+    output_folder = settings["DISTRIBUTED_OUTPUT_FOLDER"]
+    queue_location = str(settings["DISTRIBUTED_QUEUE"])
+    enqueue(
+        open_queue(queue_location),
+        urls,
+        settings.getint("DISTRIBUTED_SHARDS"),
+        output_folder,
+    )
+    run_workers(queue_location, output_folder, workers, overrides)
+    merge_shards(
+        output_folder, settings["FILE_FOLDER"], settings["COMPANY_AGGREGATES_FOLDER"]
+    )
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser()
+    parser.add_argument("command", choices=["enqueue", "work", "merge"])
+    parser.add_argument(
+        "--queue",
+        help="queue folder or redis:// url, DISTRIBUTED_QUEUE by default",
+        default=str(settings["DISTRIBUTED_QUEUE"]),
+    )
+    parser.add_argument(
+        "--shards",
+        help="number of shards to split the urls into",
+        type=int,
+        default=settings.getint("DISTRIBUTED_SHARDS"),
+    )
+    parser.add_argument(
+        "--workers",
+        help="worker processes of this node",
+        type=int,
+        default=os.cpu_count(),
+    )
+    parser.add_argument(
+        "--use-gsheet",
+        help="enqueue the urls of the gsheet instead of START_URLS",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--external-scrape-urls",
+        help="enqueue these urls",
+        nargs="+",
+        type=str,
+    )
+    parser.add_argument(
+        "--input-file",
+        help="enqueue the urls of a csv, parquet or text file, - for stdin",
+        type=str,
+    )
+    args = parser.parse_args()
+    if args.command == "enqueue":
+        enqueue(
+            open_queue(args.queue),
+            lead_urls(args.use_gsheet, args.external_scrape_urls, args.input_file),
+            args.shards,
+            settings["DISTRIBUTED_OUTPUT_FOLDER"],
+        )
+    elif args.command == "work":
+        run_workers(args.queue, settings["DISTRIBUTED_OUTPUT_FOLDER"], args.workers)
+    else:
+        merge_shards(
+            settings["DISTRIBUTED_OUTPUT_FOLDER"],
+            settings["FILE_FOLDER"],
+            settings["COMPANY_AGGREGATES_FOLDER"],
+        )
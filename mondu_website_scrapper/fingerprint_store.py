@@ -0,0 +1,194 @@
+""" Versioned on-disk store of the wappalyzer fingerprint database"""
+import hashlib
+import json
+import logging
+import os
+import pickle  # nosec B403
+import re
+import tempfile
+import threading
+from importlib.util import find_spec
+from pathlib import Path
+from typing import Optional, Union
+
+DEFAULT_STORE_FOLDER = Path.home() / ".cache" / "mondu_website_scrapper" / "wappalyzer"
+# format of the pickled Wappalyzer, pickles of another format are prepared again
+PICKLE_FORMAT = "lazy"
+# what wappalyzer compiles patterns it cannot compile to, a regex never matching
+NEVER_MATCHING = r"(?!x)x"
+
+
+def get_bundled_technologies_file() -> Path:
+    """
+    locate the technologies.json shipped with python-Wappalyzer without importing it
+
+    Returns: path to the bundled technologies.json
+    """
+    spec = find_spec("Wappalyzer")
+    return Path(spec.submodule_search_locations[0]) / "data" / "technologies.json"
+
+
+class LazyPattern(dict):
+    """
+    a prepared wappalyzer pattern whose regex is compiled when it is first used.
+    wappalyzer only uses the header and meta patterns of headers and meta tags a
+    page has, so many of them are never compiled. the pickle of a lazy pattern
+    holds no regex, so loading a pickled Wappalyzer compiles nothing
+    """
+
+    def __missing__(self, key: str) -> re.Pattern:
+        if key != "regex":
+            raise KeyError(key)
+        try:
+            regex = re.compile(self["string"], re.I)
+        except re.error:
+            regex = re.compile(NEVER_MATCHING)
+        self["regex"] = regex
+        return regex
+
+
+def prepare_lazy_pattern(pattern: str) -> LazyPattern:
+    """
+    split a wappalyzer pattern into its regex and its version and confidence
+    attributes like Wappalyzer._prepare_pattern, without compiling the regex
+
+    Returns: the prepared pattern
+    """
+    expression, *attributes = pattern.split("\\;")
+    prepared = LazyPattern(string=expression)
+    for attribute in attributes:
+        key, separator, value = attribute.partition(":")
+        if separator:
+            prepared[key] = value
+    return prepared
+
+
+def _atomic_write(file_path: Path, data: bytes) -> None:
+    """
+    write bytes to a temporary file first and move it in place,
+    so that concurrent workers never read a half written file
+    """
+    with tempfile.NamedTemporaryFile(dir=file_path.parent, delete=False) as file:
+        file.write(data)
+    os.replace(file.name, file_path)
+
+
+class WappalyzerFingerprintStore:
+    """
+    keep versioned copies of the wappalyzer technologies database on disk,
+    next to a pickled Wappalyzer instance prepared from it, with LazyPattern
+    patterns.
+
+    the version of a database is the short sha256 of its technologies.json, so
+    the same fingerprints are only prepared once and a crawl can be pinned to a
+    known version. nothing is read before load() is called for the first page.
+    """
+
+    def __init__(
+        self,
+        store_folder: Union[Path, str] = DEFAULT_STORE_FOLDER,
+        version: Optional[str] = None,
+        technologies_file: Optional[Union[Path, str]] = None,
+    ):
+        self.store_folder = Path(store_folder)
+        self.version = version
+        self.technologies_file = technologies_file
+        self._wappalyzer = None
+        self._lock = threading.Lock()
+
+    def __getstate__(self) -> dict:
+        # only the configuration is shipped to worker processes
+        state = self.__dict__.copy()
+        state["_wappalyzer"] = None
+        state["_lock"] = None
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def _technologies_path(self, version: str) -> Path:
+        return self.store_folder / f"technologies-{version}.json"
+
+    def _pickle_path(self, version: str) -> Path:
+        return self.store_folder / f"wappalyzer-{version}.{PICKLE_FORMAT}.pickle"
+
+    def available_versions(self) -> list[str]:
+        """
+        list fingerprint versions stored on disk
+
+        Returns: a sorted list of versions
+        """
+        return sorted(
+            path.stem.removeprefix("technologies-")
+            for path in self.store_folder.glob("technologies-*.json")
+        )
+
+    def add(self, technologies_file: Union[Path, str, None] = None) -> str:
+        """
+        copy a technologies.json into the store, the bundled one by default
+
+        Returns: version of the stored database
+        """
+        if technologies_file is None:
+            technologies_file = get_bundled_technologies_file()
+        contents = Path(technologies_file).read_bytes()
+        version = hashlib.sha256(contents).hexdigest()[:12]
+
+        technologies_path = self._technologies_path(version)
+        if not technologies_path.exists():
+            self.store_folder.mkdir(parents=True, exist_ok=True)
+            _atomic_write(technologies_path, contents)
+            logging.info("stored wappalyzer fingerprints version %s", version)
+        return version
+
+    def _build(self, version: str) -> object:
+        """
+        prepare a Wappalyzer instance from a stored technologies.json with lazy
+        patterns and pickle it
+        """
+        from Wappalyzer import Wappalyzer  # pylint: disable=import-outside-toplevel
+
+        with open(self._technologies_path(version), "r", encoding="utf-8") as file:
+            technologies = json.load(file)
+        # pylint: disable=protected-access,unnecessary-dunder-call
+        wappalyzer = Wappalyzer.__new__(Wappalyzer)
+        # the instance attribute takes the place of the method while preparing
+        wappalyzer._prepare_pattern = prepare_lazy_pattern
+        wappalyzer.__init__(technologies["categories"], technologies["technologies"])
+        del wappalyzer._prepare_pattern
+        _atomic_write(
+            self._pickle_path(version),
+            pickle.dumps(wappalyzer, protocol=pickle.HIGHEST_PROTOCOL),
+        )
+        return wappalyzer
+
+    def _load(self) -> object:
+        version = self.version
+        if version is None:
+            version = self.add(self.technologies_file)
+        elif not self._technologies_path(version).exists():
+            raise FileNotFoundError(
+                f"wappalyzer fingerprints version {version} not found under "
+                f"{self.store_folder}, available: {self.available_versions()}"
+            )
+
+        pickle_path = self._pickle_path(version)
+        if pickle_path.exists():
+            logging.info("loading wappalyzer fingerprints version %s", version)
+            with open(pickle_path, "rb") as file:
+                return pickle.load(file)  # nosec B301
+        logging.info("preparing wappalyzer fingerprints version %s", version)
+        return self._build(version)
+
+    def load(self) -> object:
+        """
+        load the Wappalyzer instance, only the first call reads the store
+
+        Returns: a Wappalyzer instance
+        """
+        if self._wappalyzer is None:
+            with self._lock:
+                if self._wappalyzer is None:
+                    self._wappalyzer = self._load()
+        return self._wappalyzer
@@ -3,16 +3,18 @@ from pathlib import Path
 from typing import Union
 
 from mondu_website_scrapper.gsheet_api.gsheet_settings import (
-    CLIENT_SECRET_JSON,
+    EXPORT_BACKOFF_SECS,
+    EXPORT_CHUNK_ROWS,
     EXPORT_DATA_FOLDER,
-    SCOPES,
+    EXPORT_MAX_PARALLEL,
+    EXPORT_MAX_RETRIES,
+    EXPORT_PROGRESS_FILE,
     SPREADSHEET_NAME,
 )
+from mondu_website_scrapper.gsheet_api.sheet_exporter import SheetExporter
 from mondu_website_scrapper.gsheet_api.utils import (
-    create_worksheet,
-    get_gsheet_client,
-    get_gsheet_credential,
-    update_worksheet,
+    get_default_gsheet_client,
+    get_report_file_name,
 )
 
 
@@ -20,33 +22,42 @@ def export_report(
     export_data_folder: Union[Path, str],
     spreadsheet_name: str = None,
     worksheet_name: str = "Web-Scraper-Report",
-) -> None:
+    gsheet_client=None,
+) -> str:
     """
     export csv file into a pre-defined google sheet
-    1. create gsheet api client
+    1. use the shared gsheet api client, unless gsheet_client is given, e.g. the
+    FakeGsheetClient of the tests
     2. create a new worksheet named as Web-Scraper-Report-{timestamp in
-    format of year/month/day hour:min}
-    3. export the csv file * __report.csv under scraped_results into new created worksheet
+    format of year/month/day hour:min}, sized to the report
+    3. export the csv file * __report.csv under scraped_results into new created
+    worksheet in chunks of rows. if an earlier export of the same report failed,
+    it is resumed in its worksheet instead, see SheetExporter
 
+    Raises: FileNotFoundError if there is no report
+    Returns: the title of the worksheet
     """
     if spreadsheet_name is None:
         spreadsheet_name = SPREADSHEET_NAME
-    client_secret = get_gsheet_credential(client_secret_file=CLIENT_SECRET_JSON)
-    gsheet_client = get_gsheet_client(client_secret=client_secret, scopes=SCOPES)
+    if gsheet_client is None:
+        gsheet_client = get_default_gsheet_client()
+    report_file_path = get_report_file_name(Path(export_data_folder))
+    if report_file_path is None:
+        raise FileNotFoundError(f"no __report.csv in {export_data_folder}")
     now = datetime.now()
     dt_now = now.strftime("%Y/%m/%d %H:%M")
 
     current_worksheet_name = f"{worksheet_name}-{dt_now}"
 
-    worksheet_id = create_worksheet(
-        gsheet_client, spreadsheet_name=spreadsheet_name, title=current_worksheet_name
-    )
-    update_worksheet(
-        export_data_folder,
+    exporter = SheetExporter(
         gsheet_client,
-        spreadsheet_name=spreadsheet_name,
-        worksheet_id=worksheet_id,
+        progress_file=EXPORT_PROGRESS_FILE,
+        chunk_rows=EXPORT_CHUNK_ROWS,
+        max_parallel=EXPORT_MAX_PARALLEL,
+        max_retries=EXPORT_MAX_RETRIES,
+        backoff_secs=EXPORT_BACKOFF_SECS,
     )
+    return exporter.export(report_file_path, spreadsheet_name, current_worksheet_name)
 
 
 if __name__ == "__main__":
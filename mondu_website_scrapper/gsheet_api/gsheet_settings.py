@@ -12,4 +12,18 @@ SCOPES = [
 CLIENT_SECRET_JSON = Path(__file__).parent / "client_secret.json"
 EXPORT_DATA_FOLDER = Path.cwd().parent / "scraped_results"
 SPREADSHEET_NAME = "Mondu-Web-Scraper-Data-Import-Export"
+# snapshots of read worksheets, reused while a spreadsheet is not modified
+SNAPSHOT_FOLDER = EXPORT_DATA_FOLDER / "gsheet_snapshots"
+# rows per page and pages per request when reading a worksheet
+READ_PAGE_SIZE = 5000
+READ_PAGES_PER_CALL = 4
+# the report is exported in chunks of EXPORT_CHUNK_ROWS rows, at most
+# EXPORT_MAX_PARALLEL at a time, and failed calls are retried EXPORT_MAX_RETRIES
+# times waiting EXPORT_BACKOFF_SECS doubled every time. the chunks written are
+# recorded in EXPORT_PROGRESS_FILE, so a failed export resumes where it stopped
+EXPORT_CHUNK_ROWS = 5000
+EXPORT_MAX_PARALLEL = 4
+EXPORT_MAX_RETRIES = 5
+EXPORT_BACKOFF_SECS = 1.0
+EXPORT_PROGRESS_FILE = EXPORT_DATA_FOLDER / "gsheet_export_progress.json"
 ENV_FILE = os.path.join(Path(__file__).parent.parent, ".env")
@@ -1,34 +1,41 @@
+from typing import Optional
+
 import pandas as pd
-from gspread.exceptions import WorksheetNotFound
 
 from mondu_website_scrapper.gsheet_api.gsheet_settings import (
-    CLIENT_SECRET_JSON,
-    SCOPES,
+    READ_PAGE_SIZE,
+    READ_PAGES_PER_CALL,
+    SNAPSHOT_FOLDER,
     SPREADSHEET_NAME,
 )
-from mondu_website_scrapper.gsheet_api.utils import (
-    get_gsheet_client,
-    get_gsheet_credential,
-)
+from mondu_website_scrapper.gsheet_api.sheet_reader import SheetReader
+from mondu_website_scrapper.gsheet_api.utils import get_default_gsheet_client
 
 
 def read_from_gsheet(
-    input_columns: list,
+    input_columns: Optional[list],
     spreadsheet_name: str = None,
     worksheet_name: str = "Marketing-Input-Data",
+    gsheet_client=None,
 ) -> pd.DataFrame:
     """
-    read value from the given gsheet
+    read value from the given gsheet, all columns if input_columns is None.
+    only the given columns are read, in pages, and kept as a snapshot that is reused
+    until the spreadsheet is modified. see SheetReader for details.
+    the shared authorised client is used unless gsheet_client is given, e.g. the
+    FakeGsheetClient of the tests
 
+    Raises: WorksheetNotFound if the worksheet does not exist
     Returns: a dataframe
     """
     if spreadsheet_name is None:
         spreadsheet_name = SPREADSHEET_NAME
-    client_secret = get_gsheet_credential(client_secret_file=CLIENT_SECRET_JSON)
-    gsheet_client = get_gsheet_client(client_secret=client_secret, scopes=SCOPES)
-    spreadsheet = gsheet_client.open(spreadsheet_name)
-    if worksheet_name in [sheet.title for sheet in spreadsheet.worksheets()]:
-        input_worksheet = spreadsheet.worksheet(worksheet_name)
-        return pd.DataFrame(input_worksheet.get_all_records(), columns=input_columns)
-
-    raise WorksheetNotFound(f"{worksheet_name} not found under the given spreadsheet")
+    if gsheet_client is None:
+        gsheet_client = get_default_gsheet_client()
+    reader = SheetReader(
+        gsheet_client,
+        snapshot_folder=SNAPSHOT_FOLDER,
+        page_size=READ_PAGE_SIZE,
+        pages_per_call=READ_PAGES_PER_CALL,
+    )
+    return reader.read(spreadsheet_name, worksheet_name, input_columns)
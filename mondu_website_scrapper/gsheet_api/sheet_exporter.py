@@ -0,0 +1,242 @@
+""" Chunked export of a csv file into a worksheet, resumable after a failure"""
+import csv
+import json
+import logging
+import os
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import Callable, Iterator, Optional, Union
+
+from gspread.exceptions import APIError
+from gspread.utils import absolute_range_name, rowcol_to_a1
+from requests.exceptions import ConnectionError as RequestsConnectionError
+from requests.exceptions import Timeout
+
+from mondu_website_scrapper.gsheet_api.utils import open_spreadsheet
+
+# cells of all worksheets of a spreadsheet allowed by the sheets api
+MAX_SPREADSHEET_CELLS = 10_000_000
+# api errors worth retrying: rate limits and server errors
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+
+class SheetExporter:
+    """
+    export csv files into new worksheets of a spreadsheet.
+
+    1. the csv file is read once to count its rows and columns, and the worksheet
+    is created with exactly that many. a file over the cell limit of a spreadsheet
+    fails before anything is written.
+    2. the rows are streamed in chunks of chunk_rows rows, each written by its own
+    batch update, at most max_parallel at the same time. rate limited and failed
+    calls are retried max_retries times, waiting backoff_secs doubled every time.
+    3. the chunks written are recorded in progress_file. exporting the same csv
+    file after a failed export resumes in its worksheet with the chunks not written
+    yet. the progress file is removed once all chunks are written.
+
+    the client is a gspread client, or anything with the same methods, e.g.
+    FakeGsheetClient of the tests
+    """
+
+    def __init__(
+        self,
+        client,
+        progress_file: Union[Path, str],
+        chunk_rows: int = 5000,
+        max_parallel: int = 4,
+        max_retries: int = 5,
+        backoff_secs: float = 1.0,
+    ):
+        self.client = client
+        self.progress_file = Path(progress_file)
+        self.chunk_rows = chunk_rows
+        self.max_parallel = max_parallel
+        self.max_retries = max_retries
+        self.backoff_secs = backoff_secs
+        self._lock = threading.Lock()
+
+    def export(
+        self, csv_file: Union[Path, str], spreadsheet_name: str, worksheet_title: str
+    ) -> str:
+        """
+        export a csv file into a new worksheet titled worksheet_title, or into the
+        worksheet of an earlier failed export of the same file
+
+        Raises: ValueError if the csv file has more cells than a spreadsheet allows,
+        APIError if a call still fails after max_retries retries
+        Returns: the title of the worksheet
+        """
+        csv_file = Path(csv_file)
+        rows, cols = self._csv_size(csv_file)
+        if rows * cols > MAX_SPREADSHEET_CELLS:
+            raise ValueError(
+                f"{csv_file} has {rows * cols} cells, a spreadsheet holds at most "
+                f"{MAX_SPREADSHEET_CELLS}"
+            )
+        spreadsheet = self._call(open_spreadsheet, self.client, spreadsheet_name)
+        progress = self._load_progress(csv_file)
+        resumed = progress is not None
+        if progress is None:
+            progress = {
+                "csv_file": str(csv_file),
+                "signature": self._signature(csv_file),
+                "worksheet": worksheet_title,
+                "chunk_rows": self.chunk_rows,
+                "done": [],
+            }
+            self._save_progress(progress)
+        else:
+            logging.info(
+                "resuming export of %s into %s, %s chunks written",
+                csv_file,
+                progress["worksheet"],
+                len(progress["done"]),
+            )
+        self._add_worksheet(spreadsheet, progress["worksheet"], rows, cols, resumed)
+
+        done = set(progress["done"])
+        pending: set[Future] = set()
+        with ThreadPoolExecutor(max_workers=self.max_parallel) as executor:
+            for index, chunk in enumerate(
+                self._chunks(csv_file, progress["chunk_rows"])
+            ):
+                if index in done:
+                    continue
+                if len(pending) >= self.max_parallel:
+                    finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        future.result()
+                pending.add(
+                    executor.submit(
+                        self._write_chunk, spreadsheet, progress, index, chunk
+                    )
+                )
+            for future in wait(pending).done:
+                future.result()
+        self.progress_file.unlink(missing_ok=True)
+        logging.info("exported %s rows of %s", rows, csv_file)
+        return progress["worksheet"]
+
+    @staticmethod
+    def _csv_size(csv_file: Path) -> tuple[int, int]:
+        """
+        Returns: the number of rows and the most columns of any row of a csv file
+        """
+        rows, cols = 0, 0
+        with open(csv_file, "r", encoding="utf-8", newline="") as file:
+            for row in csv.reader(file):
+                rows += 1
+                cols = max(cols, len(row))
+        return rows, cols
+
+    @staticmethod
+    def _chunks(csv_file: Path, chunk_rows: int) -> Iterator[list[list[str]]]:
+        """
+        Yields: the rows of a csv file in chunks of chunk_rows rows
+        """
+        chunk = []
+        with open(csv_file, "r", encoding="utf-8", newline="") as file:
+            for row in csv.reader(file):
+                chunk.append(row)
+                if len(chunk) == chunk_rows:
+                    yield chunk
+                    chunk = []
+        if chunk:
+            yield chunk
+
+    def _add_worksheet(
+        self, spreadsheet, title: str, rows: int, cols: int, resumed: bool
+    ) -> None:
+        """
+        create the worksheet of rows times cols cells, unless the resumed export
+        created it already. a worksheet existing when the call was retried was
+        created by the attempt that failed, e.g. with a timeout after the sheets
+        api added it
+
+        Raises: APIError if the title is taken by another worksheet
+        """
+        attempts = 0
+
+        def add_worksheet():
+            nonlocal attempts
+            attempts += 1
+            return spreadsheet.add_worksheet(
+                title=title, rows=max(rows, 1), cols=max(cols, 1)
+            )
+
+        try:
+            self._call(add_worksheet)
+        except APIError as error:
+            if "already exists" not in str(error) or not (resumed or attempts > 1):
+                raise
+            logging.info("worksheet %s was created already", title)
+
+    def _write_chunk(
+        self, spreadsheet, progress: dict, index: int, chunk: list[list[str]]
+    ) -> None:
+        """
+        write the rows of a chunk, and record it as written
+        """
+        first_row = index * progress["chunk_rows"] + 1
+        last_row = first_row + len(chunk) - 1
+        cols = max(len(row) for row in chunk) or 1
+        range_name = absolute_range_name(
+            progress["worksheet"], f"A{first_row}:{rowcol_to_a1(last_row, cols)}"
+        )
+        self._call(
+            spreadsheet.values_batch_update,
+            body={
+                "valueInputOption": "USER_ENTERED",
+                "data": [{"range": range_name, "values": chunk}],
+            },
+        )
+        with self._lock:
+            progress["done"].append(index)
+            self._save_progress(progress)
+
+    def _call(self, method: Callable, *args, **kwargs):
+        """
+        call an api method, retrying rate limits, server and connection errors
+
+        Returns: the result of the method
+        """
+        for attempt in range(self.max_retries + 1):
+            try:
+                return method(*args, **kwargs)
+            except (APIError, RequestsConnectionError, Timeout) as error:
+                if attempt == self.max_retries or (
+                    isinstance(error, APIError) and error.code not in RETRY_STATUS_CODES
+                ):
+                    raise
+                delay = self.backoff_secs * 2**attempt * random.uniform(0.5, 1.5)
+                logging.info("retrying %s in %.1f seconds: %s", method, delay, error)
+                time.sleep(delay)
+        return None
+
+    @staticmethod
+    def _signature(csv_file: Path) -> list:
+        stat = csv_file.stat()
+        return [stat.st_size, stat.st_mtime_ns]
+
+    def _load_progress(self, csv_file: Path) -> Optional[dict]:
+        """
+        Returns: the progress of an earlier failed export of the csv file, None if
+        there is none or the file changed since
+        """
+        if not self.progress_file.exists():
+            return None
+        progress = json.loads(self.progress_file.read_text(encoding="utf-8"))
+        if progress["csv_file"] != str(csv_file) or progress[
+            "signature"
+        ] != self._signature(csv_file):
+            return None
+        return progress
+
+    def _save_progress(self, progress: dict) -> None:
+        self.progress_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file = self.progress_file.with_suffix(".tmp")
+        tmp_file.write_text(json.dumps(progress), encoding="utf-8")
+        os.replace(tmp_file, self.progress_file)
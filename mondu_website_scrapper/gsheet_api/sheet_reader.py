@@ -0,0 +1,196 @@
+""" Paged reads of worksheet columns, with a local snapshot per sheet revision"""
+import gzip
+import hashlib
+import json
+import logging
+import os
+import tempfile
+from pathlib import Path
+from typing import Iterator, Optional, Union
+
+import pandas as pd
+from gspread.exceptions import GSpreadException
+from gspread.utils import numericise_all, rowcol_to_a1
+
+from mondu_website_scrapper.gsheet_api.utils import open_spreadsheet
+
+
+def _short_hash(*values) -> str:
+    return hashlib.sha1(  # nosec B324
+        json.dumps(values, default=str).encode("utf-8")
+    ).hexdigest()[:16]
+
+
+class SheetReader:
+    """
+    read columns of worksheets with one authorised gsheet client.
+
+    1. the header row is read first, then only the block of columns between the
+    first and the last needed one, in pages of page_size rows with pages_per_call
+    pages per request, up to the last row of the grid of the worksheet. the api
+    leaves out the trailing blank rows of every page, so a short page does not
+    mean the sheet ends there.
+    2. the rows read are kept in snapshot_folder, keyed by the spreadsheet, the
+    worksheet, the columns and the last modified time of the spreadsheet. while the
+    spreadsheet is not modified, the rows are loaded from the snapshot without
+    reading the worksheet again.
+
+    values are numericised like get_all_records of gspread, and blank cells are
+    empty strings. the client is a gspread client, or anything with the same open,
+    worksheet, row_values and batch_get methods, e.g. FakeGsheetClient of the
+    tests.
+    """
+
+    def __init__(
+        self,
+        client,
+        snapshot_folder: Optional[Union[Path, str]] = None,
+        page_size: int = 5000,
+        pages_per_call: int = 4,
+    ):
+        self.client = client
+        self.snapshot_folder = Path(snapshot_folder) if snapshot_folder else None
+        self.page_size = page_size
+        self.pages_per_call = pages_per_call
+
+    def read(
+        self,
+        spreadsheet_name: str,
+        worksheet_name: str,
+        columns: Optional[list[str]] = None,
+    ) -> pd.DataFrame:
+        """
+        read columns of a worksheet, all columns if columns is None
+
+        Raises: WorksheetNotFound if the worksheet does not exist, GSpreadException
+        if a column is not in its header row
+        Returns: a dataframe
+        """
+        return pd.concat(
+            self.iter_read(spreadsheet_name, worksheet_name, columns),
+            ignore_index=True,
+        )
+
+    def iter_read(
+        self,
+        spreadsheet_name: str,
+        worksheet_name: str,
+        columns: Optional[list[str]] = None,
+    ) -> Iterator[pd.DataFrame]:
+        """
+        read columns of a worksheet page by page, all columns if columns is None.
+        the snapshot is written once the last page was read
+
+        Raises: WorksheetNotFound if the worksheet does not exist, GSpreadException
+        if a column is not in its header row
+        Yields: a dataframe of every page of page_size rows, at least one
+        """
+        spreadsheet = open_spreadsheet(self.client, spreadsheet_name)
+        snapshot = self._snapshot_file(
+            spreadsheet.id, worksheet_name, columns, spreadsheet.get_lastUpdateTime()
+        )
+        if snapshot is not None and snapshot.exists():
+            logging.info("loading %s from snapshot %s", worksheet_name, snapshot)
+            with gzip.open(snapshot, "rt", encoding="utf-8") as file:
+                data = json.load(file)
+            for start in range(0, max(len(data["rows"]), 1), self.page_size):
+                yield pd.DataFrame(
+                    data["rows"][start : start + self.page_size],
+                    columns=data["columns"],
+                )
+            return
+
+        worksheet = spreadsheet.worksheet(worksheet_name)
+        header_row = worksheet.row_values(1)
+        header = self._columns(worksheet.title, header_row, columns)
+        rows = []
+        for page in self._read_pages(worksheet, header_row, header):
+            rows.extend(page)
+            yield pd.DataFrame(page, columns=header)
+        logging.info("read %s rows of %s", len(rows), worksheet_name)
+        if not rows:
+            yield pd.DataFrame([], columns=header)
+        if snapshot is not None:
+            self._write_snapshot(snapshot, header, rows)
+
+    @staticmethod
+    def _columns(
+        title: str, header_row: list[str], columns: Optional[list[str]]
+    ) -> list[str]:
+        """
+        Raises: GSpreadException if a column is not in the header row
+        Returns: the columns to read, all columns of the header row if None
+        """
+        if columns is None:
+            return header_row
+        missing = [column for column in columns if column not in header_row]
+        if missing:
+            raise GSpreadException(f"columns {missing} not found in {title}")
+        return columns
+
+    def _read_pages(
+        self, worksheet, header_row: list[str], columns: list[str]
+    ) -> Iterator[list[list]]:
+        """
+        read the rows of the block of the columns, pages_per_call pages per request
+
+        Yields: the numericised rows of every page with any
+        """
+        if not columns:
+            return
+        indexes = [header_row.index(column) for column in columns]
+        first, last = min(indexes), max(indexes)
+        start = 2
+        while start <= worksheet.row_count:
+            ranges = []
+            for _ in range(self.pages_per_call):
+                if start > worksheet.row_count:
+                    break
+                end = min(start + self.page_size - 1, worksheet.row_count)
+                ranges.append(
+                    f"{rowcol_to_a1(start, first + 1)}:{rowcol_to_a1(end, last + 1)}"
+                )
+                start = end + 1
+            for page in worksheet.batch_get(ranges):
+                if page:
+                    yield [
+                        numericise_all(
+                            [
+                                row[index - first] if index - first < len(row) else ""
+                                for index in indexes
+                            ]
+                        )
+                        for row in page
+                    ]
+
+    def _snapshot_file(
+        self,
+        spreadsheet_id: str,
+        worksheet_name: str,
+        columns: Optional[list[str]],
+        revision: str,
+    ) -> Optional[Path]:
+        if self.snapshot_folder is None:
+            return None
+        return self.snapshot_folder / (
+            f"{_short_hash(spreadsheet_id, worksheet_name)}-"
+            f"{_short_hash(columns)}-{_short_hash(revision)}.json.gz"
+        )
+
+    def _write_snapshot(self, snapshot: Path, header: list[str], rows: list) -> None:
+        """
+        write the snapshot of a revision, and remove the snapshots of other
+        revisions of the worksheet
+        """
+        snapshot.parent.mkdir(parents=True, exist_ok=True)
+        sheet_key, _, revision_key = snapshot.name.split("-")
+        for old_snapshot in snapshot.parent.glob(f"{sheet_key}-*.json.gz"):
+            if old_snapshot.name.split("-")[2] != revision_key:
+                old_snapshot.unlink(missing_ok=True)
+        with tempfile.NamedTemporaryFile(dir=snapshot.parent, delete=False) as file:
+            file.write(
+                gzip.compress(
+                    json.dumps({"columns": header, "rows": rows}).encode("utf-8")
+                )
+            )
+        os.replace(file.name, snapshot)
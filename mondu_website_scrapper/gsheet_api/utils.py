@@ -1,34 +1,44 @@
 import json
-import logging
 import os
+import threading
+import weakref
+from functools import lru_cache
 from pathlib import Path
 from typing import Union
 
 import gspread
 from dotenv import find_dotenv, load_dotenv
-from gspread.exceptions import APIError
 from oauth2client.service_account import ServiceAccountCredentials
+from requests.adapters import HTTPAdapter
 
-from .gsheet_settings import ENV_FILE
+from .gsheet_settings import CLIENT_SECRET_JSON, ENV_FILE, EXPORT_MAX_PARALLEL, SCOPES
 
 load_dotenv(find_dotenv(ENV_FILE), verbose=True)
 
 GSHEET_PRIVATE_KEY_ID = os.getenv("GSHEET_PRIVATE_KEY_ID")
 GSHEET_PRIVATE_KEY = os.getenv("GSHEET_PRIVATE_KEY")
 
+# spreadsheets opened by every client, by title
+_spreadsheets: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+_spreadsheets_lock = threading.Lock()
+
+
+@lru_cache(maxsize=None)
+def _read_client_secret(client_secret_file: str) -> str:
+    with open(client_secret_file, "r", encoding="utf-8") as file:
+        return file.read()
+
 
 def get_gsheet_credential(client_secret_file: Union[Path, str]) -> dict:
     """
-    create gsheet credential json file by reading credentials from .env
+    create gsheet credential json file by reading credentials from .env. the file is
+    read once per process
 
     Returns: client credential json file
     """
-    # load_dotenv(os.path.join(Path(__file__).parent.parent, ".env"))
-
-    with open(client_secret_file, "r", encoding="utf-8") as file:
-        client_secret = json.load(file)
-        client_secret["private_key_id"] = GSHEET_PRIVATE_KEY_ID
-        client_secret["private_key"] = GSHEET_PRIVATE_KEY
+    client_secret = json.loads(_read_client_secret(str(client_secret_file)))
+    client_secret["private_key_id"] = GSHEET_PRIVATE_KEY_ID
+    client_secret["private_key"] = GSHEET_PRIVATE_KEY
 
     return client_secret
 
@@ -55,70 +65,48 @@ def get_gsheet_client(client_secret: Union[Path, dict], scopes: list[str]) -> di
     return gspread.authorize(credentials)
 
 
-def get_report_file_name(export_data_folder: Union[Path, str]) -> Path:
+@lru_cache(maxsize=None)
+def get_default_gsheet_client():
     """
-    get the report csv file from the export data folder
+    get the google sheet client authorised with the credentials of .env, once per
+    process. its session keeps the connections to google open and refreshes the
+    access token when it expires, so all gsheet_api entry points share it
 
-    Raises: raise error if file not found
-    Returns: file name
+    Returns: the shared google sheet client
     """
-
-    for file in os.listdir(export_data_folder):
-        if file.endswith("__report.csv"):
-            return export_data_folder / file
+    client_secret = get_gsheet_credential(client_secret_file=CLIENT_SECRET_JSON)
+    gsheet_client = get_gsheet_client(client_secret=client_secret, scopes=SCOPES)
+    # a pooled connection for every parallel export call
+    gsheet_client.http_client.session.mount(
+        "https://", HTTPAdapter(pool_maxsize=max(EXPORT_MAX_PARALLEL, 10))
+    )
+    return gsheet_client
 
 
-def create_worksheet(
-    gsheet_client: object,
-    spreadsheet_name: str,
-    title: str,
-    rows: int = 1000,
-    cols: int = 50,
-) -> str:
+def open_spreadsheet(gsheet_client, spreadsheet_name: str):
     """
-    create a new worksheet in the current spreadsheet
+    open a spreadsheet by its title, once per client. opening looks the title up
+    in google drive, the handle is reused afterwards as worksheets are fetched
+    from the api every time they are accessed
 
-    Returns: sheet id of the new created worksheet
+    Raises: SpreadsheetNotFound if there is no spreadsheet with the title
+    Returns: the spreadsheet
     """
-    spreadsheet = gsheet_client.open(spreadsheet_name)
+    with _spreadsheets_lock:
+        spreadsheets = _spreadsheets.setdefault(gsheet_client, {})
+        if spreadsheet_name not in spreadsheets:
+            spreadsheets[spreadsheet_name] = gsheet_client.open(spreadsheet_name)
+        return spreadsheets[spreadsheet_name]
 
-    try:
-        spreadsheet.add_worksheet(title=title, rows=rows, cols=cols)
-    except APIError as error:
 
-        logging.info("some error ocurred %s", error)
-    return spreadsheet.worksheet(title).id
-
-
-def update_worksheet(
-    export_data_folder: Union[Path, str],
-    gsheet_client: object,
-    spreadsheet_name: str,
-    worksheet_id: str,
-) -> dict:
-    """
-    update contents into worksheet
-    Returns: a dictionary of response dict
+def get_report_file_name(export_data_folder: Union[Path, str]) -> Path:
     """
+    get the report csv file from the export data folder
 
-    spreadsheet = gsheet_client.open(spreadsheet_name)
-
-    report_file_path = get_report_file_name(export_data_folder)
-
-    with open(report_file_path, "r", encoding="utf-8") as file:
-        contents = file.read()
-
-    body = {
-        "requests": [
-            {
-                "pasteData": {
-                    "coordinate": {"sheetId": worksheet_id},
-                    "data": contents,
-                    "type": "PASTE_NORMAL",
-                    "delimiter": ",",
-                }
-            }
-        ]
-    }
+    Raises: raise error if file not found
+    Returns: file name
+    """
 
-    return spreadsheet.batch_update(body=body)
+    for file in os.listdir(export_data_folder):
+        if file.endswith("__report.csv"):
+            return export_data_folder / file
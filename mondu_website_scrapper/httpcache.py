@@ -0,0 +1,194 @@
+""" Persistent http cache storage and policy for repeated lead runs"""
+import logging
+import sqlite3
+import zlib
+from pathlib import Path
+from time import time
+from typing import Optional
+
+import scrapy
+from scrapy.downloadermiddlewares.httpcache import HttpCacheMiddleware
+from scrapy.extensions.httpcache import RFC2616Policy
+from scrapy.http import Headers
+from scrapy.responsetypes import responsetypes
+from scrapy.utils.project import data_path
+from w3lib.http import headers_dict_to_raw, headers_raw_to_dict
+from w3lib.url import canonicalize_url
+
+# request meta key holding the time a cached response was stored
+CACHE_STORED_AT = "cache_stored_at"
+
+
+def normalize_cache_key(url: str) -> str:
+    """
+    normalize the url a response is cached under, so that urls only differing in
+    query argument order or fragments share a cache entry
+
+    Returns: the canonicalized url
+    """
+    return canonicalize_url(url)
+
+
+class SqliteCacheStorage:
+    """
+    keep cached responses with zlib compressed bodies in one sqlite file per
+    spider under HTTPCACHE_DIR, keyed by normalized url.
+    entries never expire here, freshness is decided by PageTypeTTLPolicy.
+    """
+
+    commit_every = 100
+
+    def __init__(self, settings: scrapy.settings.Settings):
+        self.cachedir = Path(data_path(settings["HTTPCACHE_DIR"], createdir=True))
+        self.compression_level = settings.getint("HTTPCACHE_COMPRESSION_LEVEL", 6)
+        self.db: Optional[sqlite3.Connection] = None
+        self._pending_writes = 0
+
+    def open_spider(self, spider: scrapy.Spider) -> None:
+        """
+        open the sqlite cache file of the spider and create its table
+        """
+        db_path = self.cachedir / f"{spider.name}.sqlite"
+        self.db = sqlite3.connect(db_path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS responses (
+                url TEXT PRIMARY KEY,
+                response_url TEXT NOT NULL,
+                status INTEGER NOT NULL,
+                headers BLOB NOT NULL,
+                body BLOB NOT NULL,
+                stored_at REAL NOT NULL
+            )
+            """
+        )
+        logging.info("Using sqlite http cache in %s", db_path)
+
+    def close_spider(self, spider) -> None:  # pylint: disable=unused-argument
+        """
+        write outstanding entries and close the cache file
+        """
+        self.db.commit()
+        self.db.close()
+
+    def retrieve_response(  # pylint: disable=unused-argument
+        self, spider, request: scrapy.Request
+    ) -> Optional[scrapy.http.Response]:
+        """
+        look up the cached response of a request, the time it was stored is kept
+        in the request meta for the cache policy
+
+        Returns: the cached response, None if the url is not cached
+        """
+        row = self.db.execute(
+            "SELECT response_url, status, headers, body, stored_at"
+            " FROM responses WHERE url = ?",
+            (normalize_cache_key(request.url),),
+        ).fetchone()
+        if row is None:
+            return None
+        response_url, status, raw_headers, body, stored_at = row
+        request.meta[CACHE_STORED_AT] = stored_at
+        headers = Headers(headers_raw_to_dict(raw_headers))
+        body = zlib.decompress(body)
+        response_cls = responsetypes.from_args(
+            headers=headers, url=response_url, body=body
+        )
+        return response_cls(url=response_url, headers=headers, status=status, body=body)
+
+    def store_response(  # pylint: disable=unused-argument
+        self, spider, request: scrapy.Request, response: scrapy.http.Response
+    ) -> None:
+        """
+        store or replace the cached response of a request
+        """
+        self.db.execute(
+            "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+            (
+                normalize_cache_key(request.url),
+                response.url,
+                response.status,
+                headers_dict_to_raw(response.headers),
+                zlib.compress(response.body, self.compression_level),
+                time(),
+            ),
+        )
+        self._pending_writes += 1
+        if self._pending_writes >= self.commit_every:
+            self.db.commit()
+            self._pending_writes = 0
+
+
+class PageTypeTTLPolicy(RFC2616Policy):
+    """
+    cache policy with a time to live per page type, e.g.
+    HTTPCACHE_PAGE_TYPE_TTL = {"landing": 86400, "product": 259200, "contact": 2592000}
+
+    the page type is read from request.meta["page_type"], requests without one are
+    landing pages. responses are cached regardless of their cache headers, a
+    cached response older than its ttl is revalidated with If-None-Match and
+    If-Modified-Since when it has an ETag or Last-Modified header, and a 304
+    answer serves the cached response and RevalidatingHttpCacheMiddleware
+    stores it again, so its ttl starts over.
+    """
+
+    def __init__(self, settings: scrapy.settings.Settings):
+        super().__init__(settings)
+        self.ignore_http_codes = [
+            int(code) for code in settings.getlist("HTTPCACHE_IGNORE_HTTP_CODES")
+        ]
+        self.page_type_ttl = settings.getdict("HTTPCACHE_PAGE_TYPE_TTL")
+        self.default_ttl = settings.getint("HTTPCACHE_EXPIRATION_SECS")
+
+    def should_cache_response(
+        self, response: scrapy.http.Response, request: scrapy.Request
+    ) -> bool:
+        """
+        cache every response except 304 answers and ignored status codes
+
+        Returns: bool
+        """
+        return response.status != 304 and response.status not in self.ignore_http_codes
+
+    def is_cached_response_fresh(
+        self, cachedresponse: scrapy.http.Response, request: scrapy.Request
+    ) -> bool:
+        """
+        a cached response is fresh within the ttl of its page type,
+        otherwise the request gets the validators of the cached response
+
+        Returns: bool
+        """
+        page_type = request.meta.get("page_type", "landing")
+        ttl = self.page_type_ttl.get(page_type, self.default_ttl)
+        age = time() - request.meta.get(CACHE_STORED_AT, 0)
+        if age < ttl:
+            return True
+        self._set_conditional_validators(request, cachedresponse)
+        return False
+
+
+class RevalidatingHttpCacheMiddleware(HttpCacheMiddleware):
+    """
+    http cache middleware storing a cached response again after a 304 answer
+    revalidated it, so the response is fresh for another ttl instead of being
+    revalidated on every later request
+    """
+
+    def process_response(
+        self, request: scrapy.Request, response: scrapy.http.Response, spider
+    ) -> scrapy.http.Response:
+        """
+        Returns: the cached response if the server revalidated it, else the response
+        """
+        cachedresponse = request.meta.get("cached_response")
+        result = super().process_response(request, response, spider)
+        if (
+            cachedresponse is not None
+            and result is cachedresponse
+            and response.status == 304
+        ):
+            self.storage.store_response(spider, request, cachedresponse)
+        return result
@@ -0,0 +1,300 @@
+""" Columnar storage of scraped items in parquet files"""
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+_string_list = pa.list_(pa.string())
+
+# schema of each item type, list fields are stored as lists and the wappalyzer
+# categories as a map, so they are read back without parsing
+ITEM_SCHEMAS = {
+    "generalinformationitem": pa.schema(
+        [
+            ("company_url", pa.string()),
+            ("status", pa.int64()),
+            ("languages", pa.string()),
+            ("tagged_by_b2b_words", _string_list),
+            ("payments", _string_list),
+            ("webshop_urls", _string_list),
+            ("webshop_system", _string_list),
+            ("wappalyzer", pa.map_(pa.string(), pa.string())),
+            ("social_media", _string_list),
+        ]
+    ),
+    "priceitem": pa.schema(
+        [
+            ("company_url", pa.string()),
+            ("products_quantity", pa.int64()),
+            ("products_avg_price", pa.float64()),
+            ("currency", pa.string()),
+        ]
+    ),
+    "contactitem": pa.schema(
+        [
+            ("company_url", pa.string()),
+            ("phone", _string_list),
+            ("contact_information_url", pa.string()),
+            ("email", _string_list),
+        ]
+    ),
+}
+
+
+def read_item_table(
+    file_path: Path, drop_companies: Optional[set[str]] = None
+) -> Optional[pa.Table]:
+    """
+    read a parquet item file, without the rows of the companies in drop_companies
+
+    Returns: a pyarrow table, None if there is no item file
+    """
+    if not file_path.exists():
+        return None
+    table = pq.read_table(file_path)
+    if drop_companies:
+        table = table.filter(
+            pc.invert(
+                pc.is_in(table["company_url"], value_set=pa.array(list(drop_companies)))
+            )
+        )
+    return table
+
+
+def read_items(
+    file_path: Path, list_separator: Optional[str] = None
+) -> Optional[pd.DataFrame]:
+    """
+    read a parquet item file into a dataframe, the wappalyzer map is read as dicts.
+    if list_separator is given, list columns are joined into strings and empty
+    lists become missing values.
+
+    Returns: a dataframe, None if there are no items
+    """
+    table = read_item_table(file_path)
+    if table is None or table.num_rows == 0:
+        return None
+    if list_separator is not None:
+        for index, column in enumerate(table.schema):
+            if pa.types.is_list(column.type):
+                values = table.column(index)
+                joined = pc.if_else(
+                    pc.greater(pc.list_value_length(values), 0),
+                    pc.binary_join(values, list_separator),
+                    pa.scalar(None, pa.string()),
+                )
+                table = table.set_column(index, column.name, joined)
+    return table.to_pandas(maps_as_pydicts="strict")
+
+
+def partition_item_file(
+    file_path: Path,
+    partition_folders: list[Path],
+    key: str = "company_url",
+    batch_size: int = 65536,
+) -> None:
+    """
+    split a parquet item file into one file per partition folder, by a hash of the
+    key column, so all rows of a company end up in the same partition. the file is
+    read in batches of batch_size rows, partitions without rows get no file.
+    """
+    if not file_path.exists():
+        return
+    parquet_file = pq.ParquetFile(file_path)
+    writers: dict[int, ParquetItemWriter] = {}
+    for batch in parquet_file.iter_batches(batch_size=batch_size):
+        keys = batch.column(key).to_numpy(zero_copy_only=False)
+        partition_ids = pd.util.hash_array(keys.astype(object)) % len(partition_folders)
+        for partition_id in np.unique(partition_ids):
+            if partition_id not in writers:
+                partition_folders[partition_id].mkdir(parents=True, exist_ok=True)
+                writers[partition_id] = ParquetItemWriter(
+                    partition_folders[partition_id] / file_path.name,
+                    parquet_file.schema_arrow,
+                    batch_size=batch_size,
+                )
+            writers[partition_id].write_table(
+                pa.Table.from_batches(
+                    [batch.filter(pa.array(partition_ids == partition_id))]
+                )
+            )
+    for writer in writers.values():
+        writer.close()
+
+
+class ParquetItemWriter:
+    """
+    write the items of one type to a parquet file in row groups of batch_size items.
+    rows of an existing table given as keep are written first. the file is
+    written under a temporary name and moved in place when it is closed, a type
+    without any rows leaves no file.
+    """
+
+    def __init__(
+        self,
+        file_path: Path,
+        schema: pa.Schema,
+        batch_size: int = 1000,
+        compression: str = "zstd",
+        keep: Optional[pa.Table] = None,
+    ):
+        self.file_path = file_path
+        self.tmp_path = file_path.with_suffix(".parquet.tmp")
+        self.schema = schema
+        self.batch_size = batch_size
+        self.compression = compression
+        self.rows: list[dict] = []
+        self.writer: Optional[pq.ParquetWriter] = None
+        if keep is not None and keep.num_rows:
+            self.write_table(keep.cast(schema))
+
+    def write_table(self, table: pa.Table) -> None:
+        """
+        write a table of items, in row groups of batch_size rows
+        """
+        if self.writer is None:
+            self.writer = pq.ParquetWriter(
+                self.tmp_path, self.schema, compression=self.compression
+            )
+        self.writer.write_table(table, row_group_size=self.batch_size)
+
+    def write(self, item: dict) -> None:
+        """
+        buffer an item, a full batch is written as a row group
+        """
+        self.rows.append(dict(item))
+        if len(self.rows) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        """
+        write the buffered items
+        """
+        if self.rows:
+            self.write_table(pa.Table.from_pylist(self.rows, schema=self.schema))
+            self.rows = []
+
+    def close(self) -> None:
+        """
+        write the remaining items and move the file in place
+        """
+        self.flush()
+        if self.writer is None:
+            self.file_path.unlink(missing_ok=True)
+            return
+        self.writer.close()
+        self.tmp_path.replace(self.file_path)
+
+
+def concat_item_files(
+    files: list[Path],
+    file_path: Path,
+    schema: pa.Schema,
+    batch_size: int = 65536,
+    compression: str = "zstd",
+) -> int:
+    """
+    write the rows of all parquet files into one file, batch by batch, missing
+    files are skipped
+
+    Returns: the number of rows
+    """
+    writer = ParquetItemWriter(
+        file_path, schema, batch_size=batch_size, compression=compression
+    )
+    rows = 0
+    for file in files:
+        if not file.exists():
+            continue
+        for batch in pq.ParquetFile(file).iter_batches(batch_size=batch_size):
+            writer.write_table(pa.Table.from_batches([batch]).cast(schema))
+            rows += batch.num_rows
+    writer.close()
+    return rows
+
+
+class CheckpointItemWriter:
+    """
+    write the items of one type like ParquetItemWriter, as a series of part files
+    in parts_folder. a checkpoint closes the current part, so all items written
+    before it are in complete parquet files that survive a crash of the crawl.
+    parts are numbered after the parts already in the folder, which stay untouched.
+    closing concatenates the parts written since the writer was opened into
+    file_path.
+    """
+
+    def __init__(
+        self,
+        file_path: Path,
+        parts_folder: Path,
+        schema: pa.Schema,
+        batch_size: int = 1000,
+        compression: str = "zstd",
+        keep: Optional[pa.Table] = None,
+    ):
+        self.file_path = file_path
+        self.parts_folder = parts_folder
+        self.parts_folder.mkdir(parents=True, exist_ok=True)
+        self.schema = schema
+        self.batch_size = batch_size
+        self.compression = compression
+        self.next_part = 1 + max(
+            (
+                int(part.name.split(".")[0].removeprefix("part-"))
+                for part in parts_folder.glob("part-*.parquet")
+            ),
+            default=-1,
+        )
+        self.parts: list[Path] = []
+        self.writer = self._part_writer()
+        if keep is not None and keep.num_rows:
+            self.writer.write_table(keep.cast(schema))
+
+    def _part_writer(self) -> ParquetItemWriter:
+        part_path = self.parts_folder / f"part-{self.next_part:05d}.parquet"
+        self.next_part += 1
+        return ParquetItemWriter(
+            part_path,
+            self.schema,
+            batch_size=self.batch_size,
+            compression=self.compression,
+        )
+
+    def write(self, item: dict) -> None:
+        """
+        buffer an item, a full batch is written as a row group of the current part
+        """
+        self.writer.write(item)
+
+    def checkpoint(self) -> list[Path]:
+        """
+        close the current part and start the next one
+
+        Returns: all complete parts written since the writer was opened
+        """
+        self.writer.close()
+        if self.writer.file_path.exists():
+            self.parts.append(self.writer.file_path)
+        self.writer = self._part_writer()
+        return list(self.parts)
+
+    def close(self) -> list[Path]:
+        """
+        close the current part and concatenate all parts into file_path
+
+        Returns: all parts written since the writer was opened
+        """
+        parts = self.checkpoint()
+        self.writer.close()
+        concat_item_files(
+            parts,
+            self.file_path,
+            self.schema,
+            batch_size=self.batch_size,
+            compression=self.compression,
+        )
+        return parts
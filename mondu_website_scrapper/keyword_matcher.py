@@ -0,0 +1,39 @@
+""" Match several keyword families against a document in one pass"""
+import ahocorasick
+
+
+class KeywordMatcher:
+    """
+    an Aho-Corasick automaton built once from keyword families, e.g.
+    families = {"b2b": ["b2b", "wholesale"], "webshop_system": ["magento", "shopware"]}
+
+    scanning a document walks it once and finds every keyword occurring in it as a
+    substring, overlapping and nested keywords included, for all families together.
+    keywords are lowered, so the scanned text is expected to be lowered as well.
+    """
+
+    def __init__(self, families: dict[str, list[str]]):
+        self.families = {
+            family: list(dict.fromkeys(keyword.lower() for keyword in keywords))
+            for family, keywords in families.items()
+        }
+        self.automaton = ahocorasick.Automaton()
+        for keywords in self.families.values():
+            for keyword in keywords:
+                self.automaton.add_word(keyword, keyword)
+        self.automaton.make_automaton()
+
+    def scan(self, text: str) -> dict[str, list[str]]:
+        """
+        scan the text once
+
+        Returns: a dict of family and the keywords of that family found in the text,
+        in the order they are configured
+        """
+        found = set()
+        if self.automaton.kind == ahocorasick.AHOCORASICK:
+            found.update(keyword for _, keyword in self.automaton.iter(text))
+        return {
+            family: [keyword for keyword in keywords if keyword in found]
+            for family, keywords in self.families.items()
+        }
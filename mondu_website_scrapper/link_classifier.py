@@ -0,0 +1,73 @@
+""" Sort the links of a page into product, contact, social media and webshop links"""
+from dataclasses import dataclass, field
+
+import scrapy
+from scrapy.linkextractors import LinkExtractor
+
+from mondu_website_scrapper.pattern_registry import CompiledPattern
+
+
+@dataclass
+class ClassifiedLinks:
+    """
+    links of one page grouped by what they point to, each a list of unique urls
+    """
+
+    product: list[str] = field(default_factory=list)
+    contact: list[str] = field(default_factory=list)
+    social_media: list[str] = field(default_factory=list)
+    webshop: list[str] = field(default_factory=list)
+
+
+class LinkClassifier:
+    """
+    extract all links of a page once and classify them in a single pass.
+    the patterns come compiled from the pattern registry. product, contact and
+    webshop patterns are only searched in the part of a link following the url of
+    the page, so no pattern has to be built for each page.
+    """
+
+    def __init__(
+        self,
+        product_pattern: CompiledPattern,
+        contact_pattern: CompiledPattern,
+        social_media_pattern: CompiledPattern,
+        webshop_pattern: CompiledPattern,
+        webshop_text_pattern: CompiledPattern,
+    ):
+        self.link_extractor = LinkExtractor(unique=False)
+        self.product_re = product_pattern
+        self.contact_re = contact_pattern
+        self.social_media_re = social_media_pattern
+        self.webshop_re = webshop_pattern
+        self.webshop_text_re = webshop_text_pattern
+
+    def classify(self, response: scrapy.http.TextResponse) -> ClassifiedLinks:
+        """
+        classify all links of the response
+
+        Returns: a ClassifiedLinks
+        """
+        page_url = response.url
+        # dicts keep the first seen order while dropping duplicates
+        buckets = {
+            name: {} for name in ("product", "contact", "social_media", "webshop")
+        }
+
+        for link in self.link_extractor.extract_links(response):
+            url = link.url
+            if self.social_media_re.search(url):
+                buckets["social_media"][url] = None
+            if self.webshop_text_re.search(link.text):
+                buckets["webshop"][url] = None
+            if not url.startswith(page_url):
+                continue
+            path = url.removeprefix(page_url)
+            if self.product_re.search(path):
+                buckets["product"][url] = None
+            if self.contact_re.search(path):
+                buckets["contact"][url] = None
+            if self.webshop_re.search(path):
+                buckets["webshop"][url] = None
+
+        return ClassifiedLinks(**{name: list(urls) for name, urls in buckets.items()})
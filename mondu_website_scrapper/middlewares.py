@@ -7,6 +7,10 @@
 # useful for handling different item types with a single interface
 from itemadapter import ItemAdapter, is_item
 from scrapy import signals
+from scrapy.exceptions import NotConfigured
+from scrapy.utils.httpobj import urlparse_cached
+
+from mondu_website_scrapper.adaptive_concurrency import AdaptiveConcurrency
 
 
 class MonduWebsiteScrapperSpiderMiddleware:
@@ -57,47 +61,82 @@ class MonduWebsiteScrapperSpiderMiddleware:
 
 
 class MonduWebsiteScrapperDownloaderMiddleware:
-    # Not all methods need to be defined. If a method is not defined,
-    # scrapy acts as if the downloader middleware does not modify the
-    # passed objects.
+    """
+    adapt the concurrency of every domain to its latency and errors, see
+    AdaptiveConcurrency. the spider shares its spider.adaptive_concurrency so it
+    can put follow up pages of fast domains first.
+    the downloader keeps one slot per domain, the concurrency of a slot is set
+    after each of its responses, the same way AutoThrottle sets the slot delay.
+    the downloader creates the slot of a new domain after the downloader
+    middlewares ran, and again once it dropped the idle slot of a domain, with
+    CONCURRENT_REQUESTS_PER_DOMAIN. so the concurrency of the domain is set when
+    the request reaches the downloader, right after its slot is created.
+    """
+
+    def __init__(self, crawler, error_codes: list[int]):
+        self.crawler = crawler
+        self.error_codes = {int(code) for code in error_codes}
+        self.concurrency = AdaptiveConcurrency.from_settings(crawler.settings)
 
     @classmethod
     def from_crawler(cls, crawler):
-        # This method is used by Scrapy to create your spiders.
-        s = cls()
+        if not crawler.settings.getbool("ADAPTIVE_CONCURRENCY_ENABLED"):
+            raise NotConfigured
+        s = cls(crawler, crawler.settings.getlist("ADAPTIVE_ERROR_CODES"))
         crawler.signals.connect(s.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(s.spider_closed, signal=signals.spider_closed)
+        crawler.signals.connect(
+            s.request_reached_downloader, signal=signals.request_reached_downloader
+        )
         return s
 
-    def process_request(self, request, spider):
-        # Called for each request that goes through the downloader
-        # middleware.
-
-        # Must either:
-        # - return None: continue processing this request
-        # - or return a Response object
-        # - or return a Request object
-        # - or raise IgnoreRequest: process_exception() methods of
-        #   installed downloader middleware will be called
-        return None
+    def _set_slot_concurrency(self, request, concurrency, spider):
+        domain = urlparse_cached(request).hostname
+        slot = self.crawler.engine.downloader.slots.get(
+            request.meta.get("download_slot", domain)
+        )
+        if slot is not None and slot.concurrency != concurrency:
+            spider.logger.debug("concurrency of %s: %s", domain, concurrency)
+            slot.concurrency = concurrency
+
+    def _observe(self, request, latency, error, spider):
+        domain = urlparse_cached(request).hostname
+        if domain is not None:
+            concurrency = self.concurrency.observe(domain, latency, error)
+            self._set_slot_concurrency(request, concurrency, spider)
+
+    def request_reached_downloader(self, request, spider):
+        # new domains start with start_concurrency, known ones with their current
+        # concurrency
+        stats = self.concurrency.domains.get(urlparse_cached(request).hostname)
+        concurrency = (
+            stats.concurrency
+            if stats is not None
+            else self.concurrency.start_concurrency
+        )
+        self._set_slot_concurrency(request, concurrency, spider)
 
     def process_response(self, request, response, spider):
-        # Called with the response returned from the downloader.
-
-        # Must either;
-        # - return a Response object
-        # - return a Request object
-        # - or raise IgnoreRequest
+        # cached responses were not downloaded and have no latency
+        if "download_latency" in request.meta and "cached" not in response.flags:
+            self._observe(
+                request,
+                request.meta["download_latency"],
+                response.status in self.error_codes,
+                spider,
+            )
         return response
 
     def process_exception(self, request, exception, spider):
-        # Called when a download handler or a process_request()
-        # (from other downloader middleware) raises an exception.
-
-        # Must either:
-        # - return None: continue processing this exception
-        # - return a Response object: stops process_exception() chain
-        # - return a Request object: stops process_exception() chain
-        pass
+        self._observe(request, request.meta.get("download_latency"), True, spider)
 
     def spider_opened(self, spider):
-        spider.logger.info("Spider opened: %s" % spider.name)
+        self.concurrency = (
+            getattr(spider, "adaptive_concurrency", None) or self.concurrency
+        )
+
+    def spider_closed(self, spider):
+        summary = self.concurrency.summary()
+        spider.logger.info("adaptive concurrency: %s", summary)
+        for key, value in summary.items():
+            self.crawler.stats.set_value(f"adaptive_concurrency/{key}", value)
@@ -0,0 +1,188 @@
+""" Compile the regular expressions configured in settings once, with usage counters"""
+import re
+import time
+from dataclasses import asdict, dataclass
+from typing import Iterator, Optional, Union
+
+# settings holding a pattern, list settings are an alternation of their entries
+SETTINGS_PATTERNS = [
+    "PHONE_PATTERN",
+    "EMAIL_PATTERN",
+    "PRODUCT_LINK_PATTERN",
+    "CONTACT_LINK_PATTERN",
+    "SOCIAL_MEDIA_LINK_PATTERN",
+    "WEBSHOP_LINK_PATTERN",
+    "WEBSHOP_LINK_TEXT_KEYWORDS",
+]
+
+
+class PatternError(ValueError):
+    """
+    a configured pattern is missing or does not compile
+    """
+
+
+@dataclass
+class PatternStats:
+    """
+    usage of one pattern: calls, matches found, seconds spent matching and the
+    number of texts longer than the window that were matched window by window
+    """
+
+    calls: int = 0
+    hits: int = 0
+    seconds: float = 0.0
+    windowed: int = 0
+
+
+class CompiledPattern:
+    """
+    a compiled pattern counting its usage.
+    the re module has no timeout, so texts longer than max_window characters are
+    matched in windows of max_window characters overlapping by window_overlap
+    characters. a pattern that backtracks badly then only backtracks within one
+    window instead of over the whole text. matches longer than the overlap can be
+    cut at a window border.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        pattern: str,
+        flags: int = 0,
+        max_window: Optional[int] = None,
+        window_overlap: int = 1000,
+    ):
+        if max_window is not None and max_window <= window_overlap:
+            raise PatternError(
+                f"{name}: max_window {max_window} has to be larger than the "
+                f"window_overlap {window_overlap}"
+            )
+        try:
+            self.regex = re.compile(pattern, flags)
+        except re.error as error:
+            raise PatternError(
+                f"{name}: invalid pattern {pattern!r}: {error}"
+            ) from error
+        self.name = name
+        self.max_window = max_window
+        self.window_overlap = window_overlap
+        self.stats = PatternStats()
+
+    def _finditer(self, text: str) -> Iterator[re.Match]:
+        if self.max_window is None or len(text) <= self.max_window:
+            yield from self.regex.finditer(text)
+            return
+        self.stats.windowed += 1
+        step = self.max_window - self.window_overlap
+        last_end = 0
+        for start in range(0, len(text), step):
+            end = start + self.max_window
+            for match in self.regex.finditer(text, start, end):
+                # matches starting in the overlap are found whole in the next window,
+                # matches starting inside the previous match are parts of it
+                if end < len(text) and match.start() >= start + step:
+                    break
+                if match.start() < last_end:
+                    continue
+                last_end = match.end()
+                yield match
+            if end >= len(text):
+                break
+
+    def finditer(self, text: str) -> list[re.Match]:
+        """
+        Returns: all non overlapping matches in the text
+        """
+        started = time.perf_counter()
+        matches = list(self._finditer(text))
+        self.stats.calls += 1
+        self.stats.hits += len(matches)
+        self.stats.seconds += time.perf_counter() - started
+        return matches
+
+    def findall(self, text: str) -> list[str]:
+        """
+        Returns: the text of all non overlapping matches, also for patterns with
+        groups
+        """
+        return [match.group() for match in self.finditer(text)]
+
+    def search(self, text: str) -> Optional[re.Match]:
+        """
+        Returns: the first match in the text, None without any
+        """
+        started = time.perf_counter()
+        match = next(self._finditer(text), None)
+        self.stats.calls += 1
+        self.stats.hits += match is not None
+        self.stats.seconds += time.perf_counter() - started
+        return match
+
+
+class PatternRegistry:
+    """
+    all patterns of a crawl, compiled when the registry is created so a bad
+    pattern fails before the first page is requested
+    """
+
+    def __init__(
+        self,
+        patterns: Optional[dict[str, str]] = None,
+        max_window: Optional[int] = None,
+        window_overlap: int = 1000,
+    ):
+        self.max_window = max_window
+        self.window_overlap = window_overlap
+        self.patterns: dict[str, CompiledPattern] = {}
+        for name, pattern in (patterns or {}).items():
+            self.add(name, pattern)
+
+    @classmethod
+    def from_settings(
+        cls, settings, names: Optional[list[str]] = None
+    ) -> "PatternRegistry":
+        """
+        compile the patterns of the given settings, SETTINGS_PATTERNS by default
+
+        Returns: a PatternRegistry
+        """
+        patterns = {}
+        for name in SETTINGS_PATTERNS if names is None else names:
+            value: Union[str, list, None] = settings.get(name)
+            if isinstance(value, (list, tuple)):
+                value = "|".join(value)
+            if not value:
+                raise PatternError(f"{name}: no pattern configured")
+            patterns[name] = value
+        return cls(
+            patterns,
+            max_window=settings.getint("PATTERN_MAX_WINDOW") or None,
+            window_overlap=settings.getint("PATTERN_WINDOW_OVERLAP", 1000),
+        )
+
+    def add(self, name: str, pattern: str, flags: int = 0) -> CompiledPattern:
+        """
+        compile and register a pattern
+
+        Returns: the CompiledPattern
+        """
+        if name in self.patterns:
+            raise PatternError(f"{name}: registered twice")
+        self.patterns[name] = CompiledPattern(
+            name,
+            pattern,
+            flags,
+            max_window=self.max_window,
+            window_overlap=self.window_overlap,
+        )
+        return self.patterns[name]
+
+    def __getitem__(self, name: str) -> CompiledPattern:
+        return self.patterns[name]
+
+    def stats(self) -> dict[str, dict]:
+        """
+        Returns: the PatternStats of every pattern as a dict
+        """
+        return {name: asdict(pattern.stats) for name, pattern in self.patterns.items()}
@@ -2,11 +2,18 @@
 
 # pylint: disable=attribute-defined-outside-init
 import logging
+import time
 
-from scrapy.exporters import CsvItemExporter
 from scrapy.item import Item
 
 from mondu_website_scrapper import items
+from mondu_website_scrapper.company_aggregates import CompanyAggregates
+from mondu_website_scrapper.item_storage import (
+    ITEM_SCHEMAS,
+    CheckpointItemWriter,
+    ParquetItemWriter,
+    read_item_table,
+)
 from mondu_website_scrapper.utils import extract_categories_from_wappalyzer
 
 
@@ -20,16 +27,27 @@ def item_type(item):
 class MonduWebsiteScrapperPipeline:
     """
     this is the pipeline taking sccrapped items, processing items,
-    and then exporting it into csv file.
+    and then exporting it into a parquet file per item type.
     """
 
     defined_items = [
         name.lower() for name, _ in items.__dict__.items() if "Item" in name
     ]
 
-    def __init__(self, file_folder):
+    def __init__(
+        self,
+        file_folder,
+        batch_size: int = 1000,
+        compression: str = "zstd",
+        aggregates_folder=None,
+        checkpoint_secs: int = 60,
+    ):
         self.file_folder = file_folder
         self.file_folder.mkdir(parents=True, exist_ok=True)
+        self.batch_size = batch_size
+        self.compression = compression
+        self.aggregates_folder = aggregates_folder or file_folder / "company_aggregates"
+        self.checkpoint_secs = checkpoint_secs
 
     @classmethod
     def from_crawler(cls, crawler) -> object:
@@ -39,48 +57,124 @@ class MonduWebsiteScrapperPipeline:
         """
         return cls(
             file_folder=crawler.settings.get("FILE_FOLDER"),
+            batch_size=crawler.settings.getint("ITEM_STORAGE_BATCH_SIZE", 1000),
+            compression=crawler.settings.get("ITEM_STORAGE_COMPRESSION", "zstd"),
+            aggregates_folder=crawler.settings.get("COMPANY_AGGREGATES_FOLDER"),
+            checkpoint_secs=crawler.settings.getint(
+                "COMPANY_AGGREGATES_CHECKPOINT_SECS", 60
+            ),
         )
 
-    def open_spider(self, spider) -> None:  # pylint: disable=unused-argument
+    def open_spider(self, spider) -> None:
         """
-        open file, define exporter and start exporting
+        open a parquet writer for every item type and start exporting, and start the
+        per company aggregates.
+        a new crawl starts a new checkpoint of the spider, the checkpoint of an
+        interrupted crawl is only removed for a fresh start. when resuming, the rows
+        and aggregates of the companies finished at its last checkpoint are kept.
+        in incremental mode the rows and aggregates of the companies to be scraped
+        again are removed and all others are kept, otherwise they start empty
         """
-        self.files = {
-            name: open(self.file_folder / f"{name}.csv", "w+b")
-            for name in self.defined_items
-        }
-
-        self.exporters = {
-            name: CsvItemExporter(self.files[name]) for name in self.defined_items
-        }
-
-        logging.info("Starting exporting into csv...")
+        company_urls = None
+        self.aggregates = CompanyAggregates()
+        self.checkpoint = getattr(spider, "checkpoint", None)
+        if self.checkpoint is not None and not spider.resume:
+            self.checkpoint.start(fresh=spider.fresh_start)
+        if self.checkpoint is not None and spider.resume:
+            if self.checkpoint.aggregates_folder() is not None:
+                self.aggregates = CompanyAggregates.load(
+                    self.checkpoint.aggregates_folder()
+                )
+                self.aggregates.drop(self.checkpoint.unfinished)
+        elif getattr(spider, "incremental", False):
+            company_urls = set(spider.start_urls) | spider.scrape_state.company_urls(
+                spider.start_urls
+            )
+            self.aggregates = CompanyAggregates.load(self.aggregates_folder)
+            self.aggregates.drop(company_urls)
+        self.last_checkpoint = time.monotonic()
+
+        self.writers = {}
+        for name in self.defined_items:
+            file_path = self.file_folder / f"{name}.parquet"
+            if self.checkpoint is not None and spider.resume:
+                keep = self.checkpoint.read_items(name)
+            elif company_urls is not None:
+                keep = read_item_table(file_path, drop_companies=company_urls)
+            else:
+                keep = None
+            if self.checkpoint is not None:
+                self.writers[name] = CheckpointItemWriter(
+                    file_path,
+                    self.checkpoint.parts_folder(name),
+                    ITEM_SCHEMAS[name],
+                    batch_size=self.batch_size,
+                    compression=self.compression,
+                    keep=keep,
+                )
+            else:
+                self.writers[name] = ParquetItemWriter(
+                    file_path,
+                    ITEM_SCHEMAS[name],
+                    batch_size=self.batch_size,
+                    compression=self.compression,
+                    keep=keep,
+                )
 
-        for exporter in self.exporters.values():
-            exporter.start_exporting()
+        logging.info("Starting exporting into parquet...")
 
     def close_spider(self, spider) -> None:  # pylint: disable=unused-argument
         """
-        finishining exporting and close the file
+        finishining exporting and close the file, and save the aggregates and the
+        last checkpoint
         """
-        logging.info("Finishing exporting into csv...")
-        for exporter in self.exporters.values():
-            exporter.finish_exporting()
-        for file in self.files.values():
-            file.close()
-
-    def process_item(self, item, spider) -> Item:  # pylint: disable=unused-argument
+        logging.info("Finishing exporting into parquet...")
+        if self.checkpoint is not None:
+            self.save_checkpoint()
+        for writer in self.writers.values():
+            writer.close()
+        self.aggregates.save(self.aggregates_folder)
+
+    def save_checkpoint(self) -> None:
+        """
+        save the aggregates, with a spider checkpoint as a checkpoint of the crawl:
+        the finished companies are taken first, then the current item parts are
+        closed and the aggregates saved, so all their items are in both
+        """
+        if self.checkpoint is None:
+            self.aggregates.save(self.aggregates_folder)
+        else:
+            self.checkpoint.commit_finished()
+            parts = {name: writer.checkpoint() for name, writer in self.writers.items()}
+            aggregates_folder = self.checkpoint.next_aggregates_folder()
+            self.aggregates.save(aggregates_folder)
+            self.checkpoint.save(parts, aggregates_folder)
+        self.last_checkpoint = time.monotonic()
+
+    def process_item(self, item, spider) -> Item:
         """
         process items scrapped from web.
         1. only the wappalyzer item needs to be processed. check function
         extract_categories_from_wappalyzer for more details
+        2. the item is added to the per company aggregates, which are saved with a
+        checkpoint of the crawl every checkpoint_secs seconds
+        3. the time it took is added to the crawl metrics of the spider
         """
+        started = time.perf_counter()
         item_name = item_type(item)
         if item_name in set(self.defined_items):
             if item_name == "generalinformationitem":
                 item["wappalyzer"] = extract_categories_from_wappalyzer(
                     item["wappalyzer"]
                 )
-            logging.info("Exporting items into csv...")
-            self.exporters[item_name].export_item(item)
+            logging.info("Exporting items into parquet...")
+            self.writers[item_name].write(item)
+            self.aggregates.add(item_name, item)
+            if self.checkpoint is not None:
+                self.checkpoint.item_stored(item["company_url"])
+            if time.monotonic() - self.last_checkpoint > self.checkpoint_secs:
+                self.save_checkpoint()
+        metrics = getattr(spider, "metrics", None)
+        if metrics is not None:
+            metrics.add("pipeline_export", time.perf_counter() - started)
         return item
@@ -0,0 +1,297 @@
+""" Extract the prices of a product page from structured data or its visible text"""
+import json
+import math
+import re
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Iterator, Optional
+
+import scrapy
+
+from mondu_website_scrapper.pattern_registry import PatternRegistry
+
+# an amount with optional thousands separators and up to two decimals, e.g.
+# 19.99, 19,99, 1.299,00, 1,299.00, 1 299,00 or 19,-
+AMOUNT_PATTERN = (
+    r"(?<![\d.,])(?:\d{1,3}(?:[.,' ]\d{3})+|\d+)(?:[.,](?:\d{1,2}|-))?(?![\d])"
+)
+AMOUNT_RE = re.compile(AMOUNT_PATTERN)
+# an amount right after a currency, and right before one within the characters
+# of AMOUNT_BEFORE_CHARS before it
+AMOUNT_AFTER_RE = re.compile(rf"\s?({AMOUNT_PATTERN})")
+AMOUNT_BEFORE_RE = re.compile(rf"({AMOUNT_PATTERN})\s?$")
+AMOUNT_BEFORE_CHARS = 40
+
+# text nodes of the page a visitor sees, scripts and styles are skipped
+VISIBLE_TEXT_XPATH = (
+    "//body//text()[not(ancestor::script) and not(ancestor::style)"
+    " and not(ancestor::noscript) and not(ancestor::template)]"
+)
+
+JSON_LD_XPATH = "//script[@type='application/ld+json']/text()"
+MICRODATA_OFFER_XPATH = "//*[@itemprop='offers' or @itemprop='price']"
+META_PRICE_XPATH = (
+    "//meta[@property='product:price:amount' or @property='og:price:amount']"
+)
+META_CURRENCY_XPATH = (
+    "//meta[@property='product:price:currency' or @property='og:price:currency']"
+    "/@content"
+)
+
+# schema.org types carrying a price
+OFFER_TYPES = {
+    "Offer",
+    "AggregateOffer",
+    "PriceSpecification",
+    "UnitPriceSpecification",
+}
+
+
+def parse_amount(amount: str) -> Optional[float]:
+    """
+    parse the first amount of a price text written in either the german or the
+    english locale. the last of several separators is the decimal separator, a
+    single separator followed by exactly three digits separates thousands, e.g.
+    "1.299,00 €" -> 1299.0, "1,299.00" -> 1299.0, "1.299" -> 1299.0, "12,99" -> 12.99
+
+    Returns: the amount, None if the text has no amount
+    """
+    match = AMOUNT_RE.search(amount)
+    if match is None:
+        return None
+    amount = re.sub(r"[\s']", "", match.group()).removesuffix("-").rstrip(".,")
+    separators = [char for char in amount if char in ".,"]
+    if separators:
+        last = amount.rfind(separators[-1])
+        decimals = amount[last + 1 :]
+        if len(set(separators)) > 1 or len(separators) == 1 and len(decimals) != 3:
+            amount = re.sub(r"[.,]", "", amount[:last]) + "." + decimals
+        else:
+            amount = re.sub(r"[.,]", "", amount)
+    return float(amount)
+
+
+def parse_structured_amount(amount) -> Optional[float]:
+    """
+    parse the amount of structured data, i.e. JSON-LD, an itemprop content or an
+    Open Graph tag, which schema.org writes as a plain number with a dot as
+    decimal separator, e.g. "0.500" -> 0.5, "12.500" -> 12.5.
+    amounts that are not a plain number, e.g. "1.299,00 €", fall back to
+    parse_amount
+
+    Returns: the amount, None if there is none
+    """
+    if isinstance(amount, bool):
+        return None
+    if isinstance(amount, (int, float)):
+        value = float(amount)
+    else:
+        try:
+            value = float(str(amount).strip())
+        except ValueError:
+            return parse_amount(str(amount))
+    return value if math.isfinite(value) else None
+
+
+@dataclass
+class PagePrices:
+    """
+    prices found on one page and the source they were read from
+    """
+
+    source: str
+    prices: list[tuple[float, Optional[str]]] = field(default_factory=list)
+
+    def result(self) -> Optional[dict]:
+        """
+        average the prices of the most frequent currency of the page, so prices in
+        another currency do not pollute the average
+
+        Returns: a dict with keys of products_avg_price, products_quantity and
+        currency, None if the page has no prices
+        """
+        if not self.prices:
+            return None
+        currencies = Counter(currency for _, currency in self.prices if currency)
+        currency = currencies.most_common(1)[0][0] if currencies else None
+        prices = [
+            price for price, price_currency in self.prices if price_currency == currency
+        ] or [price for price, _ in self.prices]
+        return {
+            "products_avg_price": round(sum(prices) / len(prices), 2),
+            "products_quantity": len(prices),
+            "currency": currency,
+        }
+
+
+class PriceExtractor:
+    """
+    extract prices of a product page from the first source that has any:
+    1. JSON-LD Product and Offer data
+    2. schema.org microdata
+    3. Open Graph product price meta tags
+    4. amounts right before or after a currency in the visible text of the page.
+    the currencies are found with one pattern per currency, registered in the
+    pattern registry of the crawl, and only their surroundings are matched for
+    amounts, so the text is not matched for amounts at every position
+
+    currencies are configured by the sign stored in the items, with the signs and
+    ISO 4217 codes a price can be written with, e.g. {"€": ["€", "EUR"]}
+    """
+
+    def __init__(self, currencies: dict[str, list[str]], patterns: PatternRegistry):
+        self.currency_by_code = {
+            spelling.upper(): sign
+            for sign, spellings in currencies.items()
+            for spelling in [sign, *spellings]
+        }
+        self.currency_res = {}
+        for sign, spellings in currencies.items():
+            # letters only match as a whole word, e.g. EUR but not europe. the
+            # pattern starts with the spelling itself, so the letters around it are
+            # only looked at where it occurs
+            self.currency_res[sign] = patterns.add(
+                f"CURRENCY_SIGNS[{sign}]",
+                "|".join(
+                    rf"{re.escape(spelling)}(?<![^\W\d_]{re.escape(spelling)})"
+                    r"(?![^\W\d_])"
+                    if spelling.isalpha()
+                    else re.escape(spelling)
+                    for spelling in sorted({sign, *spellings}, key=len, reverse=True)
+                ),
+                re.IGNORECASE,
+            )
+
+    def currency(self, code: Optional[str]) -> Optional[str]:
+        """
+        Returns: the configured sign of a currency code, unknown codes as they are
+        """
+        if not code:
+            return None
+        code = str(code).strip()
+        return self.currency_by_code.get(code.upper(), code)
+
+    def extract(self, response: scrapy.http.TextResponse) -> Optional[PagePrices]:
+        """
+        extract the prices of the response
+
+        Returns: the PagePrices of the first source with prices, None if the page
+        has no prices
+        """
+        for source, prices in (
+            ("json_ld", self._json_ld_prices),
+            ("microdata", self._microdata_prices),
+            ("open_graph", self._meta_prices),
+            ("text", self._text_prices),
+        ):
+            page_prices = PagePrices(
+                source=source,
+                prices=[
+                    (price, currency)
+                    for price, currency in prices(response)
+                    if price is not None and price > 0
+                ],
+            )
+            if page_prices.prices:
+                return page_prices
+        return None
+
+    def _json_ld_prices(
+        self, response: scrapy.http.TextResponse
+    ) -> Iterator[tuple[Optional[float], Optional[str]]]:
+        for script in response.xpath(JSON_LD_XPATH).getall():
+            try:
+                data = json.loads(script)
+            except ValueError:
+                continue
+            yield from self._json_ld_offers(data)
+
+    def _json_ld_offers(
+        self, data, currency: Optional[str] = None
+    ) -> Iterator[tuple[Optional[float], Optional[str]]]:
+        """
+        walk the JSON-LD data, offers without currency take the one of the
+        enclosing object
+        """
+        if isinstance(data, list):
+            for value in data:
+                yield from self._json_ld_offers(value, currency)
+            return
+        if not isinstance(data, dict):
+            return
+        currency = data.get("priceCurrency") or currency
+        types = data.get("@type")
+        types = {
+            name
+            for name in (types if isinstance(types, list) else [types])
+            if isinstance(name, str)
+        }
+        price = data.get("price", data.get("lowPrice"))
+        if price is not None and (types & OFFER_TYPES or "offers" not in data):
+            yield parse_structured_amount(price), self.currency(currency)
+            return
+        for value in data.values():
+            if isinstance(value, (dict, list)):
+                yield from self._json_ld_offers(value, currency)
+
+    def _microdata_prices(
+        self, response: scrapy.http.TextResponse
+    ) -> Iterator[tuple[Optional[float], Optional[str]]]:
+        for element in response.xpath(MICRODATA_OFFER_XPATH):
+            if element.attrib.get("itemprop") == "offers":
+                price = element.xpath(
+                    ".//*[@itemprop='price' or @itemprop='lowPrice'][1]"
+                )
+                currency = element.xpath(".//*[@itemprop='priceCurrency'][1]")
+            elif element.xpath("ancestor::*[@itemprop='offers']"):
+                # read with its offer
+                continue
+            else:
+                price = [element]
+                currency = element.xpath(
+                    "(ancestor::*[@itemscope][1]//*[@itemprop='priceCurrency'])[1]"
+                )
+            if not price:
+                continue
+            yield self._itemprop_amount(price[0]), self.currency(
+                self._itemprop_value(currency[0]) if currency else None
+            )
+
+    @staticmethod
+    def _itemprop_amount(element: scrapy.Selector) -> Optional[float]:
+        """
+        the content attribute of a price is structured, its text is written in
+        the locale of the shop
+        """
+        if element.attrib.get("content"):
+            return parse_structured_amount(element.attrib["content"])
+        return parse_amount(" ".join(element.xpath(".//text()").getall()))
+
+    @staticmethod
+    def _itemprop_value(element: scrapy.Selector) -> str:
+        return element.attrib.get("content") or " ".join(
+            element.xpath(".//text()").getall()
+        )
+
+    def _meta_prices(
+        self, response: scrapy.http.TextResponse
+    ) -> Iterator[tuple[Optional[float], Optional[str]]]:
+        currency = self.currency(response.xpath(META_CURRENCY_XPATH).get())
+        for amount in response.xpath(META_PRICE_XPATH + "/@content").getall():
+            yield parse_structured_amount(amount), currency
+
+    def _text_prices(
+        self, response: scrapy.http.TextResponse
+    ) -> Iterator[tuple[Optional[float], Optional[str]]]:
+        text = "\n".join(response.xpath(VISIBLE_TEXT_XPATH).getall())
+        for sign, currency_re in self.currency_res.items():
+            # an amount belongs to one currency only, the one before it first
+            amount_end = 0
+            for currency_match in currency_re.finditer(text):
+                start, end = currency_match.span()
+                amount = AMOUNT_BEFORE_RE.search(
+                    text, max(amount_end, start - AMOUNT_BEFORE_CHARS), start
+                ) or AMOUNT_AFTER_RE.match(text, end)
+                if amount is not None:
+                    amount_end = amount.end()
+                    yield parse_amount(amount.group(1)), sign
@@ -1,19 +1,30 @@
 """ create final scraped report"""
-import ast
 import csv
 import logging
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
 from dataclasses import dataclass
 from functools import reduce
+from pathlib import Path
+from typing import Optional
 
 import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
 from scrapy.utils.project import get_project_settings
 
 from mondu_website_scrapper import items
-from mondu_website_scrapper.utils import is_empty_file, normalize_phone_format
+from mondu_website_scrapper.item_storage import partition_item_file, read_items
+from mondu_website_scrapper.utils import normalize_phone_series
 
 settings = get_project_settings()
 
+# report rows of a partition, kept in its folder by the streaming report
+REPORT_PARTITION_FILE = "report.pickle"
+REPORT_PARTITION_CSV = "report.csv"
+
 
 @dataclass
 class CreateReportDataSet:
@@ -49,6 +60,11 @@ class CreateReportDataSet:
         data_concat = pd.concat([data, wappalyzed_df], axis=1).set_index(
             self.join_index
         )
+        if "Ecommerce" not in data_concat:
+            # none of the pages runs an ecommerce technology, e.g. in a small partition
+            data_concat["Ecommerce"] = pd.Series(
+                pd.NA, index=data_concat.index, dtype="string"
+            )
         for col in ["webshop_system", "Ecommerce"]:
             data_concat[col] = data_concat[col].apply(
                 lambda x: x.lower() if not pd.isna(x) else x
@@ -92,61 +108,110 @@ class CreateReportDataSet:
         """
         engineer scraped contact item
 
-        for the same company url, concat all the results together and drop duplicates
+        for the same company url, concat all the results together and drop duplicates.
+        the comma separated values of all rows of a company are exploded into one row
+        per value, missing values are dropped and the rest joined with ";" in row
+        order with one groupby per column
 
         Returns: engineered dataframe
         """
-        data.loc[:, self.phone_data_column] = data[self.phone_data_column].apply(
-            lambda x: normalize_phone_format(x, country_code=["43", "49"])
+        data = data.assign(
+            **{
+                self.phone_data_column: normalize_phone_series(
+                    data[self.phone_data_column], country_code=["43", "49"]
+                )
+            }
         )
+        companies = pd.Index(data[self.join_index].drop_duplicates())
+
+        engineered = pd.DataFrame(
+            {
+                col: self._concat_values(data[col], data[self.join_index])
+                for col in data.columns
+                if col != self.join_index
+            },
+            index=companies,
+        ).fillna("")
+        engineered.index = (
+            self._concat_values(companies.to_series(), companies.to_series())
+            .reindex(companies)
+            .fillna("")
+        )
+        engineered.index.name = self.join_index
+        return engineered
 
-        for col in [i for i in data.columns if i != self.join_index]:
-            data.replace(np.nan, "nan", inplace=True)
-            data[col] = data.groupby(self.join_index)[col].transform(
-                lambda x: ",".join(x)
-            )
-
-        data_drop = data.drop_duplicates()
+    @staticmethod
+    def _concat_values(values: pd.Series, keys: pd.Series) -> pd.Series:
+        """
+        split comma separated values, drop missing ones and join them with ";" per key.
+        splitting, exploding, grouping and joining all run in pyarrow compute, the
+        grouping keeps the row order of the values and the first seen order of keys
 
-        for col in data_drop.columns:
-            data_drop.loc[:, col] = data_drop[col].apply(
-                lambda x: ";".join([x for x in x.split(",") if x != "nan"])
-            )
-        return data_drop.set_index(self.join_index)
+        Returns: a series of joined values indexed by key, keys without values are
+        left out
+        """
+        split = pc.split_pattern(
+            pa.array(values.astype("string"), type=pa.string(), from_pandas=True), ","
+        )
+        tokens = pa.table(
+            {
+                "key": pc.take(
+                    pa.array(keys, type=pa.string(), from_pandas=True),
+                    pc.list_parent_indices(split),
+                ),
+                "value": pc.list_flatten(split),
+            }
+        )
+        tokens = tokens.filter(pc.not_equal(tokens["value"], "nan"))
+        grouped = tokens.group_by("key", use_threads=False).aggregate(
+            [("value", "list")]
+        )
+        return pd.Series(
+            pc.binary_join(grouped["value_list"], ";").to_numpy(zero_copy_only=False),
+            index=grouped["key"].to_numpy(zero_copy_only=False),
+        )
 
     def _normalize_wappalyzer_data(self, wappalyzer_data: pd.Series) -> pd.DataFrame:
 
         """
-        normalize the result of wappalyzed api data and create a pandas dataframe
-        1. convert to json
-        2.apply json normalize to the whole column
+        normalize the result of wappalyzed api data and create a pandas dataframe,
+        the column holds the dicts of category to technologies read from the items
 
         Returns: a pandas dataframe
         """
-        wappalyzer_data = wappalyzer_data.str.replace("'", '"', regex=True)
+        return pd.json_normalize(wappalyzer_data.tolist())
 
-        return pd.json_normalize(wappalyzer_data.apply(ast.literal_eval).tolist())
-
-    def _load_item_data(self):
+    def _load_item_data(self, file_folder: Optional[Path] = None) -> dict:
         """
-        left join all engineered data frames together,
-        and save the generated report file under scraped results
+        load and engineer the item data under file_folder, by default the scraped
+        results folder
+
+        Returns: a dict of item name to engineered dataframe
         """
+        if file_folder is None:
+            file_folder = settings["FILE_FOLDER"]
 
         file_names = [
             name.lower() for name, _ in items.__dict__.items() if "Item" in name
         ]
         file_paths = {
-            file_name: settings["FILE_FOLDER"] / f"{file_name}.csv"
-            for file_name in file_names
+            file_name: file_folder / f"{file_name}.parquet" for file_name in file_names
         }
 
+        # list columns are joined with "," as the report shows them
         dfs = {
-            file_name: pd.read_csv(file_path)
+            file_name: data
             for file_name, file_path in file_paths.items()
-            if not is_empty_file(file_path)
+            if (data := read_items(file_path, list_separator=",")) is not None
         }
+        return self._engineer_item_data(dfs)
+
+    def _engineer_item_data(self, dfs: dict[str, pd.DataFrame]) -> dict:
+        """
+        engineer the dataframe of every item type
 
+        Returns: a dict of item name to engineered dataframe
+        """
         eng_item_data_dict = {}
         for file_name, data in dfs.items():
             if "general" in file_name:
@@ -158,17 +223,40 @@ class CreateReportDataSet:
 
         return eng_item_data_dict
 
+    def _join_item_data(self, eng_item_data_dict: dict) -> pd.DataFrame:
+        """
+        left join all engineered data frames together
+
+        Returns: the report dataframe
+        """
+        return reduce(
+            lambda df1, df2: df1.join(df2, on=self.join_index),
+            eng_item_data_dict.values(),
+        )
+
     def join_all_scraped_items(self):
         """
         left join all engineered data frames together,
         and save the generated report file under scraped results
         """
-        eng_item_data_dict = self._load_item_data()
+        self._save_report(self._load_item_data())
 
-        report_df = reduce(
-            lambda df1, df2: df1.join(df2, on=self.join_index),
-            eng_item_data_dict.values(),
-        )
+    def dump_company_aggregates(self, aggregates_folder: Path):
+        """
+        create the report from the per company aggregates the item pipeline kept
+        while crawling. they are saved like the item files with one row per company,
+        so the same engineering runs on one row per company instead of all scraped rows.
+        unlike join_all_scraped_items, repeated phones, emails, contact pages and
+        social media links of a company are listed once
+        """
+        self._save_report(self._load_item_data(aggregates_folder))
+
+    def _save_report(self, eng_item_data_dict: dict):
+        """
+        left join the engineered data frames,
+        and save the generated report file under scraped results
+        """
+        report_df = self._join_item_data(eng_item_data_dict)
 
         report_df.dropna(how="all", axis=1, inplace=True)
 
@@ -180,3 +268,142 @@ class CreateReportDataSet:
             report_df.shape,
             save_file_path,
         )
+
+    def stream_all_scraped_items(
+        self, partitions: int = 16, max_workers: Optional[int] = None
+    ):
+        """
+        create the same report as join_all_scraped_items without loading all items
+        at once.
+        1. the item files are split into partitions by a hash of the company url,
+        reading them in batches
+        2. each partition is engineered and joined in a process pool, and its report
+        rows are kept in the partition folder
+        3. the partition reports are written as csv in the process pool, with the
+        columns of all partitions, columns empty in all partitions are dropped.
+        the report file is the header followed by the partition files.
+
+        the peak memory is set by the size of a partition, the rows are ordered by
+        partition instead of by the order they were scraped in.
+        """
+        file_folder = settings["FILE_FOLDER"]
+        save_file_path = file_folder / f"{self.leadspider_name}__report.csv"
+        with tempfile.TemporaryDirectory(dir=file_folder) as partition_dir:
+            partition_folders = [
+                Path(partition_dir) / f"part-{index}" for index in range(partitions)
+            ]
+            for file_name in [
+                name.lower() for name, _ in items.__dict__.items() if "Item" in name
+            ]:
+                partition_item_file(
+                    file_folder / f"{file_name}.parquet",
+                    partition_folders,
+                    key=self.join_index,
+                )
+
+            with ProcessPoolExecutor(max_workers=max_workers) as pool:
+                partition_columns = list(
+                    pool.map(
+                        _build_report_partition,
+                        [self] * partitions,
+                        partition_folders,
+                    )
+                )
+                columns = _merge_partition_columns(partition_columns)
+                built_folders = [
+                    partition_folder
+                    for partition_folder, result in zip(
+                        partition_folders, partition_columns
+                    )
+                    if result is not None
+                ]
+                rows = sum(
+                    pool.map(
+                        _write_report_partition,
+                        built_folders,
+                        [columns] * len(built_folders),
+                    )
+                )
+
+            with open(save_file_path, "w", encoding="utf-8", newline="") as file:
+                pd.DataFrame(
+                    columns=columns, index=pd.Index([], name=self.join_index)
+                ).to_csv(file, sep=",", quoting=csv.QUOTE_NONNUMERIC)
+                for partition_folder in built_folders:
+                    with open(
+                        partition_folder / REPORT_PARTITION_CSV,
+                        encoding="utf-8",
+                        newline="",
+                    ) as partition_file:
+                        shutil.copyfileobj(partition_file, file)
+
+        logging.info(
+            "final report dataframe is of %s, saved under %s",
+            (rows, len(columns)),
+            save_file_path,
+        )
+
+
+def _merge_partition_columns(
+    partition_columns: list[Optional[tuple[list[str], list[str]]]]
+) -> list[str]:
+    """
+    merge the report columns of all partitions. columns only some partitions have,
+    e.g. wappalyzer categories, are placed after the column they follow in the
+    first partition having them. columns empty in all partitions are dropped
+
+    Returns: a list of columns
+    """
+    columns, filled_columns = [], set()
+    for result in partition_columns:
+        if result is None:
+            continue
+        position = 0
+        for column in result[0]:
+            if column in columns:
+                position = columns.index(column) + 1
+            else:
+                columns.insert(position, column)
+                position += 1
+        filled_columns.update(result[1])
+    return [column for column in columns if column in filled_columns]
+
+
+def _build_report_partition(
+    report: CreateReportDataSet, partition_folder: Path
+) -> Optional[tuple[list[str], list[str]]]:
+    """
+    engineer and join the items of one partition, and keep its report rows in the
+    partition folder. runs in the process pool of stream_all_scraped_items
+
+    Returns: the columns of the partition report and the columns with any values,
+    None if the partition has no general information items
+    """
+    eng_item_data_dict = report._load_item_data(  # pylint: disable=W0212
+        partition_folder
+    )
+    if not any("general" in file_name for file_name in eng_item_data_dict):
+        return None
+    report_df = report._join_item_data(eng_item_data_dict)  # pylint: disable=W0212
+    report_df.to_pickle(partition_folder / REPORT_PARTITION_FILE)
+    return (
+        report_df.columns.tolist(),
+        report_df.columns[report_df.notna().any()].tolist(),
+    )
+
+
+def _write_report_partition(partition_folder: Path, columns: list[str]) -> int:
+    """
+    write the report rows of one partition with the given columns as csv without
+    header. runs in the process pool of stream_all_scraped_items
+
+    Returns: the number of rows
+    """
+    report_df = pd.read_pickle(partition_folder / REPORT_PARTITION_FILE)
+    report_df.reindex(columns=columns).to_csv(
+        partition_folder / REPORT_PARTITION_CSV,
+        sep=",",
+        quoting=csv.QUOTE_NONNUMERIC,
+        header=False,
+    )
+    return len(report_df)
@@ -0,0 +1,40 @@
+""" Decoded text of a response, shared by all extractors"""
+from dataclasses import dataclass
+from functools import cached_property
+from weakref import WeakKeyDictionary
+
+import scrapy
+
+_response_text_cache: WeakKeyDictionary = WeakKeyDictionary()
+
+
+@dataclass
+class ResponseText:
+    """
+    text view of one response
+    """
+
+    text: str
+
+    @cached_property
+    def lower(self) -> str:
+        """
+        lower the text on first use only
+
+        Returns: the lowered text of the response
+        """
+        return self.text.lower()
+
+
+def get_response_text(response: scrapy.http.TextResponse) -> ResponseText:
+    """
+    get the text view of a response, the body is decoded once per response.
+    decoding goes through scrapy's response.text, which detects the charset from
+    the BOM, the Content-Type header and the html meta tags before falling back to
+    inferring it from the body, and which the selectors of the same response reuse.
+
+    Returns: the ResponseText of the response
+    """
+    if response not in _response_text_cache:
+        _response_text_cache[response] = ResponseText(text=response.text)
+    return _response_text_cache[response]
@@ -0,0 +1,105 @@
+""" Per company scrape state for incremental re-scrapes"""
+import hashlib
+import json
+import sqlite3
+from pathlib import Path
+from time import time
+from typing import Any, Optional, Union
+
+
+def hash_input(values: Any) -> str:
+    """
+    hash the input a company was scraped from, e.g. its row in the gsheet
+
+    Returns: hex digest of the json representation of the values
+    """
+    return hashlib.sha1(  # nosec B324
+        json.dumps(values, sort_keys=True, default=str).encode("utf-8")
+    ).hexdigest()
+
+
+class ScrapeStateStore:
+    """
+    remember for every start url when it was scraped, which company url it
+    resolved to, the hash of its input and the status.
+    the state is written when the store is closed, so an aborted crawl leaves
+    the previous state untouched.
+    """
+
+    def __init__(self, state_file: Union[Path, str]):
+        Path(state_file).parent.mkdir(parents=True, exist_ok=True)
+        self.db = sqlite3.connect(state_file)
+        self.db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS companies (
+                start_url TEXT PRIMARY KEY,
+                company_url TEXT,
+                input_hash TEXT,
+                status TEXT,
+                last_scraped REAL
+            )
+            """
+        )
+
+    def due_companies(self, inputs: dict[str, str], freshness_secs: int) -> list[str]:
+        """
+        select the start urls to scrape: new ones, ones whose input hash changed,
+        ones that failed last time and ones scraped longer than freshness_secs ago
+
+        Returns: a list of start urls
+        """
+        states = {
+            start_url: (input_hash, status, last_scraped)
+            for start_url, input_hash, status, last_scraped in self.db.execute(
+                "SELECT start_url, input_hash, status, last_scraped FROM companies"
+            )
+        }
+        now = time()
+        due = []
+        for start_url, input_hash in inputs.items():
+            state = states.get(start_url)
+            if (
+                state is None
+                or state[0] != input_hash
+                or state[1] != "200"
+                or now - state[2] > freshness_secs
+            ):
+                due.append(start_url)
+        return due
+
+    def company_urls(self, start_urls: list[str]) -> set[str]:
+        """
+        Returns: the company urls the given start urls resolved to last time
+        """
+        start_urls = set(start_urls)
+        return {
+            company_url
+            for start_url, company_url in self.db.execute(
+                "SELECT start_url, company_url FROM companies"
+            )
+            if start_url in start_urls and company_url
+        }
+
+    def record(
+        self,
+        start_url: str,
+        company_url: Optional[str],
+        input_hash: Optional[str],
+        status: str,
+    ) -> None:
+        """
+        record the outcome of scraping a start url
+        """
+        self.db.execute(
+            "INSERT OR REPLACE INTO companies"
+            " (start_url, company_url, input_hash, status, last_scraped)"
+            " VALUES (?, ?, ?, ?, ?)",
+            (start_url, company_url, input_hash, status, time()),
+        )
+
+    def close(self) -> None:
+        """
+        write the recorded state and close the store
+        """
+        self.db.commit()
+        self.db.close()
@@ -21,15 +21,21 @@ NEWSPIDER_MODULE = "mondu_website_scrapper.spiders"
 ROBOTSTXT_OBEY = False
 
 # Configure maximum concurrent requests performed by Scrapy (default: 16)
-# CONCURRENT_REQUESTS = 32
+# the concurrency of every domain is adapted by the downloader middleware, so a
+# slow shop holds few slots while fast shops use the rest
+CONCURRENT_REQUESTS = 64
 
 # Configure a delay for requests for the same website (default: 0)
 # See https://docs.scrapy.org/en/latest/topics/settings.html#download-delay
 # See also autothrottle settings and docs
 # DOWNLOAD_DELAY = 3
 # The download delay setting will honor only one of:
-# CONCURRENT_REQUESTS_PER_DOMAIN = 16
+CONCURRENT_REQUESTS_PER_DOMAIN = 8
 # CONCURRENT_REQUESTS_PER_IP = 16
+# a tarpitting shop holds a slot for at most DOWNLOAD_TIMEOUT seconds (default: 180)
+DOWNLOAD_TIMEOUT = 30
+# threads resolving the host names of the shops (default: 10)
+REACTOR_THREADPOOL_MAXSIZE = 20
 
 # Disable cookies (enabled by default)
 # COOKIES_ENABLED = False
@@ -51,15 +57,48 @@ ROBOTSTXT_OBEY = False
 
 # Enable or disable downloader middlewares
 # See https://docs.scrapy.org/en/latest/topics/downloader-middleware.html
-# DOWNLOADER_MIDDLEWARES = {
-#    'mondu_website_scrapper.middlewares.MonduWebsiteScrapperDownloaderMiddleware': 543,
-# }
+# the adaptive concurrency middleware comes after the retry middleware (550), so it
+# sees the errors before they are retried
+DOWNLOADER_MIDDLEWARES = {
+    "mondu_website_scrapper.middlewares.MonduWebsiteScrapperDownloaderMiddleware": 560,
+    "scrapy.downloadermiddlewares.httpcache.HttpCacheMiddleware": None,
+    "mondu_website_scrapper.httpcache.RevalidatingHttpCacheMiddleware": 900,
+}
+
+# adaptive concurrency per domain: a domain starts with ADAPTIVE_CONCURRENCY_START
+# parallel requests and gets one more after as many responses without congestion,
+# up to CONCURRENT_REQUESTS_PER_DOMAIN. responses with an ADAPTIVE_ERROR_CODES
+# status halve it, and so does an average latency above ADAPTIVE_CONGESTION_FACTOR
+# times the fastest response of the domain plus ADAPTIVE_CONGESTION_LATENCY
+# seconds. domains slower than ADAPTIVE_TARPIT_LATENCY seconds or failing more
+# than ADAPTIVE_MAX_ERROR_RATE of their requests drop to ADAPTIVE_CONCURRENCY_MIN.
+# follow up pages of domains slower than ADAPTIVE_SLOW_LATENCY seconds are
+# requested last
+ADAPTIVE_CONCURRENCY_ENABLED = True
+ADAPTIVE_CONCURRENCY_START = 2
+ADAPTIVE_CONCURRENCY_MIN = 1
+ADAPTIVE_SLOW_LATENCY = 2.0
+ADAPTIVE_CONGESTION_FACTOR = 2.0
+ADAPTIVE_CONGESTION_LATENCY = 1.0
+ADAPTIVE_TARPIT_LATENCY = 10.0
+ADAPTIVE_MAX_ERROR_RATE = 0.5
+ADAPTIVE_ERROR_CODES = [408, 429, 500, 502, 503, 504]
 
 # Enable or disable extensions
 # See https://docs.scrapy.org/en/latest/topics/extensions.html
-# EXTENSIONS = {
-#    'scrapy.extensions.telnet.TelnetConsole': None,
-# }
+EXTENSIONS = {
+    "mondu_website_scrapper.crawl_metrics.CrawlMetricsExtension": 500,
+}
+
+# crawl metrics: timers of the extractors, wappalyzer and the item export, download
+# and parse time per domain, dns lookups, scheduler queue depth and requests in
+# flight. written to METRICS_JSON_FILE every METRICS_INTERVAL seconds and at the end
+# of the crawl, served in the prometheus text format on METRICS_PORT, 0 serves none
+METRICS_ENABLED = True
+METRICS_INTERVAL = 30
+METRICS_PORT = 0
+METRICS_TOP_DOMAINS = 20
+DNS_RESOLVER = "mondu_website_scrapper.crawl_metrics.TimedResolver"
 
 # Configure item pipelines
 # See https://docs.scrapy.org/en/latest/topics/item-pipeline.html
@@ -82,11 +121,21 @@ ITEM_PIPELINES = {
 
 # Enable and configure HTTP caching (disabled by default)
 # See https://docs.scrapy.org/en/latest/topics/downloader-middleware.html#httpcache-middleware-settings pylint: disable=line-too-long
-# HTTPCACHE_ENABLED = True
-# HTTPCACHE_EXPIRATION_SECS = 0
-# HTTPCACHE_DIR = 'httpcache'
-# HTTPCACHE_IGNORE_HTTP_CODES = []
-# HTTPCACHE_STORAGE = 'scrapy.extensions.httpcache.FilesystemCacheStorage'
+HTTPCACHE_ENABLED = True
+# time to live in seconds of pages without a page type in HTTPCACHE_PAGE_TYPE_TTL
+HTTPCACHE_EXPIRATION_SECS = 86400
+HTTPCACHE_DIR = str(Path.cwd().parent / "httpcache")
+HTTPCACHE_IGNORE_HTTP_CODES = [408, 429, 500, 502, 503, 504]
+HTTPCACHE_STORAGE = "mondu_website_scrapper.httpcache.SqliteCacheStorage"
+HTTPCACHE_POLICY = "mondu_website_scrapper.httpcache.PageTypeTTLPolicy"
+# time to live in seconds of cached pages per page type, stale pages are revalidated
+HTTPCACHE_PAGE_TYPE_TTL = {
+    "landing": 86400,
+    "product": 3 * 86400,
+    "contact": 30 * 86400,
+}
+# zlib compression level of cached bodies
+HTTPCACHE_COMPRESSION_LEVEL = 6
 
 
 # Argument Set Up
@@ -106,12 +155,67 @@ START_URLS = [
     "https://jysk.at/",
 ]
 
-# column name of urls given from gsheet
+# column name of urls given from gsheet, or from a csv or parquet input file
 INPUT_URL_COLUMN_NAME = "company_url_cleaned"
+# rows read at once from an input file, the start urls are requested while the
+# rest of the file is read
+START_URL_CHUNK_ROWS = 10000
 
 # file folder for scraped results
 FILE_FOLDER = Path.cwd().parent / "scraped_results"
 
+# scraped items are stored in one parquet file per item type, written in row
+# groups of ITEM_STORAGE_BATCH_SIZE items
+ITEM_STORAGE_BATCH_SIZE = 1000
+ITEM_STORAGE_COMPRESSION = "zstd"
+
+# per company aggregates of the scraped items the report is built from, saved
+# every COMPANY_AGGREGATES_CHECKPOINT_SECS seconds while crawling, with a
+# checkpoint of the crawl if CHECKPOINT_ENABLED
+COMPANY_AGGREGATES_FOLDER = FILE_FOLDER / "company_aggregates"
+COMPANY_AGGREGATES_CHECKPOINT_SECS = 60
+
+# checkpoints of the finished companies, their item parts and aggregates, kept in
+# CHECKPOINT_FOLDER until the crawl finishes. an interrupted crawl continues from
+# its last checkpoint with --resume
+CHECKPOINT_ENABLED = True
+CHECKPOINT_FOLDER = FILE_FOLDER / "checkpoint"
+
+# the streaming report splits the items into partitions by company url and builds
+# them in a process pool, 0 workers lets concurrent.futures decide
+REPORT_PARTITIONS = 16
+REPORT_MAX_WORKERS = 0
+
+# distributed crawl: the start urls are split by domain into DISTRIBUTED_SHARDS
+# shards, crawled by worker processes taking them from DISTRIBUTED_QUEUE, a folder
+# or a redis:// url. every shard is written to its own folder in
+# DISTRIBUTED_OUTPUT_FOLDER and merged into FILE_FOLDER, see distributed.py.
+# a worker renews the lease of the shard it crawls, a shard whose lease was not
+# renewed for DISTRIBUTED_LEASE_SECS is taken by another worker
+DISTRIBUTED_SHARDS = 64
+DISTRIBUTED_QUEUE = FILE_FOLDER / "shard_queue"
+DISTRIBUTED_OUTPUT_FOLDER = FILE_FOLDER / "shards"
+DISTRIBUTED_LEASE_SECS = 600
+
+# json file of the crawl metrics, see METRICS_ENABLED
+METRICS_JSON_FILE = FILE_FOLDER / "crawl_metrics.json"
+
+# state of every scraped company, used by the incremental mode
+SCRAPE_STATE_FILE = FILE_FOLDER / "scrape_state.sqlite"
+# in incremental mode, companies scraped longer ago than this are scraped again
+INCREMENTAL_FRESHNESS_SECS = 7 * 86400
+
+# wappalyzer analysis runs off the reactor thread, in a "thread" or "process" pool
+WAPPALYZER_EXECUTOR = "thread"
+# number of wappalyzer workers, 0 lets concurrent.futures decide
+WAPPALYZER_MAX_WORKERS = 4
+# folder of the versioned wappalyzer fingerprint store
+WAPPALYZER_DB_FOLDER = Path.home() / ".cache" / "mondu_website_scrapper" / "wappalyzer"
+# pin a fingerprint version from the store, None uses the latest technologies file
+WAPPALYZER_DB_VERSION = None
+# technologies.json to add to the store, None uses the one bundled with Wappalyzer
+WAPPALYZER_TECHNOLOGIES_FILE = None
+
 
 # webshop searching keywords
 WEBSHOP_KEYWORDS = [
@@ -182,17 +286,63 @@ WEBSYSTEMS_KEYWORDS = [
     "plentymarkets",
 ]
 
-# currency sign
-CURRENCY_SIGN = "$|EUR|€|GBP|£"
+# link searching patterns, product, contact and webshop patterns are searched in
+# the part of a link following the url of the current page
+PRODUCT_LINK_PATTERN = "collection|product|produkte|kategories|categories"
+CONTACT_LINK_PATTERN = "impressum|kontakt"
+SOCIAL_MEDIA_LINK_PATTERN = "linkedin|facebook|youtube|twitter|instagram|xing"
+WEBSHOP_LINK_PATTERN = "cart|shop|online"
+
+# per company crawl budget of follow up pages
+MAX_PRODUCT_PAGES_PER_COMPANY = 50
+MAX_CONTACT_PAGES_PER_COMPANY = 5
+# follow up pages of one company downloaded at the same time
+CONCURRENT_PAGES_PER_COMPANY = 8
+# stop following product pages of a company once, after the minimum number of
+# pages, one more page moves the mean price by less than the relative tolerance
+PRICE_CONVERGENCE_MIN_PAGES = 10
+PRICE_CONVERGENCE_TOLERANCE = 0.01
 
-# price searching pattern
-PRICE_PATTERN = (
-    r"\d*[\.\,]?\d+(?=\s?[$|EUR|€|GBP|£])|(?<=[$|EUR|€|GBP|£])\s?\d*[\.\,]?\d+"
-)
+# extraction results of the last CONTENT_DEDUP_MAX_PAGES pages are kept by a hash
+# of their body, 0 keeps none. a page with the same body as a page analysed before
+# reuses its results. pages of CONTENT_DEDUP_NEAR_PAGE_TYPES also reuse the results
+# of a page whose simhash differs in at most CONTENT_DEDUP_MAX_DISTANCE of 64 bits,
+# 0 only reuses identical pages. product and contact pages of shops on the same
+# theme are nearly the same with other prices and contacts, so only landing pages
+# are matched by simhash
+CONTENT_DEDUP_MAX_PAGES = 100_000
+CONTENT_DEDUP_MAX_DISTANCE = 3
+CONTENT_DEDUP_NEAR_PAGE_TYPES = ["landing"]
+
+# webshop link text searching keywords
+WEBSHOP_LINK_TEXT_KEYWORDS = [
+    "shop",
+    "cart",
+    "Warenkorb",
+    "Einkaufswagen",
+    "Checkout",
+    "Jetzt bezahlen",
+    "Zahlungsarten",
+]
+
+# currencies of prices by the sign stored in the items, with the signs and ISO 4217
+# codes prices are written with in structured data and in the text of a page
+CURRENCY_SIGNS = {
+    "€": ["EUR"],
+    "$": ["USD"],
+    "£": ["GBP"],
+}
 
 # searching phone pattern
 # TODO write tests for it
 PHONE_PATTERN = r"(?:\B\+ ?43|\+49)(?: *[(-]? *\d(?:[ \d]*\d)?)? *(?:[)-] *)?\d+ *(?:[/)-] *)?\d+ *(?:[/)-] *)?\d+(?: *- *\d+)?"  # pylint: disable=line-too-long
 
-# searching email pattern
-EMAIL_PATTERN = r"[\w.+-]+@[\w-]+\.[\w.-]+"
+# searching email pattern, an email only starts after a character that cannot be
+# part of it, so long runs of word characters are not backtracked from every position
+EMAIL_PATTERN = r"(?<![\w.+-])[\w.+-]+@[\w-]+\.[\w.-]+"
+
+# texts longer than PATTERN_MAX_WINDOW characters are matched window by window, with
+# windows overlapping by PATTERN_WINDOW_OVERLAP characters, so no pattern can
+# backtrack over a whole page. 0 matches the whole text at once
+PATTERN_MAX_WINDOW = 200_000
+PATTERN_WINDOW_OVERLAP = 1000
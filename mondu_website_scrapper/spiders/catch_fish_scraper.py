@@ -1,22 +1,48 @@
 """ Define scraper spider"""
 
 import logging
-import re
 import time
-from typing import Any, Optional
+from typing import Any, AsyncIterator, Iterator, Optional
+from urllib.parse import urlparse
 
 import scrapy
 from scrapy.crawler import CrawlerProcess
 from scrapy.linkextractors import LinkExtractor
+from scrapy.utils.defer import maybe_deferred_to_future
 from scrapy.utils.project import get_project_settings
-from Wappalyzer import Wappalyzer, WebPage
 
+from mondu_website_scrapper.adaptive_concurrency import AdaptiveConcurrency
+from mondu_website_scrapper.content_fingerprint import MISSING, ContentFingerprintCache
+from mondu_website_scrapper.crawl_budget import CrawlBudget
+from mondu_website_scrapper.crawl_checkpoint import CrawlCheckpoint
+from mondu_website_scrapper.crawl_metrics import CrawlMetrics
+from mondu_website_scrapper.distributed import crawl_distributed, lead_urls
+from mondu_website_scrapper.fingerprint_store import WappalyzerFingerprintStore
 from mondu_website_scrapper.gsheet_api.read_from_gsheet import read_from_gsheet
 from mondu_website_scrapper.items import ContactItem, GeneralInformationItem, PriceItem
+from mondu_website_scrapper.keyword_matcher import KeywordMatcher
+from mondu_website_scrapper.link_classifier import LinkClassifier
+from mondu_website_scrapper.pattern_registry import PatternRegistry
+from mondu_website_scrapper.price_extractor import PriceExtractor
 from mondu_website_scrapper.report import CreateReportDataSet
+from mondu_website_scrapper.response_text import get_response_text
+from mondu_website_scrapper.scrape_state import ScrapeStateStore, hash_input
+from mondu_website_scrapper.start_url_feed import (
+    StartUrlFeed,
+    lead_url_sources,
+    normalize_url,
+)
+from mondu_website_scrapper.wappalyzer_analysis import WappalyzerAnalyzer
 
 settings = get_project_settings()
-wappalyzer = Wappalyzer.latest()
+
+# item created from each type of follow up page
+FOLLOW_UP_ITEMS = {"product": PriceItem, "contact": ContactItem}
+# spider callback of each type of follow up page
+FOLLOW_UP_CALLBACKS = {
+    "product": "extract_price_info",
+    "contact": "extract_contact_information",
+}
 
 # pylint: disable=R0201
 
@@ -28,7 +54,7 @@ class LeadSpider(scrapy.Spider):
     Returns: the direct returns are items that in python dictionary format.
     It will be later passed to pipelines.
 
-    Yields: yeild an item and item pipeline will export it as a csv file
+    Yields: yeild an item and item pipeline will export it as a parquet file
     """
 
     name = "findingnemo"
@@ -37,185 +63,350 @@ class LeadSpider(scrapy.Spider):
         "USER_AGENT": "Mozilla/5.0 (compatible; Googlebot/2.1; +http://www.google.com/bot.html)"
     }
 
-    def _get_start_urls(self):
-
-        if self.use_gsheet:
-            # self.settings["INPUT_URL_COLUMN_NAME"] is not None:
-            input_column = self.settings["INPUT_URL_COLUMN_NAME"]
-
-            return (
-                read_from_gsheet(input_columns=[input_column])[input_column]
-                .unique()
-                .tolist()
+    def _get_start_urls(self) -> StartUrlFeed:
+        """
+        Returns: a feed of the external urls if given, otherwise of the urls of the
+        input file, the gsheet or START_URLS, read while they are requested
+        """
+        return StartUrlFeed(
+            lead_url_sources(
+                self.settings, self.use_gsheet, self.external_urls, self.input_file
             )
-        else:
-            return self.settings["START_URLS"]
+        )
 
-    def __init__(self, use_gsheet: bool, *args, **kwargs):
+    def _get_start_inputs(self) -> dict[str, str]:
+        """
+        hash the input of every start url, which are all gsheet rows of the url
+        when reading from the gsheet, otherwise the url itself
+
+        Returns: a dict of start url to input hash
+        """
+        if self.external_urls is None and self.input_file is None and self.use_gsheet:
+            input_column = self.settings["INPUT_URL_COLUMN_NAME"]
+            rows = read_from_gsheet(input_columns=None)
+            return {
+                url: hash_input(group.to_dict("records"))
+                for url, group in rows.groupby(
+                    rows[input_column].map(normalize_url), sort=False
+                )
+            }
+        return {url: hash_input(url) for url in self._get_start_urls()}
+
+    def __init__(
+        self,
+        use_gsheet: bool,
+        *args,
+        incremental: bool = False,
+        resume: bool = False,
+        fresh_start: bool = False,
+        input_file: Optional[str] = None,
+        **kwargs,
+    ):
         super(LeadSpider, self).__init__(*args, **kwargs)
         self.settings = settings
 
         self.external_urls = kwargs.get("external_urls", None)
+        self.input_file = input_file
         self.use_gsheet = use_gsheet
-        if self.external_urls is not None:
-
-            self.start_urls = self.external_urls
+        self.incremental = incremental
+        # remove the checkpoint of an interrupted crawl instead of failing
+        self.fresh_start = fresh_start
+        self.wappalyzer_analyzer = WappalyzerAnalyzer(
+            executor_type=self.settings["WAPPALYZER_EXECUTOR"],
+            max_workers=self.settings.getint("WAPPALYZER_MAX_WORKERS") or None,
+            store=WappalyzerFingerprintStore(
+                store_folder=self.settings["WAPPALYZER_DB_FOLDER"],
+                version=self.settings["WAPPALYZER_DB_VERSION"],
+                technologies_file=self.settings["WAPPALYZER_TECHNOLOGIES_FILE"],
+            ),
+        )
+        self.page_keyword_matcher = KeywordMatcher(
+            {
+                "tagged_by_b2b_words": self.settings["B2B_KEYWORDS"],
+                "webshop_system": self.settings["WEBSYSTEMS_KEYWORDS"],
+            }
+        )
+        self.payment_keyword_matcher = KeywordMatcher(
+            {"payments": self.settings["PAYMENTS_KEYWORDS"]}
+        )
+        # timers of the extractors, collected by the crawl metrics extension
+        self.metrics = CrawlMetrics()
+        # every pattern is compiled here, a bad pattern fails before any request
+        self.patterns = PatternRegistry.from_settings(self.settings)
+        self.link_classifier = LinkClassifier(
+            product_pattern=self.patterns["PRODUCT_LINK_PATTERN"],
+            contact_pattern=self.patterns["CONTACT_LINK_PATTERN"],
+            social_media_pattern=self.patterns["SOCIAL_MEDIA_LINK_PATTERN"],
+            webshop_pattern=self.patterns["WEBSHOP_LINK_PATTERN"],
+            webshop_text_pattern=self.patterns["WEBSHOP_LINK_TEXT_KEYWORDS"],
+        )
+        self.price_extractor = PriceExtractor(
+            self.settings["CURRENCY_SIGNS"], self.patterns
+        )
+        # extraction results of pages by their content, shared by duplicated pages
+        self.content_cache = ContentFingerprintCache(
+            max_entries=self.settings.getint("CONTENT_DEDUP_MAX_PAGES"),
+            max_distance=self.settings.getint("CONTENT_DEDUP_MAX_DISTANCE"),
+            near_page_types=tuple(
+                self.settings.getlist("CONTENT_DEDUP_NEAR_PAGE_TYPES")
+            ),
+        )
+        self.crawl_budget = CrawlBudget(
+            max_pages={
+                "product": self.settings.getint("MAX_PRODUCT_PAGES_PER_COMPANY"),
+                "contact": self.settings.getint("MAX_CONTACT_PAGES_PER_COMPANY"),
+            },
+            concurrent_pages=self.settings.getint("CONCURRENT_PAGES_PER_COMPANY"),
+            price_min_pages=self.settings.getint("PRICE_CONVERGENCE_MIN_PAGES"),
+            price_tolerance=self.settings.getfloat("PRICE_CONVERGENCE_TOLERANCE"),
+        )
+        # latency of every domain, shared with the downloader middleware adapting
+        # the concurrency of the domains
+        self.adaptive_concurrency = AdaptiveConcurrency.from_settings(self.settings)
+        if self.incremental:
+            self.scrape_state = ScrapeStateStore(self.settings["SCRAPE_STATE_FILE"])
+            self.start_inputs = self._get_start_inputs()
+            due_urls = self.scrape_state.due_companies(
+                self.start_inputs, self.settings.getint("INCREMENTAL_FRESHNESS_SECS")
+            )
+            self.logger.info(
+                "incremental mode: scraping %s of %s companies",
+                len(due_urls),
+                len(self.start_inputs),
+            )
+            self.start_urls = StartUrlFeed([lambda: due_urls])
         else:
             self.start_urls = self._get_start_urls()
+        self.checkpoint = (
+            CrawlCheckpoint(self.settings["CHECKPOINT_FOLDER"])
+            if self.settings.getbool("CHECKPOINT_ENABLED")
+            else None
+        )
+        # landing pages parsed, company url -> start url, until the company is done
+        self.company_start_urls: dict[str, str] = {}
+        # start urls of the last checkpoint not finished, requested before the feed
+        self.pending_start_urls: list[str] = []
+        self.resume = self._resume(resume)
 
-    def parse(self, response) -> scrapy.Item:  # pylint: disable=arguments-differ
+    def _resume(self, resume: bool) -> bool:
         """
-        the parse method inherited from scrapy.Spider. overwrite it with our own returns.
+        continue from the last checkpoint, with the start urls of the companies it
+        did not finish, then the start urls it did not request yet
 
-        Yields: item, in a python dict format, containes scraped information.
+        Returns: True if resuming from a checkpoint
         """
-        item = GeneralInformationItem()
-        item["company_url"] = response.url
-        item["status"] = response.status
-        languages = response.css("html").xpath("@lang")
-        for lang in languages:
-            item["languages"] = lang.get()
-
-        item["webshop_urls"] = self.extract_webshop_url(response)
-        item["payments"] = self.extract_payments(response)
-        item["webshop_system"] = self.extract_webshop_system(response)
-        item["tagged_by_b2b_words"] = self.extract_b2b_keywords(response)
-        item["wappalyzer"] = self.extract_wappalyzer_data(response)
-
-        # get information for product
-        link_prod_extractor = LinkExtractor(
-            allow=f"{response.url}.*(collection|product|produkte|kategories|categories)",
-            unique=True,
+        if not resume:
+            return False
+        pending_urls = self.checkpoint.load() if self.checkpoint is not None else None
+        if pending_urls is None:
+            self.logger.warning("no checkpoint to resume from, crawling all companies")
+            return False
+        self.logger.info(
+            "resuming: %s companies finished, %s started ones to scrape again",
+            len(self.checkpoint.finished),
+            len(pending_urls),
+        )
+        self.pending_start_urls = pending_urls
+        self.start_urls = StartUrlFeed(
+            self.start_urls.sources, skip=self.checkpoint.start_urls
         )
+        return True
 
-        for link in link_prod_extractor.extract_links(response):
-            self.logger.info("sending request to product page...")
-            yield scrapy.Request(
-                link.url,
-                callback=self.extract_price_info,
-                cb_kwargs={"company_url": response.url},
-                dont_filter=True,
-            )
+    def closed(self, reason: str) -> None:  # pylint: disable=unused-argument
+        """
+        called by scrapy when the spider is closed, shut down the wappalyzer pool,
+        write the scrape state and put the pattern counters into the crawl stats.
+        the checkpoint is removed once the crawl finished, otherwise it is kept to
+        resume from
+        """
+        self.wappalyzer_analyzer.close()
+        for name, pattern_stats in self.patterns.stats().items():
+            self.logger.info("pattern %s: %s", name, pattern_stats)
+            for key, value in pattern_stats.items():
+                self.crawler.stats.set_value(f"patterns/{name}/{key}", value)
+        self.logger.info("content dedup: %s", dict(self.content_cache.stats))
+        for key, value in self.content_cache.stats.items():
+            self.crawler.stats.set_value(f"content_dedup/{key}", value)
+        if self.incremental:
+            self.scrape_state.close()
+        if self.checkpoint is not None and reason == "finished":
+            self.checkpoint.clear()
+
+    async def start(self) -> AsyncIterator[scrapy.Request]:
+        """
+        the start requests on scrapy 2.13 and later, which no longer calls
+        start_requests by default
 
-        # get information for contact information
+        Yields: requests
+        """
+        for request in self.start_requests():
+            yield request
 
-        link_contact_extractor = LinkExtractor(
-            allow=f"{response.url}.*(impressum|kontakt)",
-            unique=True,
-        )
+    def start_requests(self) -> Iterator[scrapy.Request]:
+        """
+        request the landing page of every start url as it is read from the feed,
+        failed landing pages are recorded in the scrape state
 
-        for link in link_contact_extractor.extract_links(response):
-            self.logger.info("sending request to contact information page...")
+        Yields: requests
+        """
+        for url in self.pending_start_urls:
             yield scrapy.Request(
-                link.url,
-                callback=self.extract_contact_information,
-                cb_kwargs={"company_url": response.url},
-                dont_filter=True,
+                url, dont_filter=True, errback=self._landing_page_failed
+            )
+        for url in self.start_urls:
+            if self.checkpoint is not None:
+                self.checkpoint.add_start_url(url)
+            yield scrapy.Request(
+                url, dont_filter=True, errback=self._landing_page_failed
             )
 
-        # get information for social media
-        link_social_media_extractor = LinkExtractor(
-            allow="linkedin|facebook|youtube|twitter|instagram|xing", unique=True
-        )
-        social_media_lst = []
-
-        for link in link_social_media_extractor.extract_links(response):
-            self.logger.info("looking for social media hyperlinks...")
-            social_media_lst.append(link.url)
-        item["social_media"] = social_media_lst
+    @staticmethod
+    def _start_url(request: scrapy.Request) -> str:
+        """
+        Returns: the start url of a landing page request, before any redirect
+        """
+        return request.meta.get("redirect_urls", [request.url])[0]
 
-        yield item
+    def _record_scrape_state(self, response_or_failure, status: str) -> None:
+        """
+        record the outcome of a landing page in incremental mode
+        """
+        if not self.incremental:
+            return
+        start_url = self._start_url(response_or_failure.request)
+        company_url = (
+            response_or_failure.url
+            if isinstance(response_or_failure, scrapy.http.Response)
+            else None
+        )
+        self.scrape_state.record(
+            start_url, company_url, self.start_inputs.get(start_url), status
+        )
 
-    def extract_webshop_url(self, response: scrapy.http.response) -> list:
+    def _landing_page_failed(self, failure) -> None:
         """
-        extract links that contains keywords related to webshop
+        errback of landing pages
+        """
+        self.logger.info("landing page failed: %s", failure.request.url)
+        self._record_scrape_state(failure, "failed")
+        if self.checkpoint is not None:
+            self.checkpoint.company_done(self._start_url(failure.request), None)
 
-        Returns: a list of links
+    def _item_yielded(self, item: scrapy.Item) -> scrapy.Item:
         """
-        link_url_extractor = LinkExtractor(
-            allow=f"{response.url}.*(cart|shop|online)", unique=True
-        )
+        count an item of a company for the checkpoint
 
-        link_text_extractor = LinkExtractor(
-            restrict_text=[
-                "shop",
-                "cart",
-                "Warenkorb",
-                "Einkaufswagen",
-                "Checkout",
-                "Jetzt bezahlen",
-                "Zahlungsarten",
-            ],
-            unique=True,
-        )
+        Returns: the item
+        """
+        if self.checkpoint is not None:
+            self.checkpoint.item_yielded(item["company_url"])
+        return item
 
-        webshop_links = list(
-            set(
-                link_url_extractor.extract_links(response)
-                + link_text_extractor.extract_links(response)
-            )
+    def _check_company_done(self, company_url: str) -> None:
+        """
+        once the landing page of a company was parsed and none of its follow up
+        pages is queued or downloading, free its crawl budget and mark it as done
+        for the checkpoint
+        """
+        if company_url not in self.company_start_urls or not (
+            self.crawl_budget.company_done(company_url)
+        ):
+            return
+        start_url = self.company_start_urls.pop(company_url)
+        self.crawl_budget.release(company_url)
+        if self.checkpoint is not None:
+            self.checkpoint.company_done(start_url, company_url)
+
+    async def parse(self, response) -> list:  # pylint: disable=arguments-differ
+        """
+        the parse method inherited from scrapy.Spider. overwrite it with our own returns.
+        the wappalyzer analysis is awaited, so the reactor keeps serving other requests
+        while the fingerprints are matched in the pool. every extractor is timed in
+        the crawl metrics, parse as a whole without waiting for wappalyzer.
+        a page with the same or nearly the same content as a landing page analysed
+        before reuses its languages, keywords, payments and wappalyzer data, only
+        the links of the page are classified again.
+        a failed wappalyzer analysis leaves the wappalyzer data empty, and the
+        page is not reused for others.
+
+        Returns: follow up requests and the item, in a python dict format,
+        containes scraped information.
+        """
+        started = time.perf_counter()
+        results = []
+        item = GeneralInformationItem()
+        item["company_url"] = response.url
+        item["status"] = response.status
+        with self.metrics.time("content_fingerprint"):
+            fingerprint = self.content_cache.fingerprint("landing", response)
+            content = self.content_cache.get(fingerprint, response)
+        analysed = content is MISSING
+        if analysed:
+            content = {}
+            languages = response.css("html").xpath("@lang")
+            for lang in languages:
+                content["languages"] = lang.get()
+
+        with self.metrics.time("link_classifier"):
+            links = self.link_classifier.classify(response)
+        item["webshop_urls"] = links.webshop
+        if analysed:
+            with self.metrics.time("extract_payments"):
+                content["payments"] = self.extract_payments(response)
+            with self.metrics.time("extract_page_keywords"):
+                content.update(self.extract_page_keywords(response))
+
+        # get information for product and contact information
+        self.logger.info("sending requests to product and contact information pages...")
+        self.crawl_budget.add_links(response.url, "product", links.product)
+        self.crawl_budget.add_links(response.url, "contact", links.contact)
+        results.extend(self._follow_up(response.url, "product"))
+        results.extend(self._follow_up(response.url, "contact"))
+        self.metrics.add(
+            "parse", time.perf_counter() - started, urlparse(response.url).hostname
         )
 
-        if webshop_links:
-            return [link.url for link in webshop_links]
-        return []
+        # get information for social media
+        item["social_media"] = links.social_media
+        if analysed:
+            # the follow up pages are in the crawl budget already, a failed analysis
+            # must not lose the item and the follow up requests of the company
+            try:
+                with self.metrics.time("wappalyzer"):
+                    content["wappalyzer"] = await self.extract_wappalyzer_data(response)
+                self.content_cache.put(fingerprint, content)
+            except Exception:  # pylint: disable=broad-except
+                self.logger.exception("wappalyzer analysis of %s failed", response.url)
+                content["wappalyzer"] = {}
+        item.update(content)
+
+        results.append(self._item_yielded(item))
+        self._record_scrape_state(response, str(response.status))
+        self.company_start_urls[response.url] = self._start_url(response.request)
+        self._check_company_done(response.url)
+        return results
 
     def extract_payments(self, response: scrapy.http.response) -> list:
         """
         extract payments by looking up pre-defined payments keyword
+        in the alt and src attributes of all images, scanned in one pass
 
         Returns: a list of payments if keywords are matched, otherwise return empty list
         """
-
-        payments_keywords = self.settings["PAYMENTS_KEYWORDS"]
-
-        res_payment = [
-            word.lower() for word in response.xpath("//img/@alt").getall() if word
-        ] + [word.lower() for word in response.xpath("//img/@src").getall() if word]
-        return list(
-            set(
-                pay
-                for scrapped_src in res_payment
-                for pay in payments_keywords
-                if pay in scrapped_src
-            )
+        img_attributes = "\n".join(
+            word for word in response.xpath("//img/@alt | //img/@src").getall() if word
         )
+        return self.payment_keyword_matcher.scan(img_attributes.lower())["payments"]
 
-    def extract_b2b_keywords(self, response: scrapy.http.response) -> list:
-        """
-        extract bb2 keywords pre-defined under settings.py from html body
-
-        Returns: a list of b2b keywords if they are presented
+    def extract_page_keywords(self, response: scrapy.http.response) -> dict[str, list]:
         """
-        b2b_keywords = self.settings["B2B_KEYWORDS"]
+        extract b2b and webshop system keywords pre-defined under settings.py
+        from html body, both keyword families are matched in one pass
 
-        try:
-            data = response.body.decode("utf-8").lower()
-        except UnicodeDecodeError:
-            data = response.body.decode("ISO-8859-1").lower()
-
-        b2b_key_lst = []
-        for word in b2b_keywords:
-            b2b_key_lst += [word] if re.search(word, data) is not None else []
-        return b2b_key_lst
-
-    def extract_webshop_system(self, response: scrapy.http.response) -> list:
-        """
-        extract webshop keywords pre-defined under settings.py from html body
-
-        Returns: a list of webshop system keywords if they are presented
+        Returns: a dict with keys of tagged_by_b2b_words and webshop_system, each a list
+        of keywords if they are presented
         """
-        webshop_sys = []
-        websystem_keywords = self.settings["WEBSYSTEMS_KEYWORDS"]
-        websystem_keywords = [i.lower() for i in websystem_keywords]
-        try:
-            data = response.body.decode("utf-8").lower()
-        except UnicodeDecodeError:
-            data = response.body.decode("ISO-8859-1").lower()
-        for word in websystem_keywords:
-            if re.search(word, data) is not None:
-                webshop_sys.append(word)
-        return webshop_sys
+        return self.page_keyword_matcher.scan(get_response_text(response).lower)
 
     def parse_wappalyzer_data(
         self, response: scrapy.http.response
@@ -230,108 +421,232 @@ class LeadSpider(scrapy.Spider):
             self.logger.info("wappalyzing data from %s...", link)
             yield response.follow(link, callback=self.extract_wappalyzer_data)
 
-    def extract_wappalyzer_data(
+    async def extract_wappalyzer_data(
         self, response: scrapy.http.response
     ) -> dict[str, dict[str, Any]]:
         """
-        using wappalyzer api extract info
+        using wappalyzer api extract info from the already downloaded response,
+        the analysis runs in the wappalyzer pool instead of the reactor thread
 
         returns: dict
         """
-        webpage = WebPage.new_from_url(response.url)
-        return wappalyzer.analyze_with_categories(webpage)
+        return await maybe_deferred_to_future(
+            self.wappalyzer_analyzer.analyze_response(response)
+        )
 
-    def extract_price_info(
-        self, response: scrapy.http.response, company_url: str
-    ) -> scrapy.Item:
+    def _follow_up(self, company_url: str, page_type: str) -> Iterator:
+        """
+        request the next follow up pages of a company allowed by the crawl budget,
+        pages already extracted for another company are not requested again.
+        pages of fast domains are requested before pages of slow domains
+
+        Yields: requests, and items of pages extracted before
         """
-        extract price information by matching any numeric up to 10 digits before and after
-        decimal indicator comma or dot for currency € and $
+        urls, results = self.crawl_budget.next_pages(company_url, page_type)
+        for result in results:
+            yield from self._follow_up_item(company_url, page_type, result)
+        for url in urls:
+            yield scrapy.Request(
+                url,
+                callback=getattr(self, FOLLOW_UP_CALLBACKS[page_type]),
+                errback=self._follow_up_failed,
+                cb_kwargs={"company_url": company_url},
+                meta={"page_type": page_type, "follow_up_url": url},
+                priority=self.adaptive_concurrency.priority(url),
+                dont_filter=True,
+            )
 
-        Returns: A dict with keys of products_avg_price and products_quantity
+    def _follow_up_item(
+        self, company_url: str, page_type: str, result: Optional[dict]
+    ) -> Iterator[scrapy.Item]:
         """
+        create the item of a follow up page for a company
 
-        # self.logger.info("start extracting price...")
-        try:
-            data = response.body.decode("utf-8").lower()
-        except UnicodeDecodeError:
-            data = response.body.decode("ISO-8859-1").lower()
-
-        currency_sign = self.settings["CURRENCY_SIGN"]
-        price_pattern = self.settings["PRICE_PATTERN"]
-
-        if not re.search(currency_sign, data).group():
-            yield None
-
-        currency = re.search(currency_sign, data).group()
-        price_lst = re.findall(price_pattern, data)
-        price_lst = [float(p.strip().replace(",", ".")) for p in price_lst]
-        yield PriceItem(
-            **{
-                "products_avg_price": round(sum(price_lst) / len(price_lst), 2)
-                if price_lst
-                else None,
-                "products_quantity": len(price_lst),
-                "currency": currency,
-                "company_url": company_url,
-            }
+        Yields: an item if anything was extracted from the page
+        """
+        if result is None:
+            return
+        if page_type == "product":
+            self.crawl_budget.add_price(company_url, result["products_avg_price"])
+        yield self._item_yielded(
+            FOLLOW_UP_ITEMS[page_type](company_url=company_url, **result)
         )
 
+    def _follow_up_done(self, meta: dict, result: Optional[dict]) -> Iterator:
+        """
+        share the result of a follow up page with all companies waiting for it,
+        and continue with their next pages
+
+        Yields: items and requests
+        """
+        page_type = meta["page_type"]
+        for company_url in self.crawl_budget.page_done(
+            meta["follow_up_url"], page_type, result
+        ):
+            yield from self._follow_up_item(company_url, page_type, result)
+            yield from self._follow_up(company_url, page_type)
+            self._check_company_done(company_url)
+
+    def _follow_up_failed(self, failure) -> Iterator:
+        """
+        errback of follow up pages, free the slot of the failed page
+
+        Yields: requests of the next follow up pages
+        """
+        self.logger.info("follow up page failed: %s", failure.request.url)
+        yield from self._follow_up_done(failure.request.meta, None)
+
+    def extract_price_info(
+        self, response: scrapy.http.response, company_url: str
+    ) -> Iterator:  # pylint: disable=unused-argument
+        """
+        extract price information from JSON-LD offers, microdata or Open Graph
+        price tags of the page, and only without any of them from prices next to a
+        currency sign or code in the visible text. prices of the most frequent
+        currency are averaged. a page with the same body as a product page
+        extracted before reuses its prices
+
+        Yields: A PriceItem with keys of products_avg_price, products_quantity and
+        currency for every company waiting for the page, and the next follow up
+        requests
+        """
+        result = None
+        try:
+            fingerprint = self.content_cache.fingerprint("product", response)
+            cached = self.content_cache.get(fingerprint, response)
+            if cached is MISSING:
+                with self.metrics.time("extract_price_info", response.url):
+                    page_prices = self.price_extractor.extract(response)
+                if page_prices is not None:
+                    self.logger.debug(
+                        "%s prices from %s of %s",
+                        len(page_prices.prices),
+                        page_prices.source,
+                        response.url,
+                    )
+                    result = page_prices.result()
+                self.content_cache.put(fingerprint, result)
+            else:
+                result = cached
+        finally:
+            # the slot of the page is freed even if the extraction failed
+            yield from self._follow_up_done(response.meta, result)
+
     def extract_contact_information(
         self, response: scrapy.http.response, company_url: str
-    ) -> scrapy.Item:
+    ) -> Iterator:  # pylint: disable=unused-argument
         """
         extract phone and email address from imprint and contact page
         the way to extract those information is quite fuzzy.
         I am brutally searching within imprint and contact page anything digits starting from
         +43 and +49 for AU and DE market respectively.
 
-        Returns: A ContactItem
+        a page with the same body as a contact page extracted before reuses its phones
+        and emails
+
+        Yields: A ContactItem for every company waiting for the page,
+        and the next follow up requests
         """
+        result = None
         try:
-            data = response.body.decode("utf-8").lower()
-        except UnicodeDecodeError:
-            data = response.body.decode("ISO-8859-1").lower()
-        phone_pattern = self.settings["PHONE_PATTERN"]
-        email_pattern = self.settings["EMAIL_PATTERN"]
-        phone = re.findall(phone_pattern, data)
-        email = re.findall(email_pattern, data)
-        yield ContactItem(
-            **{
-                "company_url": company_url,
-                "contact_information_url": response.url,
-                "phone": list(set(phone)),
-                "email": list(set(email)),
-            }
-        )
+            fingerprint = self.content_cache.fingerprint("contact", response)
+            contacts = self.content_cache.get(fingerprint, response)
+            if contacts is MISSING:
+                with self.metrics.time("extract_contact_information", response.url):
+                    data = get_response_text(response).lower
+                    phone = self.patterns["PHONE_PATTERN"].findall(data)
+                    email = self.patterns["EMAIL_PATTERN"].findall(data)
+                contacts = {"phone": list(set(phone)), "email": list(set(email))}
+                self.content_cache.put(fingerprint, contacts)
+            result = {"contact_information_url": response.url, **contacts}
+        finally:
+            # the slot of the page is freed even if the extraction failed
+            yield from self._follow_up_done(response.meta, result)
 
 
 def main(
     use_cache: bool = True,
     use_gsheet: bool = True,
     external_scrape_urls: Optional[list[str]] = None,
+    wappalyzer_db_version: Optional[str] = None,
+    incremental: bool = False,
+    streaming_report: bool = False,
+    distributed_workers: int = 0,
+    resume: bool = False,
+    input_file: Optional[str] = None,
+    fresh_start: bool = False,
 ) -> None:
     """
     this is the main function for calling scraper and generating report
     if use_cache, scraper will skip the scraping process and create report directly by using
-    existing csv files under scraped_results folder, otherwise, scraper start from scratch.
+    existing item files under scraped_results folder, otherwise, scraper start from scratch.
     if use_gsheet, scraper will read given urls from pre-defined gsheet, otherwise, scraper will
     read urls from settings.py.
+    if wappalyzer_db_version is given, the crawl is pinned to that version of the
+    wappalyzer fingerprint store.
+    if incremental, only new companies, companies whose input changed and companies
+    not scraped within INCREMENTAL_FRESHNESS_SECS are scraped, and their results
+    replace their previous rows in the existing item files.
+    the report is built from the per company aggregates kept by the item pipeline.
+    if streaming_report, or there are no aggregates, it is built from the scraped
+    items instead, if streaming_report one partition of companies at a time, for
+    lead lists too large to be joined in memory.
+    if distributed_workers, the urls are split by domain into DISTRIBUTED_SHARDS
+    shards crawled by that many worker processes, and the shards are merged before
+    the report is built. the incremental mode is not distributed.
+    if resume, an interrupted crawl continues from its last checkpoint, only the
+    companies it did not finish are scraped. otherwise the crawl fails if there is
+    a checkpoint, unless fresh_start removes it.
+    if input_file, the urls are read from the INPUT_URL_COLUMN_NAME column of a csv
+    or parquet file, or from the lines of a text file or of stdin for "-".
+    the start urls are read in chunks while the crawl runs, and requested once.
 
     return: Create a report findingnemo__report.csv under scraped_results folder.
     """
-    if not use_cache:
+    if not use_cache and distributed_workers:
+        if incremental or resume:
+            raise ValueError("incremental and resumed crawls cannot be distributed")
+        start_time = time.time()
+        crawl_distributed(
+            lead_urls(use_gsheet, external_scrape_urls, input_file),
+            distributed_workers,
+            {"WAPPALYZER_DB_VERSION": wappalyzer_db_version}
+            if wappalyzer_db_version is not None
+            else None,
+        )
+        logging.info("--- %s seconds ---", (time.time() - start_time))
+    elif not use_cache:
+        if wappalyzer_db_version is not None:
+            settings.set("WAPPALYZER_DB_VERSION", wappalyzer_db_version)
         process = CrawlerProcess(settings)
 
         process.crawl(
-            LeadSpider, use_gsheet=use_gsheet, external_urls=external_scrape_urls
+            LeadSpider,
+            use_gsheet=use_gsheet,
+            external_urls=external_scrape_urls,
+            incremental=incremental,
+            resume=resume,
+            fresh_start=fresh_start,
+            input_file=input_file,
         )
         start_time = time.time()
         process.start()
         logging.info("--- %s seconds ---", (time.time() - start_time))
 
+    start_time = time.time()
     report = CreateReportDataSet()
-    report.join_all_scraped_items()
+    if streaming_report:
+        report.stream_all_scraped_items(
+            partitions=settings.getint("REPORT_PARTITIONS"),
+            max_workers=settings.getint("REPORT_MAX_WORKERS") or None,
+        )
+    elif (
+        settings["COMPANY_AGGREGATES_FOLDER"] / "generalinformationitem.parquet"
+    ).exists():
+        report.dump_company_aggregates(settings["COMPANY_AGGREGATES_FOLDER"])
+    else:
+        report.join_all_scraped_items()
+    logging.info("--- report built in %s seconds ---", (time.time() - start_time))
 
 
 if __name__ == "__main__":
@@ -357,6 +672,53 @@ if __name__ == "__main__":
         nargs="+",
         type=str,
     )
+    parser.add_argument(
+        "--wappalyzer-db-version",
+        help="pin the version of the wappalyzer fingerprint store",
+        type=str,
+    )
+    parser.add_argument(
+        "--incremental",
+        help="only scrape new, changed and stale companies",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--streaming-report",
+        help="build the report one partition of companies at a time",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--distributed-workers",
+        help="crawl in shards of domains on this many worker processes",
+        type=int,
+        default=0,
+    )
+    parser.add_argument(
+        "--resume",
+        help="continue an interrupted crawl from its last checkpoint",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--input-file",
+        help="read urls from a csv, parquet or text file, - for stdin",
+        type=str,
+    )
+    parser.add_argument(
+        "--fresh-start",
+        help="remove the checkpoint of an interrupted crawl and crawl from scratch",
+        action="store_true",
+    )
     # Read arguments from the command line
     args = parser.parse_args()
-    main(args.use_cache, args.use_gsheet, args.external_scrape_urls)
+    main(
+        args.use_cache,
+        args.use_gsheet,
+        args.external_scrape_urls,
+        args.wappalyzer_db_version,
+        args.incremental,
+        args.streaming_report,
+        args.distributed_workers,
+        args.resume,
+        args.input_file,
+        args.fresh_start,
+    )
@@ -0,0 +1,219 @@
+""" Lazy feed of normalised, deduplicated start urls read in chunks"""
+import hashlib
+import logging
+import sqlite3
+import sys
+import tempfile
+from functools import partial
+from pathlib import Path
+from typing import Callable, Iterable, Iterator, Optional, Union
+from urllib.parse import urlsplit, urlunsplit
+
+import pandas as pd
+import pyarrow.parquet as pq
+
+from mondu_website_scrapper.gsheet_api.gsheet_settings import (
+    READ_PAGE_SIZE,
+    READ_PAGES_PER_CALL,
+    SNAPSHOT_FOLDER,
+    SPREADSHEET_NAME,
+)
+from mondu_website_scrapper.gsheet_api.sheet_reader import SheetReader
+from mondu_website_scrapper.gsheet_api.utils import get_default_gsheet_client
+
+
+def normalize_url(value) -> Optional[str]:
+    """
+    normalise a start url: strip blanks, add https:// to urls without a scheme and
+    lowercase the scheme and host
+
+    Returns: the url, None for empty values and values without a host
+    """
+    if not isinstance(value, str) or not value.strip():
+        return None
+    url = value.strip()
+    if "://" not in url:
+        url = f"https://{url}"
+    parts = urlsplit(url)
+    try:
+        parts.port  # pylint: disable=pointless-statement
+    except ValueError:
+        return None
+    if not parts.hostname or parts.scheme.lower() not in ("http", "https"):
+        return None
+    return urlunsplit(
+        (parts.scheme.lower(), parts.netloc.lower(), parts.path, parts.query, "")
+    )
+
+
+class SeenUrls:
+    """
+    a set of urls in a sqlite file, so memory stays flat for any number of urls.
+    the urls are kept as 16 byte hashes, in a temporary file removed on close
+    unless a file path is given
+    """
+
+    def __init__(self, file_path: Optional[Union[Path, str]] = None):
+        self.temporary = file_path is None
+        if file_path is None:
+            with tempfile.NamedTemporaryFile(suffix=".sqlite", delete=False) as file:
+                file_path = file.name
+        self.file_path = Path(file_path)
+        self.connection = sqlite3.connect(self.file_path, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=OFF")
+        self.connection.execute("PRAGMA synchronous=OFF")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS seen (url_hash BLOB PRIMARY KEY) WITHOUT ROWID"
+        )
+        # one transaction for all urls, its pages spill to the file once the
+        # cache is full
+        self.connection.execute("BEGIN")
+
+    def add(self, url: str) -> bool:
+        """
+        add a url
+
+        Returns: True if the url was not seen before
+        """
+        url_hash = hashlib.blake2b(url.encode("utf-8"), digest_size=16).digest()
+        return (
+            self.connection.execute(
+                "INSERT OR IGNORE INTO seen VALUES (?)", (url_hash,)
+            ).rowcount
+            == 1
+        )
+
+    def close(self) -> None:
+        """
+        close the file, and remove it if temporary
+        """
+        self.connection.commit()
+        self.connection.close()
+        if self.temporary:
+            self.file_path.unlink(missing_ok=True)
+
+    def __enter__(self) -> "SeenUrls":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+def sheet_urls(
+    column: str,
+    spreadsheet_name: Optional[str] = None,
+    worksheet_name: str = "Marketing-Input-Data",
+    gsheet_client=None,
+) -> Iterator:
+    """
+    read the url column of the lead gsheet page by page
+
+    Yields: the values of the column
+    """
+    reader = SheetReader(
+        gsheet_client or get_default_gsheet_client(),
+        snapshot_folder=SNAPSHOT_FOLDER,
+        page_size=READ_PAGE_SIZE,
+        pages_per_call=READ_PAGES_PER_CALL,
+    )
+    for page in reader.iter_read(
+        spreadsheet_name or SPREADSHEET_NAME, worksheet_name, [column]
+    ):
+        yield from page[column]
+
+
+def file_urls(path: Union[Path, str], column: str, chunk_rows: int = 10000) -> Iterator:
+    """
+    read the url column of a csv or parquet file in chunks of chunk_rows rows, the
+    lines of any other file, or of stdin for "-"
+
+    Yields: the values of the column, or the lines
+    """
+    if str(path) == "-":
+        yield from sys.stdin
+        return
+    path = Path(path)
+    if path.suffix == ".csv":
+        with pd.read_csv(
+            path, usecols=[column], dtype=str, chunksize=chunk_rows
+        ) as chunks:
+            for chunk in chunks:
+                yield from chunk[column]
+    elif path.suffix == ".parquet":
+        for batch in pq.ParquetFile(path).iter_batches(
+            batch_size=chunk_rows, columns=[column]
+        ):
+            yield from batch.column(0).to_pylist()
+    else:
+        with open(path, "r", encoding="utf-8") as file:
+            yield from file
+
+
+def lead_url_sources(
+    settings,
+    use_gsheet: bool,
+    external_urls: Optional[list[str]] = None,
+    input_file: Optional[Union[Path, str]] = None,
+) -> list[Callable[[], Iterable]]:
+    """
+    the sources of the start urls of a crawl, the urls in the INPUT_URL_COLUMN_NAME
+    column of a file or the gsheet
+
+    Returns: the external urls if given, otherwise the urls of the input file, the
+    gsheet or START_URLS
+    """
+    column = settings["INPUT_URL_COLUMN_NAME"]
+    if external_urls is not None:
+        return [lambda: external_urls]
+    if input_file is not None:
+        return [
+            partial(
+                file_urls, input_file, column, settings.getint("START_URL_CHUNK_ROWS")
+            )
+        ]
+    if use_gsheet:
+        return [partial(sheet_urls, column)]
+    return [lambda: settings["START_URLS"]]
+
+
+class StartUrlFeed:
+    """
+    the start urls of a crawl, read lazily from sources, callables returning an
+    iterable of urls, one after another. the urls are normalised and only yielded
+    the first time they are seen, urls yielded by skip are never yielded.
+    memory stays flat as the urls seen are kept in a SeenUrls file.
+    every iteration reads the sources again.
+    """
+
+    def __init__(
+        self,
+        sources: list[Callable[[], Iterable]],
+        skip: Optional[Callable[[], Iterable[str]]] = None,
+    ):
+        self.sources = sources
+        self.skip = skip
+        self.yielded = 0
+        self.duplicates = 0
+        self.invalid = 0
+
+    def __iter__(self) -> Iterator[str]:
+        self.yielded = self.duplicates = self.invalid = 0
+        with SeenUrls() as seen:
+            for url in self.skip() if self.skip is not None else []:
+                seen.add(url)
+            for source in self.sources:
+                for value in source():
+                    url = normalize_url(value)
+                    if url is None:
+                        self.invalid += 1
+                    elif not seen.add(url):
+                        self.duplicates += 1
+                    else:
+                        self.yielded += 1
+                        yield url
+        logging.info(
+            "fed %s start urls, skipped %s duplicated and %s invalid ones",
+            self.yielded,
+            self.duplicates,
+            self.invalid,
+        )
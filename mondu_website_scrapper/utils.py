@@ -2,9 +2,12 @@
 import os
 import re
 import string
+from functools import lru_cache
 from pathlib import Path
 from typing import Union
 
+import pandas as pd
+
 
 def normalize_words(words: list[str]) -> list[str]:
     """
@@ -22,6 +25,18 @@ def normalize_words(words: list[str]) -> list[str]:
     return [word.lower() for word in remove_pun]
 
 
+@lru_cache(maxsize=None)
+def _price_re(allow_currency: tuple[str, ...], allow_length: int) -> re.Pattern:
+    """
+    compile the price pattern of normalize_price once per currencies and length
+
+    Returns: a compiled pattern
+    """
+    target_currency = "|".join(re.escape(currency) for currency in allow_currency)
+    digits = rf"\d{{1,{allow_length}}}"
+    return re.compile(rf"{digits}[\,\.]{digits}(?=.*(?:{target_currency}))")
+
+
 def normalize_price(
     data: str, allow_currency: list = None, allow_length: int = 10
 ) -> list[float]:
@@ -33,16 +48,7 @@ def normalize_price(
     """
     if allow_currency is None:
         allow_currency = ["€", "$"]
-    target_currency = "|".join(allow_currency)
-    search_pattern = (
-        r"\d{1,%d}[\,\.]\d{1,%d}}(?=.*[%s])"  # pylint: disable=consider-using-f-string
-        % (
-            allow_length,
-            allow_length,
-            target_currency,
-        )
-    )
-    price_lst = re.findall(search_pattern, data)
+    price_lst = _price_re(tuple(allow_currency), allow_length).findall(data)
     return [float(p.strip().replace(",", ".")) for p in price_lst]
 
 
@@ -100,3 +106,20 @@ def normalize_phone_format(phone_string: str, country_code: list[str]) -> str:
             )
         return phone_string.replace(" ", "")
     return phone_string
+
+
+def normalize_phone_series(phones: pd.Series, country_code: list[str]) -> pd.Series:
+    """normalize a series of phone number strings the same way as
+    normalize_phone_format, with vectorised string operations.
+    missing values stay missing.
+
+    Returns: a series of normalized phone strings
+    """
+    code_pattern = "^(%s)" % "|".join(re.escape(code) for code in country_code)
+    return (
+        phones.astype("string")
+        .str.replace(r"\(|\)|-|\/", "", regex=True)
+        .str.replace("+", "00", regex=False)
+        .str.replace(code_pattern, r"00\1", regex=True)
+        .str.replace(" ", "", regex=False)
+    )
@@ -0,0 +1,121 @@
+""" Run wappalyzer fingerprinting on already downloaded responses"""
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Optional
+
+import scrapy
+from twisted.internet import defer
+from twisted.python.failure import Failure
+
+from mondu_website_scrapper.fingerprint_store import WappalyzerFingerprintStore
+from mondu_website_scrapper.response_text import get_response_text
+
+EXECUTORS = {"thread": ThreadPoolExecutor, "process": ProcessPoolExecutor}
+
+# the fingerprint store of the current process, set by set_fingerprint_store
+fingerprint_store = WappalyzerFingerprintStore()
+
+
+def set_fingerprint_store(store: WappalyzerFingerprintStore) -> None:
+    """
+    use the given fingerprint store for analysis in the current process,
+    also used as initializer of the worker processes
+    """
+    global fingerprint_store  # pylint: disable=global-statement
+    fingerprint_store = store
+
+
+def response_headers_to_dict(headers: scrapy.http.Headers) -> dict[str, str]:
+    """
+    convert scrapy response headers into the plain dict wappalyzer expects,
+    header names are lowered since wappalyzer looks them up in lower case
+
+    Returns: a dict of header name and header value
+    """
+    return {name.lower(): value for name, value in headers.to_unicode_dict().items()}
+
+
+def analyze_webpage(
+    url: str, html: str, headers: dict[str, str]
+) -> dict[str, dict[str, Any]]:
+    """
+    build a wappalyzer WebPage from downloaded content and analyze it.
+    this is a module level function so that it can be shipped to a process pool.
+
+    Returns: dict of detected technologies and their categories
+    """
+    from Wappalyzer import WebPage  # pylint: disable=import-outside-toplevel
+
+    webpage = WebPage(url, html=html, headers=headers)
+    return fingerprint_store.load().analyze_with_categories(webpage)
+
+
+def _deferred_from_future(future: Future) -> defer.Deferred:
+    """
+    wrap a concurrent.futures future into a twisted deferred,
+    the result is handed back to the reactor thread
+
+    Returns: a deferred fired with the result of the future
+    """
+    from twisted.internet import reactor  # pylint: disable=import-outside-toplevel
+
+    deferred = defer.Deferred()
+
+    def _on_done(done_future: Future) -> None:
+        error = done_future.exception()
+        if error is not None:
+            reactor.callFromThread(deferred.errback, Failure(error))
+        else:
+            reactor.callFromThread(deferred.callback, done_future.result())
+
+    future.add_done_callback(_on_done)
+    return deferred
+
+
+class WappalyzerAnalyzer:
+    """
+    analyze scrapy responses with wappalyzer without downloading them again.
+    the fingerprint matching runs in a thread or process pool so that it never
+    blocks the twisted reactor. the fingerprint database is loaded when the first
+    page is analysed.
+    """
+
+    def __init__(
+        self,
+        executor_type: str = "thread",
+        max_workers: Optional[int] = None,
+        store: Optional[WappalyzerFingerprintStore] = None,
+    ):
+        if executor_type not in EXECUTORS:
+            raise ValueError(
+                f"executor type should be one of {list(EXECUTORS)}, got {executor_type}"
+            )
+        if store is not None:
+            set_fingerprint_store(store)
+        self.executor: Executor = EXECUTORS[executor_type](
+            max_workers=max_workers,
+            initializer=set_fingerprint_store,
+            initargs=(fingerprint_store,),
+        )
+
+    def analyze_response(self, response: scrapy.http.Response) -> defer.Deferred:
+        """
+        submit the already downloaded response to the pool
+
+        Returns: a deferred fired with dict of detected technologies and their categories
+        """
+        if isinstance(self.executor, ProcessPoolExecutor):
+            # load in the parent before the workers are forked, so they share it
+            fingerprint_store.load()
+        future = self.executor.submit(
+            analyze_webpage,
+            response.url,
+            get_response_text(response).text,
+            response_headers_to_dict(response.headers),
+        )
+        return _deferred_from_future(future)
+
+    def close(self) -> None:
+        """
+        shut down the pool without waiting for pending analysis
+        """
+        self.executor.shutdown(wait=False, cancel_futures=True)
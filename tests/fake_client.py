@@ -0,0 +1,260 @@
+""" In-memory stand-in of the gspread client, to run the sheet layer without google"""
+import json
+import random
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Optional
+
+from gspread.exceptions import APIError, SpreadsheetNotFound, WorksheetNotFound
+from gspread.utils import a1_range_to_grid_range
+from requests import Response
+
+from mondu_website_scrapper.gsheet_api.sheet_exporter import MAX_SPREADSHEET_CELLS
+
+
+def api_error(code: int, message: str) -> APIError:
+    """
+    Returns: an APIError like the sheets api raises it
+    """
+    response = Response()
+    response.status_code = code
+    response._content = json.dumps(  # pylint: disable=protected-access
+        {"error": {"code": code, "message": message, "status": ""}}
+    ).encode("utf-8")
+    return APIError(response)
+
+
+class FakeWorksheet:
+    """
+    a worksheet holding its cells as a list of rows of strings, the first row is
+    the header. its grid has row_count rows and col_count columns, at least as
+    many as the rows given
+    """
+
+    def __init__(
+        self,
+        spreadsheet: "FakeSpreadsheet",
+        title: str,
+        rows: list[list],
+        row_count: int = 0,
+        col_count: int = 0,
+    ):
+        self.spreadsheet = spreadsheet
+        self.title = title
+        self.id = len(spreadsheet.sheets)  # pylint: disable=invalid-name
+        self.rows = [list(row) for row in rows]
+        self.row_count = max(row_count, len(self.rows))
+        self.col_count = max([col_count] + [len(row) for row in self.rows])
+
+    def write(self, grid: dict, values: list[list]) -> None:
+        """
+        write values into the cells of a grid range, starting at its top left cell
+
+        Raises: APIError if the values do not fit the grid of the worksheet
+        """
+        start_row = grid.get("startRowIndex", 0)
+        start_col = grid.get("startColumnIndex", 0)
+        if (
+            start_row + len(values) > self.row_count
+            or start_col + max((len(row) for row in values), default=0) > self.col_count
+        ):
+            raise api_error(400, f"Range exceeds grid limits of {self.title}")
+        if len(self.rows) < start_row + len(values):
+            self.rows.extend(
+                [] for _ in range(start_row + len(values) - len(self.rows))
+            )
+        for offset, row in enumerate(values):
+            cells = self.rows[start_row + offset]
+            if len(cells) < start_col + len(row):
+                cells.extend([""] * (start_col + len(row) - len(cells)))
+            cells[start_col : start_col + len(row)] = row
+
+    def row_values(self, row: int) -> list:
+        """
+        Returns: the values of a row, starting at 1, without trailing blank cells
+        """
+        self.spreadsheet.client.call("row_values")
+        return self._trim(self.rows[row - 1]) if row <= len(self.rows) else []
+
+    def batch_get(self, ranges: list[str], **kwargs) -> list[list[list]]:
+        """
+        Returns: the values of every range in the A1 notation, without trailing
+        blank cells and rows like the sheets api
+        """
+        self.spreadsheet.client.call("batch_get")
+        pages = []
+        for range_name in ranges:
+            grid = a1_range_to_grid_range(range_name)
+            page = [
+                self._trim(row[grid["startColumnIndex"] : grid["endColumnIndex"]])
+                for row in self.rows[grid["startRowIndex"] : grid["endRowIndex"]]
+            ]
+            while page and not page[-1]:
+                page.pop()
+            pages.append(page)
+        return pages
+
+    @staticmethod
+    def _trim(row: list) -> list:
+        row = list(row)
+        while row and row[-1] in ("", None):
+            row.pop()
+        return row
+
+
+class FakeSpreadsheet:
+    """
+    a spreadsheet of fake worksheets, modified whenever a worksheet is added
+    """
+
+    def __init__(self, client: "FakeGsheetClient", title: str):
+        self.client = client
+        self.title = title
+        self.id = f"fake-{title}"  # pylint: disable=invalid-name
+        self.sheets: dict[str, FakeWorksheet] = {}
+        self.modified_time = datetime.now(timezone.utc).isoformat()
+
+    def add_worksheet(
+        self, title: str, rows: int, cols: int, index: Optional[int] = None
+    ) -> FakeWorksheet:  # pylint: disable=unused-argument
+        """
+        Raises: APIError if the title is taken or the spreadsheet would have more
+        than MAX_SPREADSHEET_CELLS cells
+        Returns: a new empty worksheet of rows times cols cells
+        """
+        self.client.call("add_worksheet")
+        if title in self.sheets:
+            raise api_error(400, f'A sheet with the name "{title}" already exists')
+        cells = sum(sheet.row_count * sheet.col_count for sheet in self.sheets.values())
+        if cells + rows * cols > MAX_SPREADSHEET_CELLS:
+            raise api_error(400, "This action would increase the number of cells")
+        self.sheets[title] = FakeWorksheet(self, title, [], rows, cols)
+        self.touch()
+        return self.sheets[title]
+
+    def values_batch_update(self, body: dict) -> dict:
+        """
+        write the values of every range of body["data"], ranges in the A1 notation
+        with the worksheet title
+
+        Raises: APIError if a worksheet does not exist or a range exceeds its grid
+        Returns: the number of rows updated
+        """
+        self.client.call("values_batch_update")
+        updated_rows = 0
+        with self.client.lock:
+            for data in body["data"]:
+                title, _, cells = data["range"].rpartition("!")
+                if title.startswith("'"):
+                    title = title[1:-1].replace("''", "'")
+                if title not in self.sheets:
+                    raise api_error(400, f"Unable to parse range: {data['range']}")
+                self.sheets[title].write(a1_range_to_grid_range(cells), data["values"])
+                updated_rows += len(data["values"])
+            self.touch()
+        return {"totalUpdatedRows": updated_rows}
+
+    def add_rows(self, title: str, rows: list[list]) -> FakeWorksheet:
+        """
+        add or replace a worksheet with its rows, without counting an api call
+
+        Returns: the worksheet
+        """
+        self.sheets[title] = FakeWorksheet(self, title, rows)
+        self.touch()
+        return self.sheets[title]
+
+    def touch(self) -> None:
+        """
+        mark the spreadsheet as modified
+        """
+        self.modified_time = datetime.now(timezone.utc).isoformat()
+
+    def get_lastUpdateTime(self) -> str:  # pylint: disable=invalid-name
+        """
+        Returns: the time the spreadsheet was last modified
+        """
+        self.client.call("get_lastUpdateTime")
+        return self.modified_time
+
+    def worksheets(self) -> list[FakeWorksheet]:
+        """
+        Returns: all worksheets
+        """
+        self.client.call("worksheets")
+        return list(self.sheets.values())
+
+    def worksheet(self, title: str) -> FakeWorksheet:
+        """
+        Raises: WorksheetNotFound if there is no worksheet with the title
+        Returns: the worksheet with the title
+        """
+        self.client.call("worksheet")
+        if title not in self.sheets:
+            raise WorksheetNotFound(title)
+        return self.sheets[title]
+
+
+class FakeGsheetClient:
+    """
+    a gspread client keeping spreadsheets in memory. every api call is counted in
+    calls and takes latency seconds, like a round trip to google. calls of the
+    methods in error_rates fail at that rate with a 429 rate limit error, the most
+    calls running at the same time are kept in max_parallel_calls
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        error_rates: Optional[dict[str, float]] = None,
+        seed: int = 0,
+    ):
+        self.latency = latency
+        self.error_rates = error_rates or {}
+        self.random = random.Random(seed)
+        self.spreadsheets: dict[str, FakeSpreadsheet] = {}
+        self.calls: Counter = Counter()
+        self.parallel_calls = 0
+        self.max_parallel_calls = 0
+        self.lock = threading.Lock()
+
+    def call(self, method: str) -> None:
+        """
+        count an api call and wait for its latency
+
+        Raises: APIError for the calls failing by error_rates
+        """
+        with self.lock:
+            self.calls[method] += 1
+            self.parallel_calls += 1
+            self.max_parallel_calls = max(self.max_parallel_calls, self.parallel_calls)
+            failed = self.random.random() < self.error_rates.get(method, 0.0)
+        try:
+            if self.latency:
+                time.sleep(self.latency)
+            if failed:
+                raise api_error(429, "Quota exceeded for quota metric 'Write requests'")
+        finally:
+            with self.lock:
+                self.parallel_calls -= 1
+
+    def create(self, title: str) -> FakeSpreadsheet:
+        """
+        Returns: a new empty spreadsheet
+        """
+        self.spreadsheets[title] = FakeSpreadsheet(self, title)
+        return self.spreadsheets[title]
+
+    def open(
+        self, title: str, folder_id: Optional[str] = None
+    ) -> FakeSpreadsheet:  # pylint: disable=unused-argument
+        """
+        Raises: SpreadsheetNotFound if there is no spreadsheet with the title
+        Returns: the spreadsheet with the title
+        """
+        self.call("open")
+        if title not in self.spreadsheets:
+            raise SpreadsheetNotFound(title)
+        return self.spreadsheets[title]
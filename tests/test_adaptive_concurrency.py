@@ -0,0 +1,89 @@
+import logging
+from types import SimpleNamespace
+
+import pytest
+from scrapy import Request, signals
+from scrapy.http import Response
+from scrapy.settings import Settings
+from scrapy.signalmanager import SignalManager
+
+from mondu_website_scrapper.middlewares import MonduWebsiteScrapperDownloaderMiddleware
+
+SETTINGS = {
+    "ADAPTIVE_CONCURRENCY_ENABLED": True,
+    "ADAPTIVE_CONCURRENCY_START": 2,
+    "ADAPTIVE_CONCURRENCY_MIN": 1,
+    "CONCURRENT_REQUESTS_PER_DOMAIN": 8,
+    "ADAPTIVE_ERROR_CODES": [503],
+}
+
+
+class Downloader:
+    """
+    the slots of scrapy's downloader: created with CONCURRENT_REQUESTS_PER_DOMAIN
+    before request_reached_downloader is sent, dropped when idle
+    """
+
+    def __init__(self, crawler):
+        self.crawler = crawler
+        self.slots = {}
+
+    def enqueue(self, request: Request):
+        key = request.meta.setdefault("download_slot", request.url.split("/")[2])
+        self.slots.setdefault(key, SimpleNamespace(concurrency=8))
+        self.crawler.signals.send_catch_log(
+            signal=signals.request_reached_downloader,
+            request=request,
+            spider=self.crawler.spider,
+        )
+        return self.slots[key]
+
+
+@pytest.fixture
+def crawler():
+    crawler = SimpleNamespace(
+        settings=Settings(SETTINGS),
+        signals=SignalManager(),
+        spider=SimpleNamespace(logger=logging.getLogger("spider")),
+    )
+    crawler.engine = SimpleNamespace(downloader=Downloader(crawler))
+    return crawler
+
+
+@pytest.fixture
+def middleware(crawler):
+    return MonduWebsiteScrapperDownloaderMiddleware.from_crawler(crawler)
+
+
+def test_new_domain_starts_at_start_concurrency(crawler, middleware):
+    slot = crawler.engine.downloader.enqueue(Request("https://shop.test/"))
+
+    assert slot.concurrency == 2
+
+
+def test_recreated_slot_keeps_concurrency_of_domain(crawler, middleware):
+    downloader = crawler.engine.downloader
+    request = Request("https://shop.test/", meta={"download_latency": 0.1})
+    downloader.enqueue(request)
+    for _ in range(4):
+        middleware.process_response(
+            request, Response(request.url, status=503), crawler.spider
+        )
+    assert downloader.slots["shop.test"].concurrency == 1
+
+    # the downloader drops idle slots
+    downloader.slots.clear()
+    slot = downloader.enqueue(Request("https://shop.test/imprint"))
+
+    assert slot.concurrency == 1
+
+
+def test_concurrency_increased_after_fast_responses(crawler, middleware):
+    downloader = crawler.engine.downloader
+    request = Request("https://shop.test/", meta={"download_latency": 0.1})
+    downloader.enqueue(request)
+
+    for _ in range(2):
+        middleware.process_response(request, Response(request.url), crawler.spider)
+
+    assert downloader.slots["shop.test"].concurrency == 3
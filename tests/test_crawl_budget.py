@@ -0,0 +1,142 @@
+from mondu_website_scrapper.crawl_budget import CrawlBudget
+
+PRODUCTS = [f"https://shop.test/product/{index}" for index in range(10)]
+
+
+def budget(**kwargs) -> CrawlBudget:
+    kwargs = {"max_pages": {"product": 4, "contact": 1}, **kwargs}
+    return CrawlBudget(**kwargs)
+
+
+def test_page_cap():
+    crawl_budget = budget(concurrent_pages=8)
+    crawl_budget.add_links("https://shop.test", "product", PRODUCTS)
+
+    urls, results = crawl_budget.next_pages("https://shop.test", "product")
+
+    assert urls == PRODUCTS[:4]
+    assert results == []
+    for url in urls:
+        crawl_budget.page_done(url, "product", None)
+    assert crawl_budget.next_pages("https://shop.test", "product") == ([], [])
+    assert crawl_budget.company_done("https://shop.test")
+
+
+def test_concurrent_pages():
+    crawl_budget = budget(concurrent_pages=2)
+    crawl_budget.add_links("https://shop.test", "product", PRODUCTS)
+
+    urls, _ = crawl_budget.next_pages("https://shop.test", "product")
+    assert urls == PRODUCTS[:2]
+    assert crawl_budget.next_pages("https://shop.test", "product") == ([], [])
+
+    assert crawl_budget.page_done(PRODUCTS[0], "product", None) == ["https://shop.test"]
+    urls, _ = crawl_budget.next_pages("https://shop.test", "product")
+    assert urls == [PRODUCTS[2]]
+
+
+def test_duplicated_links_queued_once():
+    crawl_budget = budget()
+    crawl_budget.add_links(
+        "https://shop.test",
+        "contact",
+        ["https://shop.test/a#top", "https://shop.test/a"],
+    )
+
+    urls, _ = crawl_budget.next_pages("https://shop.test", "contact")
+
+    assert urls == ["https://shop.test/a#top"]
+    assert crawl_budget.next_pages("https://shop.test", "contact") == ([], [])
+
+
+def test_page_shared_while_downloading():
+    crawl_budget = budget()
+    for company_url in ("https://a.test", "https://b.test"):
+        crawl_budget.add_links(company_url, "contact", ["https://host.test/imprint"])
+
+    assert crawl_budget.next_pages("https://a.test", "contact")[0] == [
+        "https://host.test/imprint"
+    ]
+    # requested by a.test already, b.test waits for it
+    assert crawl_budget.next_pages("https://b.test", "contact") == ([], [])
+    assert not crawl_budget.company_done("https://b.test")
+
+    owners = crawl_budget.page_done(
+        "https://host.test/imprint", "contact", {"phone": ["123"]}
+    )
+
+    assert owners == ["https://a.test", "https://b.test"]
+    assert crawl_budget.company_done("https://a.test")
+    assert crawl_budget.company_done("https://b.test")
+
+
+def test_page_shared_after_done():
+    crawl_budget = budget()
+    crawl_budget.add_links("https://a.test", "contact", ["https://host.test/imprint"])
+    crawl_budget.next_pages("https://a.test", "contact")
+    crawl_budget.page_done("https://host.test/imprint", "contact", {"phone": ["123"]})
+
+    crawl_budget.add_links("https://b.test", "contact", ["https://host.test/imprint"])
+
+    assert crawl_budget.next_pages("https://b.test", "contact") == (
+        [],
+        [{"phone": ["123"]}],
+    )
+    assert crawl_budget.company_done("https://b.test")
+
+
+def test_failed_page_frees_its_slot():
+    crawl_budget = budget(concurrent_pages=1)
+    crawl_budget.add_links("https://shop.test", "product", PRODUCTS[:2])
+    crawl_budget.next_pages("https://shop.test", "product")
+
+    # the errback stores no result
+    crawl_budget.page_done(PRODUCTS[0], "product", None)
+
+    assert crawl_budget.next_pages("https://shop.test", "product") == (
+        [PRODUCTS[1]],
+        [],
+    )
+    assert not crawl_budget.company_done("https://shop.test")
+    crawl_budget.page_done(PRODUCTS[1], "product", None)
+    assert crawl_budget.company_done("https://shop.test")
+
+
+def test_company_without_links_done():
+    assert budget().company_done("https://shop.test")
+
+
+def test_price_convergence():
+    crawl_budget = budget(
+        max_pages={"product": 10}, price_min_pages=2, price_tolerance=0.01
+    )
+    crawl_budget.add_links("https://shop.test", "product", PRODUCTS)
+    urls, _ = crawl_budget.next_pages("https://shop.test", "product")
+    for url in urls[:3]:
+        crawl_budget.page_done(url, "product", {"products_avg_price": 10.0})
+        crawl_budget.add_price("https://shop.test", 10.0)
+
+    assert crawl_budget.prices["https://shop.test"].converged
+    assert crawl_budget.next_pages("https://shop.test", "product") == ([], [])
+
+
+def test_release_keeps_results_in_use():
+    crawl_budget = budget()
+    for company_url in ("https://a.test", "https://b.test"):
+        crawl_budget.add_links(company_url, "contact", ["https://host.test/imprint"])
+        crawl_budget.next_pages(company_url, "contact")
+    crawl_budget.page_done("https://host.test/imprint", "contact", None)
+    crawl_budget.add_links("https://a.test", "product", PRODUCTS[:1])
+    crawl_budget.next_pages("https://a.test", "product")
+    crawl_budget.page_done(PRODUCTS[0], "product", {"products_avg_price": 1.0})
+
+    crawl_budget.release("https://a.test")
+
+    assert ("https://a.test", "product") not in crawl_budget.companies
+    assert len(crawl_budget.page_results) == 1
+
+    crawl_budget.release("https://b.test")
+
+    assert crawl_budget.companies == {}
+    assert crawl_budget.page_results == {}
+    assert crawl_budget.page_users == {}
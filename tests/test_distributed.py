@@ -0,0 +1,119 @@
+import os
+import time
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+from mondu_website_scrapper.distributed import (
+    FileShardQueue,
+    enqueue,
+    merge_shards,
+    shard_folder,
+    shard_of,
+    shard_urls,
+)
+from mondu_website_scrapper.item_storage import ITEM_SCHEMAS
+
+URLS = [f"https://shop-{index}.test" for index in range(20)]
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return FileShardQueue(tmp_path / "queue", lease_secs=60)
+
+
+def expire(queue: FileShardQueue, shard: int) -> None:
+    claimed_file = queue.states["claimed"] / f"shard-{shard:05d}.json"
+    old = time.time() - queue.lease_secs - 1
+    os.utime(claimed_file, (old, old))
+
+
+def test_shard_of_by_host():
+    assert shard_of("https://www.shop.test/a", 8) == shard_of("http://shop.test/b", 8)
+
+
+def test_shard_urls_streams_and_deduplicates():
+    def feed():
+        yield from URLS
+        yield from URLS[:5]
+
+    sharded = list(shard_urls(feed(), 4))
+
+    assert [shard for shard, _ in sharded] == sorted({shard for shard, _ in sharded})
+    assert sorted(url for _, urls in sharded for url in urls) == sorted(URLS)
+    for shard, urls in sharded:
+        assert all(shard_of(url, 4) == shard for url in urls)
+        # in the order of the feed
+        assert urls == [url for url in URLS if url in urls]
+
+
+def test_enqueue_and_claim(queue, tmp_path):
+    queued = enqueue(queue, iter(URLS), 4, tmp_path / "shards")
+
+    claimed = []
+    while (shard := queue.claim("worker")) is not None:
+        claimed.append(shard)
+        queue.done(shard[0])
+
+    assert len(claimed) == queued
+    assert sorted(url for _, urls in claimed for url in urls) == sorted(URLS)
+    assert queue.remaining() == 0
+
+
+def test_expired_claim_queued_again(queue):
+    queue.put(1, URLS[:2])
+    assert queue.claim("dead worker") == (1, URLS[:2])
+    assert queue.claim("worker") is None
+
+    expire(queue, 1)
+
+    assert queue.claim("worker") == (1, URLS[:2])
+    assert queue.claim("other worker") is None
+    queue.done(1)
+    # the dead worker coming back does not fail
+    queue.done(1)
+    assert queue.remaining() == 0
+
+
+def test_renewed_claim_kept(queue):
+    queue.put(1, URLS[:2])
+    queue.claim("worker")
+    expire(queue, 1)
+
+    queue.renew(1)
+
+    assert queue.claim("other worker") is None
+    assert queue.remaining() == 1
+
+
+def test_release(queue):
+    queue.put(1, URLS[:2])
+    queue.claim("worker")
+
+    queue.release(1)
+
+    assert queue.claim("other worker") == (1, URLS[:2])
+
+
+def test_merge_shards(tmp_path):
+    output_folder = tmp_path / "shards"
+    schema = ITEM_SCHEMAS["generalinformationitem"]
+    for shard, urls in ((0, URLS[:3]), (5, URLS[3:5])):
+        folder = shard_folder(output_folder, shard)
+        folder.mkdir(parents=True)
+        pq.write_table(
+            pa.Table.from_pylist(
+                [{"company_url": url, "status": 200} for url in urls], schema
+            ),
+            folder / "generalinformationitem.parquet",
+        )
+
+    merged = merge_shards(
+        output_folder, tmp_path / "results", tmp_path / "results" / "aggregates"
+    )
+
+    assert merged["generalinformationitem"] == 5
+    assert merged["priceitem"] == 0
+    table = pq.read_table(tmp_path / "results" / "generalinformationitem.parquet")
+    assert sorted(table.column("company_url").to_pylist()) == sorted(URLS[:5])
@@ -0,0 +1,162 @@
+import csv
+
+import pytest
+from gspread.exceptions import APIError
+from requests.exceptions import Timeout
+
+from mondu_website_scrapper.gsheet_api import sheet_exporter
+from mondu_website_scrapper.gsheet_api.sheet_exporter import SheetExporter
+from tests.fake_client import FakeGsheetClient, api_error
+
+ROWS = [["company_url", "name", "price"]] + [
+    [f"https://shop-{index}.test", f"shop {index}", str(index)] for index in range(49)
+]
+
+
+@pytest.fixture
+def csv_file(tmp_path):
+    csv_file = tmp_path / "report.csv"
+    with open(csv_file, "w", encoding="utf-8", newline="") as file:
+        csv.writer(file).writerows(ROWS)
+    return csv_file
+
+
+@pytest.fixture
+def client():
+    client = FakeGsheetClient()
+    client.create("reports")
+    return client
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(sheet_exporter.time, "sleep", sleeps.append)
+    return sleeps
+
+
+def exporter(client, tmp_path, **kwargs) -> SheetExporter:
+    kwargs = {"chunk_rows": 10, "max_parallel": 4, "backoff_secs": 0.1, **kwargs}
+    return SheetExporter(client, tmp_path / "progress.json", **kwargs)
+
+
+def test_export_in_parallel_chunks(client, csv_file, tmp_path):
+    client.latency = 0.01
+    title = exporter(client, tmp_path).export(csv_file, "reports", "report")
+
+    worksheet = client.spreadsheets["reports"].sheets[title]
+    assert worksheet.rows == ROWS
+    assert (worksheet.row_count, worksheet.col_count) == (50, 3)
+    assert client.calls["values_batch_update"] == 5
+    assert 1 < client.max_parallel_calls <= 4
+    assert not (tmp_path / "progress.json").exists()
+
+
+def test_export_too_many_cells(client, csv_file, tmp_path, monkeypatch):
+    monkeypatch.setattr(sheet_exporter, "MAX_SPREADSHEET_CELLS", 100)
+
+    with pytest.raises(ValueError):
+        exporter(client, tmp_path).export(csv_file, "reports", "report")
+    assert client.calls["add_worksheet"] == 0
+
+
+def test_resume_after_failed_chunk(client, csv_file, tmp_path, monkeypatch):
+    spreadsheet = client.spreadsheets["reports"]
+    values_batch_update = spreadsheet.values_batch_update
+
+    def fail_third_chunk(body):
+        if body["data"][0]["range"].endswith("!A21:C30"):
+            raise api_error(400, "Invalid value")
+        return values_batch_update(body)
+
+    monkeypatch.setattr(spreadsheet, "values_batch_update", fail_third_chunk)
+    with pytest.raises(APIError):
+        exporter(client, tmp_path).export(csv_file, "reports", "report")
+    assert (tmp_path / "progress.json").exists()
+    assert not any(spreadsheet.sheets["report"].rows[20:30])
+
+    monkeypatch.setattr(spreadsheet, "values_batch_update", values_batch_update)
+    calls = client.calls.copy()
+    title = exporter(client, tmp_path).export(csv_file, "reports", "other")
+
+    assert title == "report"
+    assert "other" not in spreadsheet.sheets
+    assert spreadsheet.sheets["report"].rows == ROWS
+    # only the chunks not written before are written again
+    assert client.calls["values_batch_update"] - calls["values_batch_update"] < 5
+    assert not (tmp_path / "progress.json").exists()
+
+
+def test_new_export_into_taken_title_fails(client, csv_file, tmp_path):
+    client.spreadsheets["reports"].add_rows("report", [["taken"]])
+
+    with pytest.raises(APIError):
+        exporter(client, tmp_path).export(csv_file, "reports", "report")
+    assert client.spreadsheets["reports"].sheets["report"].rows == [["taken"]]
+
+
+@pytest.mark.parametrize("code", [429, 500, 503])
+def test_retry_with_backoff(client, csv_file, tmp_path, sleeps, monkeypatch, code):
+    spreadsheet = client.spreadsheets["reports"]
+    values_batch_update = spreadsheet.values_batch_update
+    failures = iter([api_error(code, "try again")] * 3)
+
+    def fail_three_times(body):
+        error = next(failures, None)
+        if error is not None:
+            raise error
+        return values_batch_update(body)
+
+    monkeypatch.setattr(spreadsheet, "values_batch_update", fail_three_times)
+    exporter(client, tmp_path, max_parallel=1).export(csv_file, "reports", "report")
+
+    assert spreadsheet.sheets["report"].rows == ROWS
+    assert len(sleeps) == 3
+    # doubled every retry, with up to half of it as jitter
+    for attempt, delay in enumerate(sleeps):
+        assert 0.05 * 2**attempt <= delay <= 0.15 * 2**attempt
+
+
+def test_retries_exhausted(client, csv_file, tmp_path, sleeps):
+    client.error_rates = {"values_batch_update": 1.0}
+
+    with pytest.raises(APIError):
+        exporter(client, tmp_path, max_parallel=1, max_retries=2).export(
+            csv_file, "reports", "report"
+        )
+    assert len(sleeps) == 2
+    assert (tmp_path / "progress.json").exists()
+
+
+def test_no_retry_of_client_errors(client, csv_file, tmp_path, sleeps, monkeypatch):
+    spreadsheet = client.spreadsheets["reports"]
+
+    def invalid(body):
+        raise api_error(400, "Invalid value")
+
+    monkeypatch.setattr(spreadsheet, "values_batch_update", invalid)
+    with pytest.raises(APIError):
+        exporter(client, tmp_path).export(csv_file, "reports", "report")
+    assert sleeps == []
+
+
+def test_worksheet_added_by_timed_out_call(
+    client, csv_file, tmp_path, sleeps, monkeypatch
+):
+    spreadsheet = client.spreadsheets["reports"]
+    add_worksheet = spreadsheet.add_worksheet
+    timeouts = iter([Timeout("read timed out")])
+
+    def add_then_time_out(**kwargs):
+        worksheet = add_worksheet(**kwargs)
+        error = next(timeouts, None)
+        if error is not None:
+            raise error
+        return worksheet
+
+    monkeypatch.setattr(spreadsheet, "add_worksheet", add_then_time_out)
+    title = exporter(client, tmp_path).export(csv_file, "reports", "report")
+
+    assert client.calls["add_worksheet"] == 2
+    assert len(sleeps) == 1
+    assert spreadsheet.sheets[title].rows == ROWS
@@ -0,0 +1,77 @@
+import pytest
+
+from mondu_website_scrapper.gsheet_api.sheet_reader import SheetReader
+from tests.fake_client import FakeGsheetClient
+
+HEADER = ["company_url", "name"]
+ROWS = [[f"https://shop-{index}.test", f"shop {index}"] for index in range(5)]
+
+
+@pytest.fixture
+def client():
+    client = FakeGsheetClient()
+    spreadsheet = client.create("leads")
+    spreadsheet.add_rows("input", [HEADER] + ROWS)
+    spreadsheet.modified_time = "2024-01-01T00:00:00+00:00"
+    return client
+
+
+def test_read_pages(client, tmp_path):
+    reader = SheetReader(client, tmp_path, page_size=2, pages_per_call=2)
+
+    data = reader.read("leads", "input", ["company_url"])
+
+    assert data["company_url"].tolist() == [row[0] for row in ROWS]
+    assert client.calls["batch_get"] == 2
+
+
+def test_snapshot_reused_for_unchanged_revision(client, tmp_path):
+    reader = SheetReader(client, tmp_path, page_size=2)
+    first = reader.read("leads", "input", ["company_url"])
+    calls = client.calls.copy()
+
+    second = reader.read("leads", "input", ["company_url"])
+
+    assert second.equals(first)
+    assert client.calls["batch_get"] == calls["batch_get"]
+    assert client.calls["row_values"] == calls["row_values"]
+    assert len(list(tmp_path.glob("*.json.gz"))) == 1
+
+
+def test_snapshot_invalidated_by_new_revision(client, tmp_path):
+    reader = SheetReader(client, tmp_path, page_size=2)
+    reader.read("leads", "input", ["company_url"])
+    calls = client.calls.copy()
+
+    spreadsheet = client.spreadsheets["leads"]
+    spreadsheet.add_rows("input", [HEADER] + ROWS + [["https://new.test", "new"]])
+    spreadsheet.modified_time = "2024-01-02T00:00:00+00:00"
+    data = reader.read("leads", "input", ["company_url"])
+
+    assert data["company_url"].tolist()[-1] == "https://new.test"
+    assert client.calls["batch_get"] > calls["batch_get"]
+    # the snapshot of the old revision is replaced
+    assert len(list(tmp_path.glob("*.json.gz"))) == 1
+
+
+def test_snapshot_per_columns(client, tmp_path):
+    reader = SheetReader(client, tmp_path, page_size=2)
+    reader.read("leads", "input", ["company_url"])
+
+    data = reader.read("leads", "input", ["name"])
+
+    assert data["name"].tolist() == [row[1] for row in ROWS]
+    assert len(list(tmp_path.glob("*.json.gz"))) == 2
+
+
+def test_blank_cell_at_page_end(client, tmp_path):
+    rows = [list(row) for row in ROWS]
+    # the last row of the first page is blank in the column read
+    rows[1][0] = ""
+    client.spreadsheets["leads"].add_rows("input", [HEADER] + rows)
+    reader = SheetReader(client, tmp_path, page_size=2, pages_per_call=1)
+
+    data = reader.read("leads", "input", ["company_url"])
+
+    # the api leaves out the blank row, the rows after it are still read
+    assert data["company_url"].tolist() == [rows[0][0]] + [row[0] for row in rows[2:]]